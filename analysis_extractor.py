@@ -0,0 +1,97 @@
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+# Пункт списка в начале строки: «1.», «12)», «•», «-», «–», «*», дальше текст фактора
+FACTOR_RE = re.compile(r'(?m)^[ \t]*(?:\d{1,3}[.)]|[•\-–*])[ \t]+(?P<text>[^\n]+)')
+
+# Типы ставок: название → формы слова в тексте
+BET_TYPES = (
+    ('Победа', r'побед\w*'),
+    ('Ничья', r'ничь(?:я|и|ю|ей)'),
+    ('Тотал', r'тотал\w*'),
+    ('Фора', r'фор(?:а|ы|у|ой|е)'),
+    ('Голы', r'гол(?:ы|ов|ам|ами|ах)?'),
+    ('Очки', r'оч(?:ки|ков|ками|ках)'),
+    ('Угловые', r'углов\w*'),
+    ('Карточки', r'карточ\w*'),
+    ('Пенальти', r'пенальти'),
+    ('Автоголы', r'автогол\w*'),
+)
+
+# Все типы ставок одним выражением по тексту в нижнем регистре. Без IGNORECASE,
+# именованных групп и просмотра назад в начале движок regex быстро пропускает
+# неподходящие символы; левая граница слова проверяется уже у найденного совпадения.
+BET_RE = re.compile(r'(?:' + '|'.join(pattern for _, pattern in BET_TYPES) + r')(?!\w)')
+_BET_TYPE_RES = tuple((name, re.compile(pattern)) for name, pattern in BET_TYPES)
+
+# Длиннее — уже не фактор, а абзац анализа
+MAX_FACTOR_LENGTH = 100
+
+
+class Extracted(NamedTuple):
+    """Найденный фрагмент и его позиция (смещение в символах) в исходном тексте"""
+    text: str
+    position: int
+
+
+class AnalysisExtract(NamedTuple):
+    """Ключевые факторы и типы ставок из ответа Perplexity в порядке появления в тексте"""
+    factors: List[Extracted]
+    bets: List[Extracted]
+
+    def factor_texts(self, limit: int = 4) -> List[str]:
+        return [factor.text for factor in self.factors[:limit]]
+
+    def bet_names(self, limit: int = 3) -> List[str]:
+        return [bet.text for bet in self.bets[:limit]]
+
+
+# Форма слова → название ставки; формы повторяются, поэтому заполняется по мере встречи
+_BET_NAMES: Dict[str, str] = {}
+
+
+def _bet_name(word: str) -> str:
+    name = _BET_NAMES.get(word)
+    if name is None:
+        name = next(name for name, pattern in _BET_TYPE_RES if pattern.fullmatch(word))
+        _BET_NAMES[word] = name
+    return name
+
+
+def extract_factors(text: str, limit: Optional[int] = None) -> List[Extracted]:
+    """Пункты списков с любым номером; выделение (**, __) убирается, длинные абзацы пропускаются.
+
+    limit — сколько факторов нужно: проход останавливается, как только они найдены.
+    """
+    factors = []
+    for match in FACTOR_RE.finditer(text):
+        clean = match.group('text').replace('*', '').replace('__', '').strip()
+        if clean and len(clean) < MAX_FACTOR_LENGTH:
+            factors.append(Extracted(clean, match.start('text')))
+            if len(factors) == limit:
+                break
+    return factors
+
+
+def extract_bets(text: str, limit: Optional[int] = None) -> List[Extracted]:
+    """Типы ставок по первому упоминанию; limit — как в extract_factors"""
+    bets, seen = [], set()
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        lowered = ''.join(char.lower()[:1] for char in text)  # Сохраняем позиции (редкие буквы вроде «İ»)
+    for match in BET_RE.finditer(lowered):
+        start = match.start()
+        if start and (lowered[start - 1].isalnum() or lowered[start - 1] == '_'):
+            continue  # Часть другого слова («заголовок»)
+        name = _BET_NAMES.get(match.group()) or _bet_name(match.group())
+        if name not in seen:
+            seen.add(name)
+            bets.append(Extracted(name, start))
+            if len(bets) == limit:
+                break
+    return bets
+
+
+def extract_analysis(text: str, max_factors: Optional[int] = None, max_bets: Optional[int] = None) -> AnalysisExtract:
+    """Факторы и ставки из ответа: по одному скомпилированному проходу на каждый вид"""
+    return AnalysisExtract(extract_factors(text, max_factors), extract_bets(text, max_bets))
@@ -0,0 +1,110 @@
+import gzip
+import json
+import os
+import sys
+import time
+from typing import List
+
+from analysis_extractor import extract_analysis
+
+# Запасной корпус, если сохраненных ответов Perplexity нет
+SAMPLE_RESPONSES = (
+    "Анализ матча Реал Мадрид vs Барселона:\n"
+    "1. **Форма**: Реал выиграл 5 из последних 6 матчей, победа дома вероятна\n"
+    "2. Травмы: у Барселоны нет двух основных защитников\n"
+    "3. Личные встречи: 3 победы Реала в последних 5 играх\n"
+    "4. Мотивация: борьба за первое место\n"
+    "5. Тактика: высокий прессинг против контроля мяча\n"
+    "6. Коэффициент на П1 — 2.10, фора -1 — 3.40\n"
+    "Итог: тотал больше 2.5 голов и угловые больше 9.5 выглядят разумно.",
+    "Ключевые факторы:\n"
+    "• Домашнее преимущество\n"
+    "• Усталость гостей после еврокубков\n"
+    "- Карточки: строгий арбитр, в среднем 5.2 за матч\n"
+    "* Пенальти назначались в 3 из 4 последних игр\n"
+    "Рекомендуемые ставки: победа хозяев, ничья в первом тайме, тотал очков в баскетболе не рассматриваем.",
+    "Матч равный, сложно прогнозировать. Возможно, ничья. Автоголы редки, голы вероятны во втором тайме.\n"
+    "10. Погода: дождь, тяжелое поле\n"
+    "11. Замены: тренер ротирует состав\n"
+    "12) Фора +1.5 на гостей выглядит надежно",
+)
+
+
+def legacy_extract_key_factors(analysis: str) -> List[str]:
+    """Прежний PerplexityAPI._extract_key_factors — для сравнения"""
+    factors = []
+    for line in analysis.split('\n'):
+        line = line.strip()
+        if any(marker in line for marker in ['1.', '2.', '3.', '•', '-', '*']):
+            clean_line = line
+            for marker in ['1.', '2.', '3.', '4.', '5.', '•', '-', '*']:
+                clean_line = clean_line.replace(marker, '').strip()
+            if clean_line and len(clean_line) < 100:
+                factors.append(clean_line)
+    return factors[:4]
+
+
+def legacy_extract_recommended_bets(insights: str) -> List[str]:
+    """Прежний PerplexityAPI._extract_recommended_bets — для сравнения"""
+    bet_keywords = [
+        'победа', 'ничья', 'тотал', 'фора', 'голы', 'очки',
+        'угловые', 'карточки', 'пенальти', 'автоголы'
+    ]
+    insights_lower = insights.lower()
+    found_bets = [keyword.capitalize() for keyword in bet_keywords if keyword in insights_lower]
+    return found_bets[:3]
+
+
+def load_corpus(path: str) -> List[str]:
+    """Тексты ответов из кэша Perplexity (без учета TTL) или запасной корпус"""
+    texts = []
+    if path and os.path.exists(path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for _, entry in json.load(f):
+                try:
+                    texts.append(entry['data']['choices'][0]['message']['content'])
+                except (KeyError, IndexError, TypeError):
+                    continue
+    return texts or list(SAMPLE_RESPONSES)
+
+
+def _measure(extract, corpus: List[str], repeats: int) -> float:
+    """Лучшая из repeats попыток: ответов в секунду"""
+    rates = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for text in corpus:
+            extract(text)
+        rates.append(len(corpus) / (time.perf_counter() - started))
+    return max(rates)
+
+
+def bench(count: int = 5000, repeats: int = 5):
+    """Сравнивает прежние построчные проверки и однопроходный extract_analysis"""
+    path = os.getenv('PERPLEXITY_CACHE_PATH', '.cache/perplexity_cache.json.gz')
+    texts = load_corpus(path)
+    corpus = [texts[i % len(texts)] for i in range(count)]
+
+    def legacy(text):
+        legacy_extract_key_factors(text)
+        legacy_extract_recommended_bets(text)
+
+    def compiled(text):
+        result = extract_analysis(text, max_factors=4, max_bets=3)
+        result.factor_texts(4)
+        result.bet_names(3)
+
+    results = {
+        'legacy factors + bets': _measure(legacy, corpus, repeats),
+        'extract_analysis': _measure(compiled, corpus, repeats),
+    }
+    baseline = results['legacy factors + bets']
+    average = sum(len(text) for text in texts) // len(texts)
+    print(f"📊 Разбор ответов: {count} ответов ({len(texts)} уникальных, в среднем {average} символов), "
+          f"лучшая из {repeats} попыток")
+    for name, rate in results.items():
+        print(f"  {name:<24} {rate:>10,.0f} отв./с  (x{rate / baseline:.2f})")
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,158 @@
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytz
+
+from message_renderer import PredictionRenderer
+from sports_bot import SportsAnalyzer
+
+
+def legacy_format_single_prediction(self, pred, index: int, moment: datetime = None) -> str:
+    """Прежний HybridSportsBot.format_single_prediction (до общего рендера) — для сравнения"""
+    moscow_tz = pytz.timezone('Europe/Moscow')
+    current_time = moment or datetime.now(moscow_tz)
+    date_str = current_time.strftime("%d.%m.%Y")
+    time_str = current_time.strftime("%H:%M")
+
+    # Эмодзи для разных видов спорта
+    sport_emoji = {
+        "Футбол": "⚽",
+        "Баскетбол": "🏀", 
+        "Теннис": "🎾",
+        "Хоккей": "🏒"
+    }
+
+    emoji = sport_emoji.get(pred.sport, "🏆")
+
+    # Рейтинг на основе уверенности
+    if pred.confidence >= 85:
+        rating = "🌟🌟🌟 ВЫСОКИЙ"
+        confidence_emoji = "🔥"
+    elif pred.confidence >= 70:
+        rating = "🌟🌟 СРЕДНИЙ" 
+        confidence_emoji = "💪"
+    else:
+        rating = "🌟 ОСТОРОЖНО"
+        confidence_emoji = "⚠️"
+
+    message = f"🏆 **ЭКСПЕРТНЫЙ ПРОГНОЗ #{index}** {confidence_emoji}\n"
+    message += f"📅 {date_str} | 🕘 {time_str} МСК\n\n"
+
+    message += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+
+    # Источник данных
+    source_label = "🔥 LIVE ДАННЫЕ" if getattr(pred, 'source', 'mock') == 'perplexity' else "📊 АНАЛИТИЧЕСКИЕ ДАННЫЕ"
+
+    # Время матча (fallback, если None/пусто)
+    def _fallback_time():
+        import random
+        return random.choice([
+            "15:00 МСК", "16:30 МСК", "17:30 МСК", "19:00 МСК",
+            "20:00 МСК", "21:45 МСК", "22:30 МСК"
+        ])
+
+    display_time = getattr(pred, 'time', None) or _fallback_time()
+
+    message += f"🏟️ **{emoji} {pred.sport}** • {pred.league}\n"
+    message += f"⚔️ **{pred.match}**\n"
+    message += f"🕐 **Время:** {display_time}\n"
+    message += "\n"
+
+    message += f"📈 **ПРОГНОЗ:** `{pred.prediction}`\n"
+    message += f"💰 **Коэффициент:** `{pred.odds}`\n"
+    message += f"🎯 **Уверенность:** `{pred.confidence}%`\n"
+    message += f"⭐️ **Рейтинг:** {rating}\n\n"
+
+    message += f"{source_label}\n\n"
+
+    message += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+
+    message += "📋 **ПРОФЕССИОНАЛЬНЫЙ АНАЛИЗ:**\n\n"
+    analysis_text = (pred.analysis or "").strip()
+    if not analysis_text or "временно недоступен" in analysis_text.lower():
+        # Надежный локальный фолбэк анализа
+        try:
+            analysis_text = self.basic_analyzer.generate_analysis(pred.sport, pred.prediction)
+        except Exception:
+            analysis_text = (
+                "Аналитическая сводка: домашняя/выездная форма, личные встречи, кадровая ситуация и мотивация "
+                "дают умеренное преимущество выбранному исходу. Коэффициент соответствует оценке риска."
+            )
+    message += f"_{analysis_text}_\n\n"
+
+    message += "🔑 **КЛЮЧЕВЫЕ ФАКТОРЫ:**\n"
+    # Гарантируем минимум 3 фактора БЕЗ пустых строк
+    factors = list(getattr(pred, 'key_factors', []) or [])
+    try:
+        while len(factors) < 3:
+            import random
+            extra = random.choice(self.basic_analyzer.key_factors_pool)
+            if extra and extra.strip() and extra not in factors:  # Проверяем что фактор не пустой
+                factors.append(extra)
+    except Exception:
+        # Минимальный резерв, если analyzer не доступен по какой-то причине
+        factors = [
+            "Домашнее преимущество в статистике последних матчей",
+            "Текущая форма команды показывает стабильность", 
+            "Анализ личных встреч указывает на преимущество"
+        ]
+
+    # Убираем пустые факторы и берем только заполненные
+    valid_factors = [f for f in factors if f and f.strip()][:5]
+
+    for j, factor in enumerate(valid_factors, 1):
+        message += f"`{j}.` {factor}\n"
+
+    message += "\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+    message += "📊 *Статистика точности: 78% за месяц*\n"
+    message += "⚠️ *Помните: ставки связаны с рисками*\n"
+    message += "🍀 *Удачных ставок!*\n\n"
+    message += f"🤖 *Сгенерировано: {time_str} МСК*"
+
+    return message
+
+
+def _measure(render, count: int, repeats: int) -> float:
+    """Лучшая из repeats попыток: сообщений в секунду"""
+    rates = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        render(count)
+        rates.append(count / (time.perf_counter() - started))
+    return max(rates)
+
+
+def bench(count: int = 5000, repeats: int = 5):
+    """Сравнивает скорость прежнего рендера и PredictionRenderer"""
+    analyzer = SportsAnalyzer()
+    predictions = analyzer.generate_daily_predictions(3)
+    legacy_bot = SimpleNamespace(basic_analyzer=analyzer)
+    renderer = PredictionRenderer(analyzer)
+
+    def legacy(n):
+        for i in range(n):
+            legacy_format_single_prediction(legacy_bot, predictions[i % 3], i % 3 + 1)
+
+    def single(n):
+        for i in range(n):
+            renderer.render(predictions[i % 3], i % 3 + 1)
+
+    def many(n):
+        for _ in range(n // 3):
+            renderer.render_many(predictions)
+
+    results = {
+        'legacy format_single_prediction': _measure(legacy, count, repeats),
+        'PredictionRenderer.render': _measure(single, count, repeats),
+        'PredictionRenderer.render_many': _measure(many, count - count % 3, repeats),
+    }
+    baseline = results['legacy format_single_prediction']
+    print(f"📊 Рендер сообщений: {count} сообщений, лучшая из {repeats} попыток")
+    for name, rate in results.items():
+        print(f"  {name:<34} {rate:>10,.0f} сообщ./с  (x{rate / baseline:.2f})")
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -1,4 +1,5 @@
 import asyncio
+import contextlib
 import logging
 from datetime import datetime
 import pytz
@@ -7,8 +8,13 @@ import os
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import config
-from sports_bot import SportsAnalyzer
+from sports_bot import SportsAnalyzer, SportsPrediction
 from perplexity_analyzer import EnhancedSportsAnalyzer
+from run_context import RunContext
+from telegram_outbox import TelegramOutbox, parse_chat_targets
+from message_packer import MessagePacker
+from message_renderer import PredictionRenderer
+from prediction_staging import PredictionStaging, StagedPrediction, StagedRun, shift_time
 import random
 
 # Настройка логирования только для консоли (Railway-friendly)
@@ -24,7 +30,9 @@ class HybridSportsBot:
     
     def __init__(self, token: str, channel_id: str, perplexity_key: str = None):
         self.token = token
-        self.channel_id = channel_id
+        # Чаты рассылки через запятую, с необязательным фильтром: "@main,@hoops:basketball"
+        self.targets = parse_chat_targets(channel_id, aliases=EnhancedSportsAnalyzer.SPORT_DISPLAY_NAMES)
+        self.channel_id = self.targets[0].chat_id if self.targets else channel_id
         self.basic_analyzer = SportsAnalyzer()
         
         # Инициализируем Perplexity анализатор если есть ключ
@@ -38,7 +46,26 @@ class HybridSportsBot:
             logger.warning("⚠️ Perplexity API не настроен, используются моковые данные")
         
         self.bot = Bot(token=token)
+        # Отправка с учетом лимитов Telegram вместо фиксированных пауз
+        self.outbox = TelegramOutbox.from_env(self.bot)
+        # Деление длинных сообщений под лимит 4096 и склейка серии в компактном режиме
+        self.packer = MessagePacker.from_env()
+        # Общий рендер сообщений с прогнозами
+        self.renderer = PredictionRenderer.from_env(self.basic_analyzer, extra_lines=("🤖 *Данные: Perplexity AI + модели*",))
+        self.telegram_checked_at = None
         self.scheduler = AsyncIOScheduler(timezone=pytz.timezone('Europe/Moscow'))
+        # Параллельная генерация: все виды спорта сразу, с лимитом и общим дедлайном
+        self.concurrent_generation = str(os.getenv('CONCURRENT_PREDICTIONS', '1')).lower() in ['1', 'true', 'yes']
+        self.generation_concurrency = int(os.getenv('PREDICTIONS_CONCURRENCY', '3'))
+        self.generation_deadline = float(os.getenv('PREDICTIONS_DEADLINE', '45'))
+        # Сводка последнего запуска по этапам (для /status)
+        self.last_run_report = None
+        # Предзагрузка: прогнозы генерируются и рендерятся за PREFETCH_LEAD_MINUTES до публикации
+        # (0 — генерация в момент публикации, как раньше)
+        self.prefetch_lead = int(os.getenv('PREFETCH_LEAD_MINUTES', '5'))
+        self.staging = PredictionStaging.from_env()
+        # Время публикации по слотам расписания (МСК)
+        self.publish_slots = {'morning': (9, 50), 'afternoon': (15, 0)}
     
     def format_enhanced_message(self, predictions: list) -> str:
         """Форматирует улучшенное сообщение с прогнозами"""
@@ -129,37 +156,38 @@ class HybridSportsBot:
         
         return message
     
-    async def generate_hybrid_predictions(self, count: int = 3) -> list:
-        """Генерирует прогнозы, используя Perplexity API для реальных данных"""
+    async def generate_hybrid_predictions(self, count: int = 3, run: RunContext = None) -> list:
+        """Генерирует прогнозы, используя Perplexity API для реальных данных
+
+        run — контекст запуска: генерация укладывается в его дедлайн, опоздавшие
+        запросы отменяются.
+        """
         predictions = []
         
         if self.use_perplexity and self.perplexity_analyzer:
             # Получаем реальные прогнозы через Perplexity
             sports = ["football", "basketball", "tennis"]
-            
-            for sport in sports[:count]:
-                try:
-                    real_pred = await self.perplexity_analyzer.generate_real_prediction(sport)
-                    if real_pred:
-                        # Конвертируем в формат SportsPrediction
-                        from sports_bot import SportsPrediction
-                        pred = SportsPrediction(
-                            sport=real_pred["sport"],
-                            league=real_pred["league"], 
-                            match=real_pred["match"],
-                            prediction=real_pred["prediction"],
-                            odds=real_pred["odds"],
-                            confidence=real_pred["confidence"],
-                            analysis=real_pred["analysis"],
-                            key_factors=real_pred["key_factors"],
-                            source=real_pred.get("source", "perplexity"),
-                            time=real_pred.get("time", None)
-                        )
-                        predictions.append(pred)
-                        logger.info(f"✅ Получен реальный прогноз для {sport} через Perplexity")
-                        continue
-                except Exception as e:
-                    logger.warning(f"⚠️ Не удалось получить реальный прогноз для {sport}: {e}")
+
+            deadline = run.generation_deadline if run else None
+            # Токены и задержки всех запросов этого запуска попадают в одну сводку
+            with self.perplexity_analyzer.perplexity.usage.run(run.label if run else "hybrid"):
+                if self.concurrent_generation:
+                    predictions = await self._generate_concurrent_predictions(sports[:count], run)
+                else:
+                    for sport in sports[:count]:
+                        if run and run.remaining(deadline) <= 0:
+                            logger.warning(f"⏰ Дедлайн генерации истек, {sport} пропущен")
+                            break
+                        try:
+                            generation = self.perplexity_analyzer.generate_real_prediction(sport, deadline=deadline)
+                            real_pred = await (run.bounded(generation, until=deadline) if run else generation)
+                            if real_pred:
+                                # Конвертируем в формат SportsPrediction
+                                predictions.append(SportsPrediction.from_dict(real_pred))
+                                logger.info(f"✅ Получен реальный прогноз для {sport} через Perplexity")
+                                continue
+                        except Exception as e:
+                            logger.warning(f"⚠️ Не удалось получить реальный прогноз для {sport}: {e}")
         
         # Дополняем базовыми прогнозами если нужно
         if len(predictions) < count:
@@ -169,87 +197,105 @@ class HybridSportsBot:
             logger.info(f"📊 Добавлено {needed} базовых прогнозов")
         
         return predictions[:count]
+
+    async def _generate_concurrent_predictions(self, sports: list, run: RunContext = None) -> list:
+        """Генерирует прогнозы по всем видам спорта одновременно.
+
+        Порядок видов спорта сохраняется; опоздавшие и упавшие слоты заполняются
+        базовыми прогнозами.
+        """
+        timeout = self.generation_deadline
+        if run:
+            # Не выходим за дедлайн запуска: после него остается время только на публикацию
+            timeout = min(timeout, run.remaining(run.generation_deadline))
+
+        results = await self.perplexity_analyzer.generate_real_predictions(
+            sports,
+            max_concurrency=self.generation_concurrency,
+            timeout=timeout
+        )
+
+        # Ответ без нужных полей не должен ронять весь запуск — такой слот тоже заполняется
+        converted = []
+        for sport, real_pred in zip(sports, results):
+            prediction = None
+            if real_pred:
+                try:
+                    prediction = SportsPrediction.from_dict(real_pred)
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning(f"⚠️ Некорректный прогноз для {sport}: {e!r}")
+            converted.append(prediction)
+
+        missing = sum(1 for prediction in converted if prediction is None)
+        if missing and run and run.remaining(run.generation_deadline) <= 0:
+            run.mark_timed_out()
+        fillers = iter(self.basic_analyzer.generate_daily_predictions(missing) if missing else [])
+
+        predictions = []
+        for sport, prediction in zip(sports, converted):
+            if prediction is not None:
+                predictions.append(prediction)
+                logger.info(f"✅ Получен реальный прогноз для {sport} через Perplexity")
+            else:
+                predictions.append(next(fillers))
+                logger.info(f"📊 Прогноз для {sport} заменен базовым")
+
+        return predictions
     
-    async def send_daily_predictions(self):
-        """Отправляет ежедневные прогнозы отдельными сообщениями"""
+    async def send_daily_predictions(self, run: RunContext = None, staged: StagedRun = None):
+        """Отправляет ежедневные прогнозы отдельными сообщениями
+
+        Весь запуск укладывается в бюджет RunContext (RUN_BUDGET): генерация
+        обрывается заранее, чтобы успеть опубликовать то, что готово.
+        staged — рассылка, подготовленная предзагрузкой: вместо генерации
+        обновляются только устаревшие прогнозы, остальные уходят как есть.
+        """
+        run = run or RunContext.from_env("daily")
         try:
-            logger.info("� Генерация профессиональных прогнозов...")
-            
-            # Проверяем подключение к боту
-            try:
-                me = await self.bot.get_me()
-                logger.info(f"🤖 Бот подключен: @{me.username}")
-            except Exception as e:
-                logger.error(f"❌ Ошибка подключения к боту: {e}")
+            if self.outbox.store and self.outbox.store.has_run(run.run_id):
+                # Запуск уже в журнале (перезапуск процесса): досылаем недошедшее, не генерируя заново
+                logger.info(f"📮 Запуск {run.run_id} уже выполнялся, досылаем оставшиеся сообщения")
+                run.mark("delivery")
+                run.record_deliveries(await self.outbox.resume(run.run_id))
                 return
             
-            predictions = await self.generate_hybrid_predictions(3)
-            
-            # Отправляем заголовочное сообщение
-            moscow_tz = pytz.timezone('Europe/Moscow')
-            current_time = datetime.now(moscow_tz)
-            date_str = current_time.strftime("%d.%m.%Y")
-            time_str = current_time.strftime("%H:%M")
-            
-            header_message = f"🔥 **ЭКСПЕРТНЫЕ СПОРТИВНЫЕ ПРОГНОЗЫ** 🔥\n"
-            header_message += f"📅 **{date_str}** | 🕘 **{time_str} МСК**\n\n"
-            header_message += f"🎯 **Сегодня у нас {len(predictions)} эксклюзивных прогноза**\n"
-            header_message += f"📊 *Профессиональный анализ от топ-экспертов*\n"
-            header_message += f"🤖 *Powered by Perplexity AI + статистические модели*\n"
-            header_message += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-            header_message += f"💡 *Каждый прогноз будет отправлен отдельным сообщением*\n"
-            header_message += f"⏰ *Следите за обновлениями в течение нескольких минут*"
-            
-            await self.bot.send_message(
-                chat_id=self.channel_id,
-                text=header_message,
-                parse_mode='Markdown'
-            )
-            
-            logger.info("📤 Заголовочное сообщение отправлено")
-            
-            # Небольшая пауза перед отправкой прогнозов
-            await asyncio.sleep(3)
+            logger.info("� Генерация профессиональных прогнозов...")
             
-            # Отправляем каждый прогноз отдельным сообщением
-            for i, prediction in enumerate(predictions, 1):
+            run.mark("telegram_check")
+            # Проверяем подключение к боту (если прогрев уже проверил его — не тратим время)
+            checked_recently = self.telegram_checked_at and \
+                (datetime.now(pytz.timezone('Europe/Moscow')) - self.telegram_checked_at).total_seconds() < 300
+            if not checked_recently:
                 try:
-                    message = self.format_single_prediction(prediction, i)
-                    
-                    await self.bot.send_message(
-                        chat_id=self.channel_id,
-                        text=message,
-                        parse_mode='Markdown'
-                    )
-                    
-                    logger.info(f"✅ Прогноз #{i} отправлен: {prediction.match}")
-                    
-                    # Пауза между сообщениями для избежания спама
-                    if i < len(predictions):
-                        await asyncio.sleep(2)
-                        
+                    me = await self.bot.get_me()
+                    logger.info(f"🤖 Бот подключен: @{me.username}")
                 except Exception as e:
-                    logger.error(f"❌ Ошибка отправки прогноза #{i}: {e}")
+                    logger.error(f"❌ Ошибка подключения к боту: {e}")
+                    return
             
-            # Отправляем финальное сообщение
-            footer_message = f"🎉 **ВСЕ ПРОГНОЗЫ ОТПРАВЛЕНЫ!** 🎉\n\n"
-            footer_message += f"📊 **Итого:** {len(predictions)} экспертных прогноза\n"
-            footer_message += f"🎯 **Средняя уверенность:** {sum(p.confidence for p in predictions) // len(predictions)}%\n"
-            footer_message += f"🤖 **Источник данных:** Perplexity AI + статистика\n\n"
-            footer_message += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-            footer_message += f"⚠️ **Важно:** Играйте ответственно!\n"
-            footer_message += f"💰 **Не ставьте больше, чем можете позволить**\n"
-            footer_message += f"🍀 **Удачных ставок!**\n\n"
-            footer_message += f"📈 *Следующие прогнозы: завтра в 9:50 МСК*"
+            if staged:
+                run.mark("refresh")
+                await self._refresh_staged(staged, run)
+                predictions = [item.prediction for item in staged.items]
+                messages = [item.message for item in staged.items]
+            else:
+                run.mark("generation")
+                predictions = await self.generate_hybrid_predictions(3, run=run)
+                messages = [None] * len(predictions)
             
-            await asyncio.sleep(3)
-            await self.bot.send_message(
-                chat_id=self.channel_id,
-                text=footer_message,
-                parse_mode='Markdown'
-            )
+            if not predictions:
+                logger.warning("Нет прогнозов для отправки")
+                return
+
+            run.mark("render")
+            batches = self._render_batches(predictions, messages, run)
+
+            # Один раз сгенерированные прогнозы уходят во все чаты одновременно
+            run.mark("delivery")
+            deliveries = await self.outbox.broadcast(batches, run_id=run.run_id, parse_mode=self.renderer.parse_mode)
+            run.record_deliveries(deliveries)
             
-            logger.info("🎯 Все прогнозы успешно отправлены!")
+            logger.info(f"🎯 Прогнозы отправлены в {len(deliveries)} чат(ов)")
             
             # Логируем статистику
             confidence_avg = sum(p.confidence for p in predictions) / len(predictions)
@@ -257,149 +303,235 @@ class HybridSportsBot:
             
         except Exception as e:
             logger.error(f"❌ Критическая ошибка при отправке прогнозов: {e}")
-            logger.error(f"💬 Канал ID: {self.channel_id}")
+            logger.error(f"💬 Чаты: {', '.join(str(target.chat_id) for target in self.targets)}")
             
             # Отправляем сообщение об ошибке
             try:
-                error_message = f"🚨 **ТЕХНИЧЕСКИЕ ПРОБЛЕМЫ**\n\n"
-                error_message += f"К сожалению, произошла ошибка при генерации прогнозов.\n"
-                error_message += f"Мы работаем над устранением проблемы.\n\n"
-                error_message += f"⏰ Попробуйте снова через несколько минут.\n"
-                error_message += f"🔧 **Код ошибки:** {str(e)[:100]}"
-                
-                await self.bot.send_message(
-                    chat_id=self.channel_id,
-                    text=error_message,
-                    parse_mode='Markdown'
+                # Текст исключения экранируется: в нем бывают символы разметки
+                error_message = self.renderer.format(
+                    "🚨 **ТЕХНИЧЕСКИЕ ПРОБЛЕМЫ**\n\n"
+                    "К сожалению, произошла ошибка при генерации прогнозов.\n"
+                    "Мы работаем над устранением проблемы.\n\n"
+                    "⏰ Попробуйте снова через несколько минут.\n"
+                    "🔧 **Код ошибки:** {error}",
+                    error=str(e)[:100]
                 )
-            except:
+                
+                results = await self.outbox.broadcast({target.chat_id: [error_message] for target in self.targets}, parse_mode=self.renderer.parse_mode)
+                error_sent = any(result['sent'] for result in results)
+            except Exception as send_error:
+                logger.error(f"❌ Ошибка отправки сообщения об ошибке: {send_error}")
+                error_sent = False
+            if not error_sent:
                 logger.error("Не удалось отправить сообщение об ошибке")
                 logger.error("🔍 Проверьте:")
                 logger.error("1. Правильность TELEGRAM_CHANNEL_ID")
                 logger.error("2. Бот добавлен в канал как администратор")
                 logger.error("3. Канал существует и доступен")
+        finally:
+            self.last_run_report = run.finish()
+
+    def _render_batches(self, predictions: list, messages: list, run: RunContext = None) -> dict:
+        """Серии сообщений по чатам: заголовок, прогнозы по фильтру чата и итог.
+
+        Прогноз рендерится один раз на свой номер в серии, поэтому чаты с одинаковым
+        набором видов спорта получают одни и те же готовые сообщения. Серия проходит
+        через упаковщик: длинные сообщения делятся, в компактном режиме — склеиваются.
+        """
+        rendered = {(index, index + 1): message for index, message in enumerate(messages) if message}
+        batches = {}
+        for target in self.targets:
+            selected = [index for index, prediction in enumerate(predictions) if target.accepts(prediction.sport)]
+            if not selected:
+                logger.info(f"📢 {target.chat_id}: нет прогнозов по фильтру чата, пропуск")
+                continue
+            batch = [self._format_header(len(selected))]
+            for position, index in enumerate(selected, 1):
+                if (index, position) not in rendered:
+                    rendered[(index, position)] = self.format_single_prediction(predictions[index], position)
+                batch.append(rendered[(index, position)])
+            batch.append(self._format_footer([predictions[index] for index in selected]))
+            packed = self.packer.pack(batch)
+            if run:
+                run.add('api_calls_saved', len(batch) - len(packed))
+            batches[target.chat_id] = packed
+        return batches
+
+    def _format_header(self, count: int) -> str:
+        """Заголовочное сообщение рассылки"""
+        date_str, time_str = self.renderer.clock.stamp()
+        return self.renderer.format(
+            "🔥 **ЭКСПЕРТНЫЕ СПОРТИВНЫЕ ПРОГНОЗЫ** 🔥\n"
+            "📅 **{date}** | 🕘 **{time} МСК**\n\n"
+            "🎯 **Сегодня у нас {count} эксклюзивных прогноза**\n"
+            "📊 *Профессиональный анализ от топ-экспертов*\n"
+            "🤖 *Powered by Perplexity AI + статистические модели*\n"
+            "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+            "💡 *Каждый прогноз будет отправлен отдельным сообщением*\n"
+            "⏰ *Следите за обновлениями в течение нескольких минут*",
+            date=date_str, time=time_str, count=count
+        )
+
+    def _format_footer(self, predictions: list) -> str:
+        """Финальное сообщение рассылки"""
+        return self.renderer.format(
+            "🎉 **ВСЕ ПРОГНОЗЫ ОТПРАВЛЕНЫ!** 🎉\n\n"
+            "📊 **Итого:** {count} экспертных прогноза\n"
+            "🎯 **Средняя уверенность:** {confidence}%\n"
+            "🤖 **Источник данных:** Perplexity AI + статистика\n\n"
+            "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+            "⚠️ **Важно:** Играйте ответственно!\n"
+            "💰 **Не ставьте больше, чем можете позволить**\n"
+            "🍀 **Удачных ставок!**\n\n"
+            "📈 *Следующие прогнозы: завтра в 9:50 МСК*",
+            count=len(predictions), confidence=sum(p.confidence for p in predictions) // len(predictions)
+        )
     
-    def format_single_prediction(self, pred, index: int) -> str:
-        """Форматирует одиночный прогноз для отдельного сообщения"""
-        moscow_tz = pytz.timezone('Europe/Moscow')
-        current_time = datetime.now(moscow_tz)
-        date_str = current_time.strftime("%d.%m.%Y")
-        time_str = current_time.strftime("%H:%M")
-        
-        # Эмодзи для разных видов спорта
-        sport_emoji = {
-            "Футбол": "⚽",
-            "Баскетбол": "🏀", 
-            "Теннис": "🎾",
-            "Хоккей": "🏒"
-        }
-        
-        emoji = sport_emoji.get(pred.sport, "🏆")
-        
-        # Рейтинг на основе уверенности
-        if pred.confidence >= 85:
-            rating = "🌟🌟🌟 ВЫСОКИЙ"
-            confidence_emoji = "🔥"
-        elif pred.confidence >= 70:
-            rating = "🌟🌟 СРЕДНИЙ" 
-            confidence_emoji = "💪"
+    def format_single_prediction(self, pred, index: int, moment: datetime = None) -> str:
+        """Форматирует одиночный прогноз для отдельного сообщения
+
+        moment — время, которое ставится в сообщение (при предзагрузке — время публикации)
+        """
+        return self.renderer.render(pred, index, moment)
+    
+    async def prefetch_predictions(self, slot: str):
+        """Предзагрузка слота: генерирует и рендерит прогнозы заранее и кладет их в staging"""
+        hour, minute = self.publish_slots[slot]
+        publish_at = self.staging.publish_time(hour, minute)
+        run = RunContext.from_env(f"prefetch {slot}")
+        items = None
+        try:
+            logger.info(f"📦 Предзагрузка прогнозов к {publish_at.strftime('%H:%M')} МСК...")
+            run.mark("generation")
+            predictions = await self.generate_hybrid_predictions(3, run=run)
+
+            run.mark("render")
+            sport_keys = {name: key for key, name in EnhancedSportsAnalyzer.SPORT_DISPLAY_NAMES.items()}
+            items = [
+                StagedPrediction(
+                    prediction=prediction,
+                    # Ключ вида спорта нужен, чтобы обновить устаревший live-прогноз тем же запросом
+                    sport=sport_keys.get(prediction.sport) if getattr(prediction, 'source', 'mock') == 'perplexity' else None,
+                    message=message
+                )
+                for prediction, message in zip(predictions, self.renderer.render_many(predictions, moment=publish_at))
+            ]
+        except Exception as e:
+            logger.error(f"❌ Ошибка предзагрузки прогнозов ({slot}): {e}")
+        finally:
+            report = run.finish()
+
+        if items:
+            self.staging.put(StagedRun(slot=slot, publish_at=publish_at, items=items, report=report))
         else:
-            rating = "🌟 ОСТОРОЖНО"
-            confidence_emoji = "⚠️"
-        
-        message = f"🏆 **ЭКСПЕРТНЫЙ ПРОГНОЗ #{index}** {confidence_emoji}\n"
-        message += f"📅 {date_str} | 🕘 {time_str} МСК\n\n"
-        
-        message += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-        
-        # Источник данных
-        source_label = "🔥 LIVE ДАННЫЕ" if getattr(pred, 'source', 'mock') == 'perplexity' else "📊 АНАЛИТИЧЕСКИЕ ДАННЫЕ"
+            logger.warning(f"📦 Предзагрузка {slot} ничего не подготовила, прогнозы сгенерируются при публикации")
 
-        # Время матча (fallback)
-        def _fallback_time():
-            import random
-            return random.choice(["15:00 МСК", "17:30 МСК", "19:00 МСК", "21:45 МСК"]) 
+    async def publish_predictions(self, slot: str):
+        """Публикация слота: отправляет подготовленную рассылку (без нее — генерирует на месте)"""
+        staged = self.staging.take(slot) if self.prefetch_lead > 0 else None
+        if staged is None and self.prefetch_lead > 0:
+            logger.warning(f"📦 Нет подготовленной рассылки {slot}, генерируем при публикации")
+        # run_id слота и даты: перезапуск в тот же день не опубликует рассылку повторно
+        run = RunContext.from_env("daily", run_id=f"{slot}:{datetime.now(pytz.timezone('Europe/Moscow')).strftime('%Y-%m-%d')}")
+        await self.send_daily_predictions(run, staged=staged)
 
-        display_time = getattr(pred, 'time', None) or _fallback_time()
+    async def _refresh_staged(self, staged: StagedRun, run: RunContext):
+        """Перегенерирует устаревшие прогнозы подготовленной рассылки, остальные не трогает"""
+        stale = self.staging.stale_indexes(staged)
+        if not stale:
+            logger.info(f"📦 Рассылка {staged.slot}: все {len(staged.items)} прогнозов актуальны")
+            return
+        logger.info(f"♻️ Рассылка {staged.slot}: обновляем {len(stale)} из {len(staged.items)} прогнозов")
 
-        message += f"🏟️ **{emoji} {pred.sport}** • {pred.league}\n"
-        message += f"⚔️ **{pred.match}**\n"
-        message += f"🕐 **Время:** {display_time}\n"
-        message += f"\n"
-        
-        message += f"📈 **ПРОГНОЗ:** `{pred.prediction}`\n"
-        message += f"💰 **Коэффициент:** `{pred.odds}`\n"
-        message += f"🎯 **Уверенность:** `{pred.confidence}%`\n"
-        message += f"⭐️ **Рейтинг:** {rating}\n\n"
-        
-        message += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-        
-        message += f"{source_label}\n\n"
-        message += f"📋 **ПРОФЕССИОНАЛЬНЫЙ АНАЛИЗ:**\n\n"
-        analysis_text = (getattr(pred, 'analysis', '') or '').strip()
-        if not analysis_text or "временно недоступен" in analysis_text.lower():
-            # Локальный fallback
-            try:
-                from sports_bot import SportsAnalyzer
-                analyzer = SportsAnalyzer()
-                analysis_text = analyzer.generate_analysis(pred.sport, pred.prediction)
-            except Exception:
-                analysis_text = (
-                    "Аналитическая сводка: форма, личные встречи, кадры и мотивация формируют преимущество указанного исхода."
-                )
-        message += f"_{analysis_text}_\n\n"
-        
-        message += f"🔑 **КЛЮЧЕВЫЕ ФАКТОРЫ:**\n"
-        # Гарантируем минимум 3 фактора
-        factors = list(getattr(pred, 'key_factors', []) or [])
-        try:
-            while len(factors) < 3:
-                import random
-                from sports_bot import SportsAnalyzer
-                extra = random.choice(SportsAnalyzer().key_factors_pool)
-                if extra not in factors:
-                    factors.append(extra)
-        except Exception:
-            while len(factors) < 3:
-                factors.append("Домашнее преимущество")
-        for j, factor in enumerate(factors[:5], 1):
-            message += f"`{j}.` {factor}\n"
-        
-        message += f"\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-        message += f"📊 *Статистика точности: 78% за месяц*\n"
-        message += f"🤖 *Данные: Perplexity AI + модели*\n"
-        message += f"⚠️ *Помните: ставки связаны с рисками*\n"
-        message += f"🍀 *Удачных ставок!*\n\n"
-        message += f"🤖 *Сгенерировано: {time_str} МСК*"
-        
-        return message
+        async def refresh(item: StagedPrediction):
+            if self.use_perplexity and self.perplexity_analyzer and item.sport:
+                try:
+                    generation = self.perplexity_analyzer.generate_real_prediction(item.sport, deadline=run.generation_deadline)
+                    real_pred = await run.bounded(generation, until=run.generation_deadline)
+                    if real_pred:
+                        return SportsPrediction.from_dict(real_pred)
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось обновить прогноз для {item.sport}: {e}")
+            return self.basic_analyzer.generate_daily_predictions(1)[0]
+
+        usage_run = self.perplexity_analyzer.perplexity.usage.run(run.label) if self.perplexity_analyzer else contextlib.nullcontext()
+        with usage_run:
+            fresh = await asyncio.gather(*(refresh(staged.items[index]) for index in stale))
+
+        for index, prediction in zip(stale, fresh):
+            if prediction is None:
+                logger.warning(f"⚠️ Прогноз #{index + 1} не обновлен, отправляется подготовленный")
+                continue
+            self.staging.replace(staged, index, prediction, self.format_single_prediction(prediction, index + 1))
     
     async def start_scheduler(self):
-        """Запускает планировщик"""
-        # Основная задача в 9:50 МСК
-        self.scheduler.add_job(
-            self.send_daily_predictions,
-            CronTrigger(hour=9, minute=50, timezone=pytz.timezone('Europe/Moscow')),
-            id='daily_predictions_morning',
-            max_instances=1
-        )
-        
-        # Дополнительная задача в 15:00 МСК для дневных матчей
-        self.scheduler.add_job(
-            self.send_daily_predictions,
-            CronTrigger(hour=15, minute=0, timezone=pytz.timezone('Europe/Moscow')),
-            id='daily_predictions_afternoon',
-            max_instances=1
-        )
+        """Запускает планировщик
+
+        При PREFETCH_LEAD_MINUTES > 0 у каждого слота две задачи: предзагрузка
+        заранее и публикация точно в срок; прогрев — за минуту до первой из них.
+        """
+        moscow_tz = pytz.timezone('Europe/Moscow')
+        for slot, (hour, minute) in self.publish_slots.items():
+            start_hour, start_minute = shift_time(hour, minute, -self.prefetch_lead)
+            warm_hour, warm_minute = shift_time(start_hour, start_minute, -1)
+
+            # Прогрев соединений за минуту до первой задачи слота
+            self.scheduler.add_job(
+                self.warm_up,
+                CronTrigger(hour=warm_hour, minute=warm_minute, timezone=moscow_tz),
+                id=f'warm_up_{slot}',
+                max_instances=1
+            )
+
+            if self.prefetch_lead > 0:
+                self.scheduler.add_job(
+                    self.prefetch_predictions,
+                    CronTrigger(hour=start_hour, minute=start_minute, timezone=moscow_tz),
+                    args=[slot],
+                    id=f'prefetch_predictions_{slot}',
+                    max_instances=1
+                )
+            self.scheduler.add_job(
+                self.publish_predictions,
+                CronTrigger(hour=hour, minute=minute, timezone=moscow_tz),
+                args=[slot],
+                id=f'daily_predictions_{slot}',
+                max_instances=1
+            )
         
         self.scheduler.start()
         logger.info("🚀 Планировщик запущен:")
-        logger.info("⏰ Прогнозы отправляются в 8:42 и 15:00 МСК")
+        logger.info("⏰ Прогнозы отправляются в 9:50 и 15:00 МСК")
+        if self.prefetch_lead > 0:
+            logger.info(f"📦 Предзагрузка за {self.prefetch_lead} мин до публикации")
+    
+    async def warm_up(self):
+        """Прогрев перед плановым запуском: соединения Perplexity и проверка Telegram"""
+        logger.info("🔥 Прогрев соединений перед отправкой прогнозов...")
+        if self.perplexity_analyzer:
+            try:
+                await self.perplexity_analyzer.warm_up()
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка прогрева Perplexity: {e}")
+        try:
+            me = await self.bot.get_me()
+            self.telegram_checked_at = datetime.now(pytz.timezone('Europe/Moscow'))
+            logger.info(f"🤖 Telegram доступен: @{me.username}")
+        except Exception as e:
+            logger.warning(f"⚠️ Telegram недоступен при прогреве: {e}")
     
-    async def test_send(self):
-        """Тестовая отправка"""
+    async def test_send(self, run_id: str = None):
+        """Тестовая отправка (с run_id — не чаще одного раза на этот идентификатор)"""
         logger.info("🧪 Запуск тестовой отправки...")
-        await self.send_daily_predictions()
+        await self.send_daily_predictions(RunContext.from_env("test", run_id=run_id))
+    
+    async def startup(self):
+        """Действия при старте процесса: дослать прерванную рассылку и отправить стартовый тест.
+
+        Стартовый тест привязан к дате, поэтому перезапуски в течение дня его не повторяют.
+        """
+        await self.outbox.resume()
+        await self.test_send(run_id=f"startup:{datetime.now(pytz.timezone('Europe/Moscow')).strftime('%Y-%m-%d')}")
     
     async def cleanup(self):
         """Очистка ресурсов"""
@@ -431,9 +563,9 @@ async def main():
     try:
         await bot.start_scheduler()
         
-        # Тестовая отправка при первом запуске
+        # Досылаем прерванную рассылку и отправляем тест (один раз за день)
         logger.info("🧪 Отправка тестового сообщения...")
-        await bot.test_send()
+        await bot.startup()
         
         logger.info("✅ Бот успешно запущен и работает!")
         logger.info("💤 Ожидание запланированных задач...")
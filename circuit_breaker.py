@@ -0,0 +1,150 @@
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class _ModelCircuit:
+    """Состояние автомата для одной модели"""
+
+    def __init__(self):
+        self.state = CLOSED
+        self.events = deque()  # (время, успех)
+        self.opened_at = 0.0
+        self.probe_started_at = None
+        self.short_circuited = 0
+        self.times_opened = 0
+
+
+class CircuitBreaker:
+    """Автоматический выключатель перед Perplexity API.
+
+    Для каждой модели считает долю ошибок (таймауты, обрывы, 5xx/429) в скользящем
+    окне. Когда доля превышает порог, цепь размыкается (open) и запросы сразу уходят
+    на фолбэк, не дожидаясь таймаута. Через open_seconds цепь переходит в half-open
+    и пропускает один пробный запрос: успех замыкает цепь, ошибка снова размыкает.
+    """
+
+    def __init__(self, window_seconds: float = 120, failure_threshold: float = 0.5,
+                 min_requests: int = 3, open_seconds: float = 60, probe_timeout: float = 35):
+        self.window_seconds = window_seconds
+        self.failure_threshold = failure_threshold
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        # Если пробный запрос так и не отчитался (например, отменен), через это время пускаем новый
+        self.probe_timeout = probe_timeout
+        self._circuits: Dict[str, _ModelCircuit] = {}
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreaker":
+        """Создает выключатель из переменных окружения PERPLEXITY_BREAKER_*"""
+        return cls(
+            window_seconds=float(os.getenv('PERPLEXITY_BREAKER_WINDOW', '120')),
+            failure_threshold=float(os.getenv('PERPLEXITY_BREAKER_THRESHOLD', '0.5')),
+            min_requests=int(os.getenv('PERPLEXITY_BREAKER_MIN_REQUESTS', '3')),
+            open_seconds=float(os.getenv('PERPLEXITY_BREAKER_OPEN_SECONDS', '60'))
+        )
+
+    def _get(self, model: str) -> _ModelCircuit:
+        if model not in self._circuits:
+            self._circuits[model] = _ModelCircuit()
+        return self._circuits[model]
+
+    def _prune(self, circuit: _ModelCircuit, now: float):
+        while circuit.events and circuit.events[0][0] < now - self.window_seconds:
+            circuit.events.popleft()
+
+    def allow(self, model: str) -> bool:
+        """Можно ли сейчас отправить запрос к модели"""
+        circuit = self._get(model)
+        now = time.monotonic()
+
+        if circuit.state == OPEN:
+            if now - circuit.opened_at < self.open_seconds:
+                circuit.short_circuited += 1
+                return False
+            circuit.state = HALF_OPEN
+            circuit.probe_started_at = None
+            logger.info(f"🔌 Цепь {model}: half-open, пробный запрос")
+
+        if circuit.state == HALF_OPEN:
+            if circuit.probe_started_at is not None and now - circuit.probe_started_at < self.probe_timeout:
+                circuit.short_circuited += 1
+                return False
+            circuit.probe_started_at = now
+
+        return True
+
+    def record_success(self, model: str):
+        """Отмечает успешный ответ модели"""
+        circuit = self._get(model)
+        now = time.monotonic()
+        if circuit.state == HALF_OPEN:
+            circuit.state = CLOSED
+            circuit.events.clear()
+            circuit.probe_started_at = None
+            logger.info(f"✅ Цепь {model} замкнута: API снова отвечает")
+        circuit.events.append((now, True))
+        self._prune(circuit, now)
+
+    def record_failure(self, model: str):
+        """Отмечает ошибку модели и при необходимости размыкает цепь"""
+        circuit = self._get(model)
+        now = time.monotonic()
+        circuit.events.append((now, False))
+        self._prune(circuit, now)
+
+        if circuit.state == HALF_OPEN:
+            self._open(model, circuit, now)
+            return
+
+        total = len(circuit.events)
+        failures = sum(1 for _, ok in circuit.events if not ok)
+        if circuit.state == CLOSED and total >= self.min_requests and failures / total >= self.failure_threshold:
+            self._open(model, circuit, now)
+
+    def record_abandoned(self, model: str):
+        """Запрос оборван нами (дедлайн запуска): ни успех, ни ошибка — только освобождает пробный запрос"""
+        circuit = self._get(model)
+        if circuit.state == HALF_OPEN:
+            circuit.probe_started_at = None
+
+    def _open(self, model: str, circuit: _ModelCircuit, now: float):
+        circuit.state = OPEN
+        circuit.opened_at = now
+        circuit.probe_started_at = None
+        circuit.times_opened += 1
+        logger.warning(f"⚡ Цепь {model} разомкнута: запросы идут сразу на фолбэк {self.open_seconds:.0f} с")
+
+    def is_open(self, model: str) -> bool:
+        """Цепь разомкнута и пробный запрос еще не положен (без побочных эффектов, в отличие от allow)"""
+        circuit = self._circuits.get(model)
+        return bool(circuit) and circuit.state == OPEN and time.monotonic() - circuit.opened_at < self.open_seconds
+
+    def get_state(self, model: str) -> str:
+        """Текущее состояние цепи модели"""
+        return self._get(model).state
+
+    def get_stats(self) -> Dict:
+        """Состояние цепей по моделям для /status"""
+        now = time.monotonic()
+        stats = {}
+        for model, circuit in self._circuits.items():
+            self._prune(circuit, now)
+            total = len(circuit.events)
+            failures = sum(1 for _, ok in circuit.events if not ok)
+            stats[model] = {
+                'state': circuit.state,
+                'error_rate': round(failures / total, 3) if total else 0.0,
+                'window_requests': total,
+                'short_circuited': circuit.short_circuited,
+                'times_opened': circuit.times_opened
+            }
+        return stats
@@ -0,0 +1,122 @@
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Уверенность по формулировкам анализа: берется максимум из найденных
+CONFIDENCE_KEYWORDS = {
+    # Высокая уверенность (85-95%)
+    'очевидный фаворит': 95,
+    'явное преимущество': 90,
+    'безусловный лидер': 90,
+    'доминирует': 88,
+    'превосходит': 87,
+    'однозначно': 85,
+
+    # Средне-высокая уверенность (75-84%)
+    'высокая вероятность': 84,
+    'скорее всего': 82,
+    'наиболее вероятно': 80,
+    'фаворит': 78,
+    'преимущество': 76,
+    'хорошие шансы': 75,
+
+    # Средняя уверенность (60-74%)
+    'возможно': 70,
+    'может': 68,
+    'шансы есть': 65,
+    'неплохие перспективы': 62,
+    'стоит рассмотреть': 60,
+
+    # Низкая уверенность (45-59%)
+    'сомнительно': 55,
+    'рискованно': 50,
+    'непредсказуемо': 48,
+    'сложно прогнозировать': 45
+}
+
+# Бонус за детальность анализа; * в конце — любое окончание слова (статистика, статистики)
+DETAIL_INDICATORS = (
+    'статистик*', 'последние матчи', 'форма команды',
+    'личные встречи', 'травм*', 'мотиваци*', 'тактик*',
+    'коэффициент*', 'букмекер*', 'эксперт*', 'анализ*'
+)
+DETAIL_BONUS = 2
+
+# Штраф за неопределенность
+UNCERTAINTY_WORDS = ('но', 'однако', 'возможно', 'может быть', 'неясно')
+UNCERTAINTY_PENALTY = 3
+
+BASE_CONFIDENCE = 75
+MIN_CONFIDENCE = 45
+MAX_CONFIDENCE = 95
+
+
+def _keyword_pattern(keyword: str) -> str:
+    """Ключевое слово → регулярное выражение по границам слов (* — окончание слова)"""
+    return r'\w*'.join(re.escape(part) for part in keyword.split('*')) + r'(?!\w)'
+
+
+class ConfidenceScorer:
+    """Оценка уверенности прогноза по тексту анализа за один проход.
+
+    Все словари ключевых слов собираются в одно регулярное выражение с
+    границами слов: «но» больше не находится внутри «основной», «может» — внутри
+    «возможно». Выражение проверяется с каждого начала слова (просмотр вперед),
+    поэтому пересекающиеся фразы («может быть» и «может», «очевидный фаворит» и
+    «фаворит») засчитываются так же, как отдельными проверками.
+
+    Таблицы можно передать свои — так калибровка прогоняет сохраненные анализы
+    через score_many с новыми весами.
+    """
+
+    def __init__(self, confidence_keywords: Optional[Dict[str, int]] = None,
+                 detail_indicators: Iterable[str] = DETAIL_INDICATORS,
+                 uncertainty_words: Iterable[str] = UNCERTAINTY_WORDS,
+                 base: int = BASE_CONFIDENCE, bounds: Tuple[int, int] = (MIN_CONFIDENCE, MAX_CONFIDENCE),
+                 detail_bonus: int = DETAIL_BONUS, uncertainty_penalty: int = UNCERTAINTY_PENALTY):
+        self.confidence_keywords = dict(CONFIDENCE_KEYWORDS if confidence_keywords is None else confidence_keywords)
+        self.detail_indicators = tuple(detail_indicators)
+        self.uncertainty_words = tuple(uncertainty_words)
+        self.base = base
+        self.bounds = bounds
+        self.detail_bonus = detail_bonus
+        self.uncertainty_penalty = uncertainty_penalty
+
+        self._values = {keyword.lower(): value for keyword, value in self.confidence_keywords.items()}
+        self._details = {keyword.lower() for keyword in self.detail_indicators}
+        self._uncertain = {keyword.lower() for keyword in self.uncertainty_words}
+        keywords = list(dict.fromkeys(list(self._values) + sorted(self._details) + sorted(self._uncertain)))
+        # Длинные фразы первыми: с одного начала слова совпадает самая длинная
+        keywords.sort(key=len, reverse=True)
+        self._keywords = keywords
+        self._pattern = re.compile(
+            r'(?<!\w)(?=' + '|'.join(f'(?P<k{number}>{_keyword_pattern(keyword)})'
+                                     for number, keyword in enumerate(keywords)) + ')'
+        )
+        # Фраза, совпавшая с начала слова, засчитывает и более короткие ключи с того же начала
+        self._implied = {
+            keyword: [other for other in keywords
+                      if other != keyword and re.match(_keyword_pattern(other), keyword.replace('*', ''))]
+            for keyword in keywords
+        }
+
+    def matches(self, analysis: str) -> Set[str]:
+        """Ключевые слова (в написании таблиц, в нижнем регистре), найденные в анализе"""
+        found = set()
+        for match in self._pattern.finditer(analysis.lower()):
+            keyword = self._keywords[int(match.lastgroup[1:])]
+            found.add(keyword)
+            found.update(self._implied[keyword])
+        return found
+
+    def score(self, analysis: str) -> int:
+        """Уверенность 45–95%: максимум по формулировкам, плюс детальность, минус неопределенность"""
+        found = self.matches(analysis)
+        confidence = max([self.base] + [self._values[keyword] for keyword in found if keyword in self._values])
+        confidence += self.detail_bonus * len(found & self._details)
+        confidence -= self.uncertainty_penalty * len(found & self._uncertain)
+        low, high = self.bounds
+        return min(high, max(low, confidence))
+
+    def score_many(self, analyses: Iterable[str]) -> List[int]:
+        """Оценки для пачки анализов (калибровка на сохраненных ответах)"""
+        return [self.score(analysis) for analysis in analyses]
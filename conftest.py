@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def no_state_files(monkeypatch):
+    """Без журналов, кэша и журнала отправки: тесты не должны трогать .cache"""
+    monkeypatch.setenv('PERPLEXITY_USAGE_PATH', '')
+    monkeypatch.setenv('PERPLEXITY_CACHE', '0')
+    monkeypatch.setenv('TELEGRAM_OUTBOX_PATH', '')
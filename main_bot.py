@@ -1,4 +1,5 @@
 import asyncio
+import contextlib
 import logging
 from datetime import datetime
 import pytz
@@ -7,8 +8,13 @@ import os
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import config
-from sports_bot import SportsAnalyzer
+from sports_bot import SportsAnalyzer, SportsPrediction
 from perplexity_analyzer import EnhancedSportsAnalyzer
+from run_context import RunContext
+from telegram_outbox import TelegramOutbox, parse_chat_targets
+from message_packer import MessagePacker
+from message_renderer import PredictionRenderer
+from prediction_staging import PredictionStaging, StagedPrediction, StagedRun, shift_time
 import random
 
 # Настройка логирования
@@ -26,7 +32,9 @@ class HybridSportsBot:
     
     def __init__(self, token: str, channel_id: str, perplexity_key: str = None):
         self.token = token
-        self.channel_id = channel_id
+        # Чаты рассылки через запятую, с необязательным фильтром: "@main,@hoops:basketball"
+        self.targets = parse_chat_targets(channel_id, aliases=EnhancedSportsAnalyzer.SPORT_DISPLAY_NAMES)
+        self.channel_id = self.targets[0].chat_id if self.targets else channel_id
         self.basic_analyzer = SportsAnalyzer()
         
         # Инициализируем Perplexity анализатор если есть ключ
@@ -40,7 +48,26 @@ class HybridSportsBot:
             logger.warning("⚠️ Perplexity API не настроен, используются моковые данные")
         
         self.bot = Bot(token=token)
+        # Отправка с учетом лимитов Telegram вместо фиксированных пауз
+        self.outbox = TelegramOutbox.from_env(self.bot)
+        # Деление длинных сообщений под лимит 4096 и склейка серии в компактном режиме
+        self.packer = MessagePacker.from_env()
+        # Общий рендер сообщений с прогнозами
+        self.renderer = PredictionRenderer.from_env(self.basic_analyzer)
+        self.telegram_checked_at = None
         self.scheduler = AsyncIOScheduler(timezone=pytz.timezone('Europe/Moscow'))
+        # Параллельная генерация: все виды спорта сразу, с лимитом и общим дедлайном
+        self.concurrent_generation = str(os.getenv('CONCURRENT_PREDICTIONS', '1')).lower() in ['1', 'true', 'yes']
+        self.generation_concurrency = int(os.getenv('PREDICTIONS_CONCURRENCY', '3'))
+        self.generation_deadline = float(os.getenv('PREDICTIONS_DEADLINE', '45'))
+        # Сводка последнего запуска по этапам (для /status)
+        self.last_run_report = None
+        # Предзагрузка: прогнозы генерируются и рендерятся за PREFETCH_LEAD_MINUTES до публикации
+        # (0 — генерация в момент публикации, как раньше)
+        self.prefetch_lead = int(os.getenv('PREFETCH_LEAD_MINUTES', '5'))
+        self.staging = PredictionStaging.from_env()
+        # Время публикации по слотам расписания (МСК)
+        self.publish_slots = {'morning': (8, 30)}
         # Режим только live-данные (без оффлайн фолбэков)
         self.live_only = str(os.getenv('LIVE_ONLY', '0')).lower() in ['1', 'true', 'yes'] or \
                           str(os.getenv('PREDICTIONS_MODE', '')).lower() == 'live'
@@ -147,141 +174,45 @@ class HybridSportsBot:
         
         return message
 
-    def format_single_prediction(self, pred, index: int) -> str:
-        """Форматирует одиночный прогноз для отдельного сообщения"""
-        moscow_tz = pytz.timezone('Europe/Moscow')
-        current_time = datetime.now(moscow_tz)
-        date_str = current_time.strftime("%d.%m.%Y")
-        time_str = current_time.strftime("%H:%M")
-        
-        # Эмодзи для разных видов спорта
-        sport_emoji = {
-            "Футбол": "⚽",
-            "Баскетбол": "🏀", 
-            "Теннис": "🎾",
-            "Хоккей": "🏒"
-        }
-        
-        emoji = sport_emoji.get(pred.sport, "🏆")
-        
-        # Рейтинг на основе уверенности
-        if pred.confidence >= 85:
-            rating = "🌟🌟🌟 ВЫСОКИЙ"
-            confidence_emoji = "🔥"
-        elif pred.confidence >= 70:
-            rating = "🌟🌟 СРЕДНИЙ" 
-            confidence_emoji = "💪"
-        else:
-            rating = "🌟 ОСТОРОЖНО"
-            confidence_emoji = "⚠️"
-        
-        message = f"🏆 **ЭКСПЕРТНЫЙ ПРОГНОЗ #{index}** {confidence_emoji}\n"
-        message += f"📅 {date_str} | 🕘 {time_str} МСК\n\n"
-        
-        message += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-        
-        # Источник данных
-        source_label = "🔥 LIVE ДАННЫЕ" if getattr(pred, 'source', 'mock') == 'perplexity' else "📊 АНАЛИТИЧЕСКИЕ ДАННЫЕ"
-
-        # Время матча (fallback, если None/пусто)
-        def _fallback_time():
-            import random
-            return random.choice([
-                "15:00 МСК", "16:30 МСК", "17:30 МСК", "19:00 МСК",
-                "20:00 МСК", "21:45 МСК", "22:30 МСК"
-            ])
-
-        display_time = getattr(pred, 'time', None) or _fallback_time()
-
-        message += f"🏟️ **{emoji} {pred.sport}** • {pred.league}\n"
-        message += f"⚔️ **{pred.match}**\n"
-        message += f"🕐 **Время:** {display_time}\n"
-        message += f"\n"
-        
-        message += f"📈 **ПРОГНОЗ:** `{pred.prediction}`\n"
-        message += f"💰 **Коэффициент:** `{pred.odds}`\n"
-        message += f"🎯 **Уверенность:** `{pred.confidence}%`\n"
-        message += f"⭐️ **Рейтинг:** {rating}\n\n"
-
-        message += f"{source_label}\n\n"
-        
-        message += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-        
-        message += f"📋 **ПРОФЕССИОНАЛЬНЫЙ АНАЛИЗ:**\n\n"
-        analysis_text = (pred.analysis or "").strip()
-        if not analysis_text or "временно недоступен" in analysis_text.lower():
-            # Надежный локальный фолбэк анализа
-            try:
-                analysis_text = self.basic_analyzer.generate_analysis(pred.sport, pred.prediction)
-            except Exception:
-                analysis_text = (
-                    "Аналитическая сводка: домашняя/выездная форма, личные встречи, кадровая ситуация и мотивация "
-                    "дают умеренное преимущество выбранному исходу. Коэффициент соответствует оценке риска."
-                )
-        message += f"_{analysis_text}_\n\n"
-        
-        message += f"🔑 **КЛЮЧЕВЫЕ ФАКТОРЫ:**\n"
-        # Гарантируем минимум 3 фактора БЕЗ пустых строк
-        factors = list(getattr(pred, 'key_factors', []) or [])
-        try:
-            while len(factors) < 3:
-                import random
-                extra = random.choice(self.basic_analyzer.key_factors_pool)
-                if extra and extra.strip() and extra not in factors:  # Проверяем что фактор не пустой
-                    factors.append(extra)
-        except Exception:
-            # Минимальный резерв, если analyzer не доступен по какой-то причине
-            factors = [
-                "Домашнее преимущество в статистике последних матчей",
-                "Текущая форма команды показывает стабильность", 
-                "Анализ личных встреч указывает на преимущество"
-            ]
+    def format_single_prediction(self, pred, index: int, moment: datetime = None) -> str:
+        """Форматирует одиночный прогноз для отдельного сообщения
 
-        # Убираем пустые факторы и берем только заполненные
-        valid_factors = [f for f in factors if f and f.strip()][:5]
-        
-        for j, factor in enumerate(valid_factors, 1):
-            message += f"`{j}.` {factor}\n"
-        
-        message += f"\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-        message += f"📊 *Статистика точности: 78% за месяц*\n"
-        message += f"⚠️ *Помните: ставки связаны с рисками*\n"
-        message += f"🍀 *Удачных ставок!*\n\n"
-        message += f"🤖 *Сгенерировано: {time_str} МСК*"
-        
-        return message
+        moment — время, которое ставится в сообщение (при предзагрузке — время публикации)
+        """
+        return self.renderer.render(pred, index, moment)
     
-    async def generate_hybrid_predictions(self, count: int = 3) -> list:
-        """Генерирует прогнозы, используя Perplexity API для реальных данных"""
+    async def generate_hybrid_predictions(self, count: int = 3, run: RunContext = None) -> list:
+        """Генерирует прогнозы, используя Perplexity API для реальных данных
+
+        run — контекст запуска: генерация укладывается в его дедлайн, опоздавшие
+        запросы отменяются.
+        """
         predictions = []
 
         if self.use_perplexity and self.perplexity_analyzer:
             # Получаем реальные прогнозы через Perplexity
             sports = ["football", "basketball", "tennis"]
 
-            for sport in sports[:count]:
-                try:
-                    real_pred = await self.perplexity_analyzer.generate_real_prediction(sport)
-                    if real_pred:
-                        # Конвертируем в формат SportsPrediction
-                        from sports_bot import SportsPrediction
-                        pred = SportsPrediction(
-                            sport=real_pred["sport"],
-                            league=real_pred["league"],
-                            match=real_pred["match"],
-                            prediction=real_pred["prediction"],
-                            odds=real_pred["odds"],
-                            confidence=real_pred["confidence"],
-                            analysis=real_pred["analysis"],
-                            key_factors=real_pred["key_factors"],
-                            source=real_pred.get("source", "perplexity"),
-                            time=real_pred.get("time")
-                        )
-                        predictions.append(pred)
-                        logger.info(f"✅ Получен реальный прогноз для {sport} через Perplexity")
-                        continue
-                except Exception as e:
-                    logger.warning(f"⚠️ Не удалось получить реальный прогноз для {sport}: {e}")
+            deadline = run.generation_deadline if run else None
+            # Токены и задержки всех запросов этого запуска попадают в одну сводку
+            with self.perplexity_analyzer.perplexity.usage.run(run.label if run else "hybrid"):
+                if self.concurrent_generation:
+                    predictions = await self._generate_concurrent_predictions(sports[:count], run)
+                else:
+                    for sport in sports[:count]:
+                        if run and run.remaining(deadline) <= 0:
+                            logger.warning(f"⏰ Дедлайн генерации истек, {sport} пропущен")
+                            break
+                        try:
+                            generation = self.perplexity_analyzer.generate_real_prediction(sport, deadline=deadline)
+                            real_pred = await (run.bounded(generation, until=deadline) if run else generation)
+                            if real_pred:
+                                # Конвертируем в формат SportsPrediction
+                                predictions.append(SportsPrediction.from_dict(real_pred))
+                                logger.info(f"✅ Получен реальный прогноз для {sport} через Perplexity")
+                                continue
+                        except Exception as e:
+                            logger.warning(f"⚠️ Не удалось получить реальный прогноз для {sport}: {e}")
 
         # Если включен режим только LIVE — не подмешиваем оффлайн данные
         if self.live_only:
@@ -299,125 +230,312 @@ class HybridSportsBot:
             logger.info(f"📊 Добавлено {needed} базовых прогнозов")
 
         return predictions[:count]
+
+    async def _generate_concurrent_predictions(self, sports: list, run: RunContext = None) -> list:
+        """Генерирует прогнозы по всем видам спорта одновременно.
+
+        Порядок видов спорта сохраняется; опоздавшие и упавшие слоты заполняются
+        оффлайн-анализом (в режиме LIVE ONLY — пропускаются).
+        """
+        timeout = self.generation_deadline
+        if run:
+            # Не выходим за дедлайн запуска: после него остается время только на публикацию
+            timeout = min(timeout, run.remaining(run.generation_deadline))
+
+        results = await self.perplexity_analyzer.generate_real_predictions(
+            sports,
+            max_concurrency=self.generation_concurrency,
+            timeout=timeout
+        )
+
+        # Ответ без нужных полей не должен ронять весь запуск — такой слот тоже заполняется
+        converted = []
+        for sport, real_pred in zip(sports, results):
+            prediction = None
+            if real_pred:
+                try:
+                    prediction = SportsPrediction.from_dict(real_pred)
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning(f"⚠️ Некорректный прогноз для {sport}: {e!r}")
+            converted.append(prediction)
+
+        missing = sum(1 for prediction in converted if prediction is None)
+        if missing and run and run.remaining(run.generation_deadline) <= 0:
+            run.mark_timed_out()
+        fillers = iter([] if self.live_only or not missing else self.basic_analyzer.generate_daily_predictions(missing))
+
+        predictions = []
+        for sport, prediction in zip(sports, converted):
+            if prediction is not None:
+                predictions.append(prediction)
+                logger.info(f"✅ Получен реальный прогноз для {sport} через Perplexity")
+            elif not self.live_only:
+                predictions.append(next(fillers))
+                logger.info(f"📊 Прогноз для {sport} заменен базовым")
+
+        return predictions
     
-    async def send_daily_predictions(self):
-        """Отправляет ежедневные прогнозы отдельными сообщениями"""
+    async def send_daily_predictions(self, run: RunContext = None, staged: StagedRun = None):
+        """Отправляет ежедневные прогнозы отдельными сообщениями
+
+        Весь запуск укладывается в бюджет RunContext (RUN_BUDGET): генерация
+        обрывается заранее, чтобы успеть опубликовать то, что готово.
+        staged — рассылка, подготовленная предзагрузкой: вместо генерации
+        обновляются только устаревшие прогнозы, остальные уходят как есть.
+        """
+        run = run or RunContext.from_env("daily")
         try:
+            if self.outbox.store and self.outbox.store.has_run(run.run_id):
+                # Запуск уже в журнале (перезапуск процесса): досылаем недошедшее, не генерируя заново
+                logger.info(f"📮 Запуск {run.run_id} уже выполнялся, досылаем оставшиеся сообщения")
+                run.mark("delivery")
+                run.record_deliveries(await self.outbox.resume(run.run_id))
+                return
+            
             logger.info("🔄 Генерация ежедневных прогнозов...")
             
-            predictions = await self.generate_hybrid_predictions(3)
+            if staged:
+                run.mark("refresh")
+                await self._refresh_staged(staged, run)
+                predictions = [item.prediction for item in staged.items]
+                messages = [item.message for item in staged.items]
+            else:
+                run.mark("generation")
+                predictions = await self.generate_hybrid_predictions(3, run=run)
+                messages = [None] * len(predictions)
             if not predictions:
                 # В режиме LIVE ONLY не шлём пустышки
                 if self.live_only:
-                    await self.bot.send_message(
-                        chat_id=self.channel_id,
-                        text=(
-                            "🚫 LIVE-прогнозы сейчас недоступны.\n\n"
-                            "Причины: нет актуальных матчей или лимит API.\n"
-                            "Мы пришлём прогнозы, как только данные появятся."
-                        )
-                    )
+                    await self.outbox.broadcast({target.chat_id: [
+                        "🚫 LIVE-прогнозы сейчас недоступны.\n\n"
+                        "Причины: нет актуальных матчей или лимит API.\n"
+                        "Мы пришлём прогнозы, как только данные появятся."
+                    ] for target in self.targets})
                     logger.info("LIVE ONLY: пропуск отправки — нет реальных прогнозов")
                     return
                 else:
                     logger.warning("Нет прогнозов для отправки")
                     return
 
-            # Отправляем заголовочное сообщение
-            moscow_tz = pytz.timezone('Europe/Moscow')
-            current_time = datetime.now(moscow_tz)
-            date_str = current_time.strftime("%d.%m.%Y")
-            time_str = current_time.strftime("%H:%M")
-            
-            header_message = f"🔥 **ЭКСПЕРТНЫЕ СПОРТИВНЫЕ ПРОГНОЗЫ** 🔥\n"
-            header_message += f"📅 **{date_str}** | 🕘 **{time_str} МСК**\n\n"
-            header_message += f"🎯 **Сегодня у нас {len(predictions)} эксклюзивных прогноза**\n"
-            header_message += f"📊 *Профессиональный анализ от топ-экспертов*\n"
-            header_message += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-            header_message += f"💡 *Каждый прогноз будет отправлен отдельным сообщением*\n"
-            header_message += f"⏰ *Следите за обновлениями в течение нескольких минут*"
-            
-            await self.bot.send_message(
-                chat_id=self.channel_id,
-                text=header_message,
-                parse_mode='Markdown'
-            )
-            
-            logger.info("📤 Заголовочное сообщение отправлено")
-            
-            # Небольшая пауза перед отправкой прогнозов
-            await asyncio.sleep(3)
-            
-            # Отправляем каждый прогноз отдельным сообщением
-            for i, prediction in enumerate(predictions, 1):
-                try:
-                    message = self.format_single_prediction(prediction, i)
-                    
-                    await self.bot.send_message(
-                        chat_id=self.channel_id,
-                        text=message,
-                        parse_mode='Markdown'
-                    )
-                    
-                    logger.info(f"✅ Прогноз #{i} отправлен: {prediction.match}")
-                    
-                    # Пауза между сообщениями для избежания спама
-                    if i < len(predictions):
-                        await asyncio.sleep(2)
-                        
-                except Exception as e:
-                    logger.error(f"❌ Ошибка отправки прогноза #{i}: {e}")
-            
-            # Отправляем финальное сообщение
-            footer_message = f"🎉 **ВСЕ ПРОГНОЗЫ ОТПРАВЛЕНЫ!** 🎉\n\n"
-            footer_message += f"📊 **Итого:** {len(predictions)} экспертных прогноза\n"
-            footer_message += f"🎯 **Средняя уверенность:** {sum(p.confidence for p in predictions) // len(predictions)}%\n\n"
-            footer_message += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-            footer_message += f"⚠️ **Важно:** Играйте ответственно!\n"
-            footer_message += f"💰 **Не ставьте больше, чем можете позволить**\n"
-            footer_message += f"🍀 **Удачных ставок!**\n\n"
-            footer_message += f"📈 *Следующие прогнозы: завтра в 8:30 МСК*"
-            
-            await asyncio.sleep(3)
-            await self.bot.send_message(
-                chat_id=self.channel_id,
-                text=footer_message,
-                parse_mode='Markdown'
-            )
+            run.mark("render")
+            batches = self._render_batches(predictions, messages, run)
+
+            # Один раз сгенерированные прогнозы уходят во все чаты одновременно
+            run.mark("delivery")
+            deliveries = await self.outbox.broadcast(batches, run_id=run.run_id, parse_mode=self.renderer.parse_mode)
+            run.record_deliveries(deliveries)
             
-            logger.info("🎯 Все прогнозы успешно отправлены!")
+            logger.info(f"🎯 Прогнозы отправлены в {len(deliveries)} чат(ов)")
             
         except Exception as e:
             logger.error(f"❌ Ошибка при отправке прогнозов: {e}")
             # Пытаемся отправить уведомление об ошибке
             try:
-                error_message = f"🚨 **ОШИБКА БОТА**\n\nВремя: {datetime.now().strftime('%H:%M:%S')}\nОшибка: {str(e)}"
-                await self.bot.send_message(
-                    chat_id=self.channel_id,
-                    text=error_message,
-                    parse_mode='Markdown'
+                # Текст исключения экранируется: в нем бывают символы разметки
+                error_message = self.renderer.format(
+                    "🚨 **ОШИБКА БОТА**\n\nВремя: {time}\nОшибка: {error}",
+                    time=datetime.now().strftime('%H:%M:%S'), error=str(e)
                 )
+                await self.outbox.broadcast({target.chat_id: [error_message] for target in self.targets}, parse_mode=self.renderer.parse_mode)
             except:
                 pass
+        finally:
+            self.last_run_report = run.finish()
+
+    def _render_batches(self, predictions: list, messages: list, run: RunContext = None) -> dict:
+        """Серии сообщений по чатам: заголовок, прогнозы по фильтру чата и итог.
+
+        Прогноз рендерится один раз на свой номер в серии, поэтому чаты с одинаковым
+        набором видов спорта получают одни и те же готовые сообщения. Серия проходит
+        через упаковщик: длинные сообщения делятся, в компактном режиме — склеиваются.
+        """
+        rendered = {(index, index + 1): message for index, message in enumerate(messages) if message}
+        batches = {}
+        for target in self.targets:
+            selected = [index for index, prediction in enumerate(predictions) if target.accepts(prediction.sport)]
+            if not selected:
+                logger.info(f"📢 {target.chat_id}: нет прогнозов по фильтру чата, пропуск")
+                continue
+            batch = [self._format_header(len(selected))]
+            for position, index in enumerate(selected, 1):
+                if (index, position) not in rendered:
+                    rendered[(index, position)] = self.format_single_prediction(predictions[index], position)
+                batch.append(rendered[(index, position)])
+            batch.append(self._format_footer([predictions[index] for index in selected]))
+            packed = self.packer.pack(batch)
+            if run:
+                run.add('api_calls_saved', len(batch) - len(packed))
+            batches[target.chat_id] = packed
+        return batches
+
+    def _format_header(self, count: int) -> str:
+        """Заголовочное сообщение рассылки"""
+        date_str, time_str = self.renderer.clock.stamp()
+        return self.renderer.format(
+            "🔥 **ЭКСПЕРТНЫЕ СПОРТИВНЫЕ ПРОГНОЗЫ** 🔥\n"
+            "📅 **{date}** | 🕘 **{time} МСК**\n\n"
+            "🎯 **Сегодня у нас {count} эксклюзивных прогноза**\n"
+            "📊 *Профессиональный анализ от топ-экспертов*\n"
+            "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+            "💡 *Каждый прогноз будет отправлен отдельным сообщением*\n"
+            "⏰ *Следите за обновлениями в течение нескольких минут*",
+            date=date_str, time=time_str, count=count
+        )
+
+    def _format_footer(self, predictions: list) -> str:
+        """Финальное сообщение рассылки"""
+        return self.renderer.format(
+            "🎉 **ВСЕ ПРОГНОЗЫ ОТПРАВЛЕНЫ!** 🎉\n\n"
+            "📊 **Итого:** {count} экспертных прогноза\n"
+            "🎯 **Средняя уверенность:** {confidence}%\n\n"
+            "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+            "⚠️ **Важно:** Играйте ответственно!\n"
+            "💰 **Не ставьте больше, чем можете позволить**\n"
+            "🍀 **Удачных ставок!**\n\n"
+            "📈 *Следующие прогнозы: завтра в 8:30 МСК*",
+            count=len(predictions), confidence=sum(p.confidence for p in predictions) // len(predictions)
+        )
+    
+    async def prefetch_predictions(self, slot: str):
+        """Предзагрузка слота: генерирует и рендерит прогнозы заранее и кладет их в staging"""
+        hour, minute = self.publish_slots[slot]
+        publish_at = self.staging.publish_time(hour, minute)
+        run = RunContext.from_env(f"prefetch {slot}")
+        items = None
+        try:
+            logger.info(f"📦 Предзагрузка прогнозов к {publish_at.strftime('%H:%M')} МСК...")
+            run.mark("generation")
+            predictions = await self.generate_hybrid_predictions(3, run=run)
+
+            run.mark("render")
+            sport_keys = {name: key for key, name in EnhancedSportsAnalyzer.SPORT_DISPLAY_NAMES.items()}
+            items = [
+                StagedPrediction(
+                    prediction=prediction,
+                    # Ключ вида спорта нужен, чтобы обновить устаревший live-прогноз тем же запросом
+                    sport=sport_keys.get(prediction.sport) if getattr(prediction, 'source', 'mock') == 'perplexity' else None,
+                    message=message
+                )
+                for prediction, message in zip(predictions, self.renderer.render_many(predictions, moment=publish_at))
+            ]
+        except Exception as e:
+            logger.error(f"❌ Ошибка предзагрузки прогнозов ({slot}): {e}")
+        finally:
+            report = run.finish()
+
+        if items:
+            self.staging.put(StagedRun(slot=slot, publish_at=publish_at, items=items, report=report))
+        else:
+            logger.warning(f"📦 Предзагрузка {slot} ничего не подготовила, прогнозы сгенерируются при публикации")
+
+    async def publish_predictions(self, slot: str):
+        """Публикация слота: отправляет подготовленную рассылку (без нее — генерирует на месте)"""
+        staged = self.staging.take(slot) if self.prefetch_lead > 0 else None
+        if staged is None and self.prefetch_lead > 0:
+            logger.warning(f"📦 Нет подготовленной рассылки {slot}, генерируем при публикации")
+        # run_id слота и даты: перезапуск в тот же день не опубликует рассылку повторно
+        run = RunContext.from_env("daily", run_id=f"{slot}:{datetime.now(pytz.timezone('Europe/Moscow')).strftime('%Y-%m-%d')}")
+        await self.send_daily_predictions(run, staged=staged)
+
+    async def _refresh_staged(self, staged: StagedRun, run: RunContext):
+        """Перегенерирует устаревшие прогнозы подготовленной рассылки, остальные не трогает"""
+        stale = self.staging.stale_indexes(staged)
+        if not stale:
+            logger.info(f"📦 Рассылка {staged.slot}: все {len(staged.items)} прогнозов актуальны")
+            return
+        logger.info(f"♻️ Рассылка {staged.slot}: обновляем {len(stale)} из {len(staged.items)} прогнозов")
+
+        async def refresh(item: StagedPrediction):
+            if self.use_perplexity and self.perplexity_analyzer and item.sport:
+                try:
+                    generation = self.perplexity_analyzer.generate_real_prediction(item.sport, deadline=run.generation_deadline)
+                    real_pred = await run.bounded(generation, until=run.generation_deadline)
+                    if real_pred:
+                        return SportsPrediction.from_dict(real_pred)
+                except Exception as e:
+                    logger.warning(f"⚠️ Не удалось обновить прогноз для {item.sport}: {e}")
+            if self.live_only:
+                return None
+            return self.basic_analyzer.generate_daily_predictions(1)[0]
+
+        usage_run = self.perplexity_analyzer.perplexity.usage.run(run.label) if self.perplexity_analyzer else contextlib.nullcontext()
+        with usage_run:
+            fresh = await asyncio.gather(*(refresh(staged.items[index]) for index in stale))
+
+        for index, prediction in zip(stale, fresh):
+            if prediction is None:
+                logger.warning(f"⚠️ Прогноз #{index + 1} не обновлен, отправляется подготовленный")
+                continue
+            self.staging.replace(staged, index, prediction, self.format_single_prediction(prediction, index + 1))
     
     async def start_scheduler(self):
-        """Запускает планировщик"""
-        # Основная задача в 8:30 МСК
-        self.scheduler.add_job(
-            self.send_daily_predictions,
-            CronTrigger(hour=8, minute=30, timezone=pytz.timezone('Europe/Moscow')),
-            id='daily_predictions_morning',
-            max_instances=1
-        )
+        """Запускает планировщик
+
+        При PREFETCH_LEAD_MINUTES > 0 у каждого слота две задачи: предзагрузка
+        заранее и публикация точно в срок; прогрев — за минуту до первой из них.
+        """
+        moscow_tz = pytz.timezone('Europe/Moscow')
+        for slot, (hour, minute) in self.publish_slots.items():
+            start_hour, start_minute = shift_time(hour, minute, -self.prefetch_lead)
+            warm_hour, warm_minute = shift_time(start_hour, start_minute, -1)
+
+            # Прогрев соединений за минуту до первой задачи слота
+            self.scheduler.add_job(
+                self.warm_up,
+                CronTrigger(hour=warm_hour, minute=warm_minute, timezone=moscow_tz),
+                id=f'warm_up_{slot}',
+                max_instances=1
+            )
+
+            if self.prefetch_lead > 0:
+                self.scheduler.add_job(
+                    self.prefetch_predictions,
+                    CronTrigger(hour=start_hour, minute=start_minute, timezone=moscow_tz),
+                    args=[slot],
+                    id=f'prefetch_predictions_{slot}',
+                    max_instances=1
+                )
+            self.scheduler.add_job(
+                self.publish_predictions,
+                CronTrigger(hour=hour, minute=minute, timezone=moscow_tz),
+                args=[slot],
+                id=f'daily_predictions_{slot}',
+                max_instances=1
+            )
         
         self.scheduler.start()
         logger.info("🚀 Планировщик запущен:")
         logger.info("⏰ Прогнозы отправляются в 8:30 МСК")
+        if self.prefetch_lead > 0:
+            logger.info(f"📦 Предзагрузка за {self.prefetch_lead} мин до публикации")
+    
+    async def warm_up(self):
+        """Прогрев перед плановым запуском: соединения Perplexity и проверка Telegram"""
+        logger.info("🔥 Прогрев соединений перед отправкой прогнозов...")
+        if self.perplexity_analyzer:
+            try:
+                await self.perplexity_analyzer.warm_up()
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка прогрева Perplexity: {e}")
+        try:
+            me = await self.bot.get_me()
+            self.telegram_checked_at = datetime.now(pytz.timezone('Europe/Moscow'))
+            logger.info(f"🤖 Telegram доступен: @{me.username}")
+        except Exception as e:
+            logger.warning(f"⚠️ Telegram недоступен при прогреве: {e}")
     
-    async def test_send(self):
-        """Тестовая отправка"""
+    async def test_send(self, run_id: str = None):
+        """Тестовая отправка (с run_id — не чаще одного раза на этот идентификатор)"""
         logger.info("🧪 Запуск тестовой отправки...")
-        await self.send_daily_predictions()
+        await self.send_daily_predictions(RunContext.from_env("test", run_id=run_id))
+    
+    async def startup(self):
+        """Действия при старте процесса: дослать прерванную рассылку и отправить стартовый тест.
+
+        Стартовый тест привязан к дате, поэтому перезапуски в течение дня его не повторяют.
+        """
+        await self.outbox.resume()
+        await self.test_send(run_id=f"startup:{datetime.now(pytz.timezone('Europe/Moscow')).strftime('%Y-%m-%d')}")
     
     async def cleanup(self):
         """Очистка ресурсов"""
@@ -450,9 +568,9 @@ async def main():
     try:
         await bot.start_scheduler()
         
-        # Тестовая отправка при первом запуске
+        # Досылаем прерванную рассылку и отправляем тест (один раз за день)
         logger.info("🧪 Отправка тестового сообщения...")
-        await bot.test_send()
+        await bot.startup()
         
         logger.info("✅ Бот успешно запущен и работает!")
         logger.info("💤 Ожидание запланированных задач...")
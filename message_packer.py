@@ -0,0 +1,150 @@
+import logging
+import os
+from typing import Dict, List, Tuple
+
+from text_escape import format_message
+
+logger = logging.getLogger(__name__)
+
+# Лимит длины сообщения Telegram (считается в единицах UTF-16)
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Пометки продолжения в разметке бота; переводятся в режим разметки при делении
+CONTINUED_MARKER = "\n\n➡️ _продолжение следует_"
+CONTINUATION_MARKER = "↪️ _продолжение_\n\n"
+COMPACT_SEPARATOR = "\n\n"
+
+# Разметка, которой бот оборачивает целые абзацы (анализ, коды): Markdown и теги HTML
+WRAPPERS: Tuple[Tuple[str, str], ...] = (
+    ("**", "**"), ("_", "_"), ("`", "`"), ("*", "*"),
+    ("<b>", "</b>"), ("<i>", "</i>"), ("<code>", "</code>"),
+)
+
+
+def telegram_length(text: str) -> int:
+    """Длина текста так, как ее считает Telegram: эмодзи вне BMP занимают две единицы"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _wrapper(paragraph: str) -> Tuple[str, str]:
+    for opening, closing in WRAPPERS:
+        inner = paragraph[len(opening):-len(closing)]
+        if len(paragraph) > len(opening) + len(closing) and paragraph.startswith(opening) \
+                and paragraph.endswith(closing) and opening not in inner and closing not in inner:
+            return opening, closing
+    return "", ""
+
+
+def _split_words(text: str, limit: int) -> List[str]:
+    """Режет текст по пробелам (слово длиннее лимита — посимвольно)"""
+    chunks, current = [], ""
+    for word in text.split(" "):
+        candidate = f"{current} {word}" if current else word
+        if telegram_length(candidate) <= limit:
+            current = candidate
+            continue
+        if current:
+            chunks.append(current)
+        while telegram_length(word) > limit:
+            cut = limit
+            while telegram_length(word[:cut]) > limit:
+                cut -= 1
+            chunks.append(word[:cut])
+            word = word[cut:]
+        current = word
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_paragraph(paragraph: str, limit: int) -> List[str]:
+    """Абзац длиннее лимита: по строкам, затем по словам; разметка абзаца повторяется в каждом куске"""
+    if telegram_length(paragraph) <= limit:
+        return [paragraph]
+    lines = paragraph.split("\n")
+    if len(lines) > 1:
+        return [piece for line in lines for piece in _split_paragraph(line, limit)]
+    opening, closing = _wrapper(paragraph)
+    inner = paragraph[len(opening):len(paragraph) - len(closing)]
+    budget = limit - telegram_length(opening) - telegram_length(closing)
+    return [f"{opening}{chunk}{closing}" for chunk in _split_words(inner, budget)]
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT, parse_mode: str = 'Markdown') -> List[str]:
+    """Делит сообщение длиннее limit по границам абзацев с пометками продолжения"""
+    if telegram_length(text) <= limit:
+        return [text]
+    continued = format_message(CONTINUED_MARKER, parse_mode)
+    continuation = format_message(CONTINUATION_MARKER, parse_mode)
+    # Запас под пометки, чтобы кусок с ними тоже уложился в лимит
+    budget = limit - telegram_length(continued) - telegram_length(continuation)
+    paragraphs = [piece for paragraph in text.split("\n\n") for piece in _split_paragraph(paragraph, budget)]
+
+    parts, current = [], ""
+    for paragraph in paragraphs:
+        candidate = f"{current}\n\n{paragraph}" if current else paragraph
+        if current and telegram_length(candidate) > budget:
+            parts.append(current)
+            current = paragraph
+        else:
+            current = candidate
+    if current:
+        parts.append(current)
+
+    return [
+        (continuation if index else "") + part + (continued if index < len(parts) - 1 else "")
+        for index, part in enumerate(parts)
+    ]
+
+
+class MessagePacker:
+    """Упаковка серии сообщений рассылки под лимит Telegram.
+
+    Сообщение длиннее лимита делится по абзацам с пометками продолжения. В
+    компактном режиме соседние сообщения серии (заголовок, прогнозы, итог)
+    склеиваются, пока помещаются в одно сообщение, — меньше вызовов API.
+    """
+
+    def __init__(self, limit: int = TELEGRAM_MESSAGE_LIMIT, compact: bool = False, parse_mode: str = 'Markdown'):
+        self.limit = limit
+        self.compact = compact
+        self.parse_mode = parse_mode
+        self.stats = {'messages_in': 0, 'messages_out': 0, 'split': 0, 'merged': 0}
+
+    @classmethod
+    def from_env(cls) -> "MessagePacker":
+        """Режим из TELEGRAM_COMPACT (1/true/yes), лимит из TELEGRAM_MESSAGE_LIMIT, разметка из TELEGRAM_PARSE_MODE"""
+        return cls(
+            limit=int(os.getenv('TELEGRAM_MESSAGE_LIMIT', str(TELEGRAM_MESSAGE_LIMIT))),
+            compact=str(os.getenv('TELEGRAM_COMPACT', '0')).lower() in ['1', 'true', 'yes'],
+            parse_mode=os.getenv('TELEGRAM_PARSE_MODE', 'Markdown')
+        )
+
+    def pack(self, messages: List[str]) -> List[str]:
+        """Серия сообщений, готовая к отправке: без превышений лимита, в compact — склеенная"""
+        parts = []
+        for message in messages:
+            pieces = split_message(message, self.limit, self.parse_mode)
+            if len(pieces) > 1:
+                self.stats['split'] += 1
+                logger.info(f"✂️ Сообщение длиной {telegram_length(message)} разделено на {len(pieces)} части")
+            parts.extend(pieces)
+
+        packed = self._merge(parts) if self.compact else parts
+        self.stats['messages_in'] += len(messages)
+        self.stats['messages_out'] += len(packed)
+        self.stats['merged'] += len(parts) - len(packed)
+        return packed
+
+    def _merge(self, parts: List[str]) -> List[str]:
+        merged = []
+        for part in parts:
+            if merged and telegram_length(merged[-1] + COMPACT_SEPARATOR + part) <= self.limit:
+                merged[-1] += COMPACT_SEPARATOR + part
+            else:
+                merged.append(part)
+        return merged
+
+    def get_stats(self) -> Dict:
+        """Сколько вызовов API сэкономлено (отрицательно — если деления было больше)"""
+        return dict(self.stats, compact=self.compact, api_calls_saved=self.stats['messages_in'] - self.stats['messages_out'])
@@ -0,0 +1,194 @@
+import os
+import random
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import pytz
+
+from text_escape import compile_template, escape_cached, format_message, get_markup
+
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+
+SEPARATOR = "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
+
+# Эмодзи для разных видов спорта
+SPORT_EMOJI = {
+    "Футбол": "⚽",
+    "Баскетбол": "🏀",
+    "Теннис": "🎾",
+    "Хоккей": "🏒"
+}
+
+# Рейтинг на основе уверенности: (порог, рейтинг, эмодзи заголовка) от высокого к низкому
+CONFIDENCE_RATINGS = (
+    (85, "🌟🌟🌟 ВЫСОКИЙ", "🔥"),
+    (70, "🌟🌟 СРЕДНИЙ", "💪"),
+    (0, "🌟 ОСТОРОЖНО", "⚠️"),
+)
+
+SOURCE_LABELS = {'perplexity': "🔥 LIVE ДАННЫЕ"}
+DEFAULT_SOURCE_LABEL = "📊 АНАЛИТИЧЕСКИЕ ДАННЫЕ"
+
+# Время матча, если источник его не дал
+FALLBACK_TIMES = (
+    "15:00 МСК", "16:30 МСК", "17:30 МСК", "19:00 МСК",
+    "20:00 МСК", "21:45 МСК", "22:30 МСК"
+)
+
+FALLBACK_ANALYSIS = (
+    "Аналитическая сводка: домашняя/выездная форма, личные встречи, кадровая ситуация и мотивация "
+    "дают умеренное преимущество выбранному исходу. Коэффициент соответствует оценке риска."
+)
+
+FALLBACK_FACTORS = (
+    "Домашнее преимущество в статистике последних матчей",
+    "Текущая форма команды показывает стабильность",
+    "Анализ личных встреч указывает на преимущество"
+)
+
+# Шаблон сообщения в разметке бота; компилируется под режим разметки один раз
+PREDICTION_TEMPLATE = (
+    "🏆 **ЭКСПЕРТНЫЙ ПРОГНОЗ #{index}** {confidence_emoji!raw}\n"
+    "📅 {date} | 🕘 {time} МСК\n\n"
+    + SEPARATOR + "\n\n"
+    "🏟️ **{sport_emoji!raw} {sport}** • {league}\n"
+    "⚔️ **{match}**\n"
+    "🕐 **Время:** {match_time}\n\n"
+    "📈 **ПРОГНОЗ:** `{prediction}`\n"
+    "💰 **Коэффициент:** `{odds}`\n"
+    "🎯 **Уверенность:** `{confidence}%`\n"
+    "⭐️ **Рейтинг:** {rating}\n\n"
+    "{source_label}\n\n"
+    + SEPARATOR + "\n\n"
+    "📋 **ПРОФЕССИОНАЛЬНЫЙ АНАЛИЗ:**\n\n"
+    "_{analysis!once}_\n\n"
+    "🔑 **КЛЮЧЕВЫЕ ФАКТОРЫ:**\n"
+    "{factors!raw}"
+    "\n" + SEPARATOR + "\n"
+    "{footer_lines}"
+    "\n\n🤖 *Сгенерировано: {time} МСК*"
+)
+FACTOR_TEMPLATE = "`{number}.` {factor!raw}\n"
+FOOTER_LINES = (
+    "📊 *Статистика точности: 78% за месяц*",
+    "⚠️ *Помните: ставки связаны с рисками*",
+    "🍀 *Удачных ставок!*",
+)
+
+
+class MoscowClock:
+    """Дата и время по Москве для сообщений; строки пересчитываются раз в минуту"""
+
+    def __init__(self):
+        self._minute = None
+        self._stamp: Tuple[str, str] = ("", "")
+
+    def stamp(self, moment: Optional[datetime] = None) -> Tuple[str, str]:
+        """(дата, время) для moment или для текущей минуты"""
+        if moment is not None:
+            return moment.strftime("%d.%m.%Y"), moment.strftime("%H:%M")
+        minute = int(time.time() // 60)
+        if minute != self._minute:
+            now = datetime.now(MOSCOW_TZ)
+            self._stamp = (now.strftime("%d.%m.%Y"), now.strftime("%H:%M"))
+            self._minute = minute
+        return self._stamp
+
+
+class PredictionRenderer:
+    """Общий рендер сообщения с прогнозом для всех ботов.
+
+    Шаблон компилируется под режим разметки (Markdown, MarkdownV2, HTML) один
+    раз, таблицы эмодзи и часовой пояс готовятся заранее, поля экранируются по
+    готовым таблицам text_escape за один проход, сообщение собирается одним join. analyzer
+    (SportsAnalyzer) нужен для запасного анализа и добора ключевых факторов;
+    extra_lines — строки бота перед подписью (например, источник данных).
+    """
+
+    def __init__(self, analyzer=None, extra_lines: Sequence[str] = (), clock: Optional[MoscowClock] = None,
+                 parse_mode: str = 'Markdown'):
+        self.analyzer = analyzer
+        self.clock = clock or MoscowClock()
+        self.parse_mode = parse_mode
+        self.markup = get_markup(parse_mode)
+        footer_lines = "\n".join(FOOTER_LINES[:1] + tuple(extra_lines) + FOOTER_LINES[1:])
+        self._template = compile_template(PREDICTION_TEMPLATE.replace("{footer_lines}", footer_lines), parse_mode)
+        # Строка фактора = готовые префикс и суффикс номера + экранированный фактор
+        factor_template = compile_template(FACTOR_TEMPLATE, parse_mode)
+        self._factor_affixes = [
+            tuple(factor_template.render({'number': number, 'factor': '\0'}).split('\0'))
+            for number in range(1, 6)
+        ]
+
+    @classmethod
+    def from_env(cls, analyzer=None, extra_lines: Sequence[str] = ()) -> "PredictionRenderer":
+        """Режим разметки из TELEGRAM_PARSE_MODE (Markdown, MarkdownV2, HTML)"""
+        return cls(analyzer, extra_lines=extra_lines, parse_mode=os.getenv('TELEGRAM_PARSE_MODE', 'Markdown'))
+
+    def format(self, template: str, **values) -> str:
+        """Произвольный шаблон бота (заголовок, итог) в режиме разметки рендера"""
+        return format_message(template, self.parse_mode, **values)
+
+    def render(self, pred, index: int, moment: Optional[datetime] = None) -> str:
+        """Сообщение с одним прогнозом; moment — время в сообщении (по умолчанию — сейчас)"""
+        return self._render(pred, index, self.clock.stamp(moment))
+
+    def render_many(self, predictions: Iterable, start: int = 1, moment: Optional[datetime] = None) -> List[str]:
+        """Сообщения для серии прогнозов с номерами от start; время берется один раз на серию"""
+        stamp = self.clock.stamp(moment)
+        return [self._render(pred, index, stamp) for index, pred in enumerate(predictions, start)]
+
+    def _render(self, pred, index: int, stamp: Tuple[str, str]) -> str:
+        date_str, time_str = stamp
+        confidence = pred.confidence
+        rating, confidence_emoji = next((r, e) for threshold, r, e in CONFIDENCE_RATINGS if confidence >= threshold)
+        # Факторы часто повторяются из общего пула — их экранирование кэшируется
+        factors = "".join(
+            prefix + escape_cached(factor, self.parse_mode) + suffix
+            for (prefix, suffix), factor in zip(self._factor_affixes, self._factors(pred))
+        )
+        return self._template.render({
+            'index': index,
+            'confidence_emoji': confidence_emoji,
+            'date': date_str,
+            'time': time_str,
+            'sport_emoji': SPORT_EMOJI.get(pred.sport, "🏆"),
+            'sport': pred.sport,
+            'league': pred.league,
+            'match': pred.match,
+            'match_time': getattr(pred, 'time', None) or random.choice(FALLBACK_TIMES),
+            'prediction': pred.prediction,
+            'odds': pred.odds,
+            'confidence': confidence,
+            'rating': rating,
+            'source_label': SOURCE_LABELS.get(getattr(pred, 'source', 'mock'), DEFAULT_SOURCE_LABEL),
+            'analysis': self._analysis(pred),
+            'factors': factors,
+        })
+
+    def _analysis(self, pred) -> str:
+        # Анализ идет внутри курсива: вложенный **жирный** Telegram не поддерживает, убираем маркеры
+        analysis_text = (getattr(pred, 'analysis', '') or "").strip().replace("**", "")
+        if analysis_text and "временно недоступен" not in analysis_text.lower():
+            return analysis_text
+        # Надежный локальный фолбэк анализа
+        try:
+            return self.analyzer.generate_analysis(pred.sport, pred.prediction)
+        except Exception:
+            return FALLBACK_ANALYSIS
+
+    def _factors(self, pred) -> List[str]:
+        # Гарантируем минимум 3 фактора без пустых строк, показываем не больше 5
+        factors = [factor for factor in (getattr(pred, 'key_factors', None) or []) if factor and factor.strip()]
+        if len(factors) < 3:
+            try:
+                pool = [extra for extra in self.analyzer.key_factors_pool
+                        if extra and extra.strip() and extra not in factors]
+                factors += random.sample(pool, min(3 - len(factors), len(pool)))
+            except Exception:
+                pass
+        if len(factors) < 3:
+            # Минимальный резерв, если analyzer не доступен по какой-то причине
+            factors += [factor for factor in FALLBACK_FACTORS if factor not in factors][:3 - len(factors)]
+        return factors[:5]
@@ -0,0 +1,112 @@
+import logging
+import math
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Модели от быстрой к медленной: при нехватке времени спускаемся влево
+MODEL_TIERS = ["sonar", "sonar-pro", "sonar-reasoning", "sonar-reasoning-pro"]
+
+# Ожидаемая задержка (секунды), пока по модели не накопилось наблюдений
+DEFAULT_LATENCY_PRIORS = {
+    "sonar": 6.0,
+    "sonar-pro": 12.0,
+    "sonar-reasoning": 20.0,
+    "sonar-reasoning-pro": 30.0,
+}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Перцентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class ModelRouter:
+    """Выбор модели Perplexity по задержке.
+
+    Для каждой модели хранит последние задержки успешных запросов и считает
+    p50/p95. Запрос идет в предпочтительную модель, если ее p95 укладывается в
+    бюджет — меньшее из SLO и остатка дедлайна запуска. Иначе роутер спускается
+    к более быстрым моделям; если не укладывается ни одна, берет самую быструю.
+    Модели с разомкнутой цепью пропускаются.
+    """
+
+    def __init__(self, slo_seconds: Optional[float] = None, window: int = 50, min_samples: int = 5,
+                 tiers: Optional[List[str]] = None, priors: Optional[Dict[str, float]] = None,
+                 is_available: Optional[Callable[[str], bool]] = None):
+        self.slo_seconds = slo_seconds
+        self.window = window
+        self.min_samples = min_samples
+        self.tiers = tiers or MODEL_TIERS
+        self.priors = dict(DEFAULT_LATENCY_PRIORS, **(priors or {}))
+        self.is_available = is_available
+        self._latencies: Dict[str, Deque[float]] = {}
+        self.stats = {'routed': 0, 'downgraded': 0}
+
+    @classmethod
+    def from_env(cls, is_available: Optional[Callable[[str], bool]] = None) -> "ModelRouter":
+        """Создает роутер из PERPLEXITY_LATENCY_SLO (секунды, 0 — без SLO) и PERPLEXITY_ROUTER_WINDOW"""
+        slo = float(os.getenv('PERPLEXITY_LATENCY_SLO', '0') or 0)
+        return cls(
+            slo_seconds=slo if slo > 0 else None,
+            window=int(os.getenv('PERPLEXITY_ROUTER_WINDOW', '50')),
+            is_available=is_available
+        )
+
+    def record(self, model: str, latency: float):
+        """Учитывает задержку успешного запроса"""
+        if model not in self._latencies:
+            self._latencies[model] = deque(maxlen=self.window)
+        self._latencies[model].append(latency)
+
+    def latency(self, model: str, fraction: float) -> float:
+        """Перцентиль задержки модели; без наблюдений — априорная оценка"""
+        samples = self._latencies.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return self.priors.get(model, max(self.priors.values()))
+        return percentile(list(samples), fraction)
+
+    def choose(self, preferred: str, deadline: Optional[float] = None) -> str:
+        """Модель для запроса с учетом SLO и абсолютного дедлайна по time.monotonic()"""
+        budget = self.slo_seconds
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            budget = remaining if budget is None else min(budget, remaining)
+
+        if preferred not in self.tiers:
+            return preferred
+
+        # Кандидаты: предпочтительная модель и все более быстрые
+        candidates = self.tiers[:self.tiers.index(preferred) + 1][::-1]
+        if self.is_available:
+            # Если разомкнуто все, оставляем предпочтительную — выключатель сам отдаст фолбэк
+            candidates = [model for model in candidates if self.is_available(model)] or candidates[:1]
+
+        self.stats['routed'] += 1
+        if budget is None:
+            chosen = candidates[0]
+        else:
+            chosen = next((model for model in candidates if self.latency(model, 0.95) <= budget), candidates[-1])
+
+        if chosen != preferred:
+            self.stats['downgraded'] += 1
+            budget_text = f"{budget:.1f} с" if budget is not None else "без ограничения"
+            logger.info(f"🧭 {preferred} → {chosen}: бюджет {budget_text}, "
+                        f"p95 {preferred} = {self.latency(preferred, 0.95):.1f} с")
+        return chosen
+
+    def get_stats(self) -> Dict:
+        """p50/p95 по моделям и число понижений для /status"""
+        models = {}
+        for model in self.tiers:
+            samples = self._latencies.get(model)
+            models[model] = {
+                'samples': len(samples) if samples else 0,
+                'p50': round(self.latency(model, 0.5), 3),
+                'p95': round(self.latency(model, 0.95), 3)
+            }
+        return dict(self.stats, slo_seconds=self.slo_seconds, models=models)
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Запись в очереди: ключ идемпотентности, текст и аргументы send_message
+OutboxEntry = Tuple[str, str, Dict]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    key TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    message_id INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (status, run_id, chat_id, position);
+"""
+
+
+def outbox_key(run_id: str, chat_id, position: int) -> str:
+    """Ключ идемпотентности сообщения: запуск, чат и позиция в серии"""
+    return f"{run_id}|{chat_id}|{position}"
+
+
+class OutboxStore:
+    """Журнал исходящих сообщений Telegram в SQLite.
+
+    Перед отправкой вся серия запуска записывается со статусом pending, после
+    каждого send_message статус фиксируется (sent или failed). Повторная запись
+    того же ключа игнорируется, поэтому запуск с тем же run_id не дублирует уже
+    отправленное, а после перезапуска процесса resume-очередь продолжает серию
+    ровно с первого неотправленного сообщения.
+
+    Прогнозы устаревают, поэтому неотправленное старше pending_ttl секунд не
+    досылается: такие записи получают статус expired и удаляются вместе с
+    остальными через keep_seconds.
+    """
+
+    def __init__(self, path: str = ':memory:', keep_seconds: float = 7 * 24 * 3600,
+                 pending_ttl: float = 6 * 3600):
+        self.path = path
+        self.keep_seconds = keep_seconds
+        self.pending_ttl = pending_ttl
+        if path != ':memory:':
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._cleanup()
+
+    @classmethod
+    def from_env(cls) -> Optional["OutboxStore"]:
+        """Журнал из TELEGRAM_OUTBOX_PATH (пустое значение — без журнала) и TELEGRAM_OUTBOX_PENDING_TTL"""
+        path = os.getenv('TELEGRAM_OUTBOX_PATH', '.cache/telegram_outbox.sqlite3')
+        if not path:
+            return None
+        try:
+            return cls(path, pending_ttl=float(os.getenv('TELEGRAM_OUTBOX_PENDING_TTL', str(6 * 3600))))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Журнал отправки недоступен ({path}): {e}")
+            return None
+
+    def _cleanup(self):
+        self.expire()
+        self._db.execute("DELETE FROM outbox WHERE status != 'pending' AND updated_at < ?",
+                         (time.time() - self.keep_seconds,))
+
+    def expire(self) -> int:
+        """Помечает expired неотправленные сообщения старше pending_ttl; возвращает их число"""
+        now = time.time()
+        expired = self._db.execute(
+            "UPDATE outbox SET status = 'expired', updated_at = ? WHERE status = 'pending' AND created_at < ?",
+            (now, now - self.pending_ttl)
+        ).rowcount
+        if expired:
+            logger.info(f"🗑️ Журнал отправки: {expired} устаревших сообщений не будут досланы")
+        return expired
+
+    def has_run(self, run_id: str) -> bool:
+        """Записан ли уже запуск с таким run_id"""
+        return self._db.execute("SELECT 1 FROM outbox WHERE run_id = ? LIMIT 1", (run_id,)).fetchone() is not None
+
+    def enqueue(self, run_id: str, batches: Dict[str, List[str]], options: Dict) -> Dict[str, List[OutboxEntry]]:
+        """Записывает серии запуска и возвращает то, что в них еще не отправлено"""
+        now = time.time()
+        rows = [
+            (outbox_key(run_id, chat_id, position), run_id, str(chat_id), position, text,
+             json.dumps(options, ensure_ascii=False), now, now)
+            for chat_id, messages in batches.items()
+            for position, text in enumerate(messages, 1)
+        ]
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO outbox (key, run_id, chat_id, position, text, options, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return self.pending(run_id)
+
+    def pending(self, run_id: Optional[str] = None) -> Dict[str, List[OutboxEntry]]:
+        """Неотправленные сообщения по чатам в порядке серии (все запуски или один), не старше pending_ttl"""
+        query = "SELECT key, chat_id, text, options FROM outbox WHERE status = 'pending' AND created_at >= ?"
+        params: Tuple = (time.time() - self.pending_ttl,)
+        if run_id is not None:
+            query += " AND run_id = ?"
+            params += (run_id,)
+        query += " ORDER BY created_at, run_id, chat_id, position"
+        batches: Dict[str, List[OutboxEntry]] = {}
+        for key, chat_id, text, options in self._db.execute(query, params):
+            batches.setdefault(chat_id, []).append((key, text, json.loads(options)))
+        return batches
+
+    def mark_sent(self, key: str, message_id: Optional[int] = None):
+        self._db.execute("UPDATE outbox SET status = 'sent', message_id = ?, updated_at = ? WHERE key = ?",
+                         (message_id, time.time(), key))
+
+    def mark_failed(self, key: str, error: str):
+        self._db.execute("UPDATE outbox SET status = 'failed', error = ?, updated_at = ? WHERE key = ?",
+                         (error[:500], time.time(), key))
+
+    def get_stats(self) -> Dict:
+        """Число сообщений журнала по статусам"""
+        counts = dict(self._db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ('pending', 'sent', 'failed', 'expired')}
+
+    def close(self):
+        self._db.close()
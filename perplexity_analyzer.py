@@ -2,248 +2,602 @@ import asyncio
 import aiohttp
 import json
 import logging
-from typing import List, Dict, Optional
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 import pytz
 import os
+from urllib.parse import urlsplit
+from rate_limiter import RateLimiter, estimate_tokens, parse_retry_after
+from response_cache import ResponseCache
+from circuit_breaker import CircuitBreaker
+from prompt_registry import PROMPTS, RenderedPrompt, format_ru_date, prompt_budget_from_env
+from usage_tracker import UsageTracker, current_run_id
+from model_router import ModelRouter
+from confidence_scorer import ConfidenceScorer
+from analysis_extractor import extract_analysis
+from response_parser import STREAM_STOP_FIELDS, PredictionStreamParser, parse_matches, parse_prediction
 
 logger = logging.getLogger(__name__)
 
+# JSON-схема прогноза для режима структурированного ответа (response_format)
+PREDICTION_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sport": {"type": "string"},
+        "league": {"type": "string"},
+        "match": {"type": "string"},
+        "time": {"type": "string"},
+        "prediction": {"type": "string"},
+        "odds": {"type": "string"},
+        "confidence": {"type": "integer", "minimum": 0, "maximum": 100},
+        "analysis": {"type": "string"},
+        "key_factors": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["sport", "league", "match", "time", "prediction", "odds",
+                 "confidence", "analysis", "key_factors"]
+}
+
+JSON_OUTPUT_INSTRUCTION = """
+🧾 ВЕРНИ ОТВЕТ СТРОГО ОДНИМ JSON-ОБЪЕКТОМ без пояснений: sport=СПОРТ, league=ЛИГА, match=МАТЧ,
+time=ВРЕМЯ, prediction=ПРОГНОЗ, odds=КОЭФФИЦИЕНТ (строка), confidence=УВЕРЕННОСТЬ (целое число),
+analysis=АНАЛИЗ (можно в несколько абзацев), key_factors=ФАКТОРЫ (массив из 3 строк).
+"""
+
+# Пакетный режим: несколько прогнозов в одном ответе
+BATCH_PREDICTION_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "predictions": {"type": "array", "items": PREDICTION_JSON_SCHEMA}
+    },
+    "required": ["predictions"]
+}
+
+BATCH_JSON_OUTPUT_INSTRUCTION = """
+🧾 ВЕРНИ ОТВЕТ СТРОГО ОДНИМ JSON-ОБЪЕКТОМ {"predictions": [...]} без пояснений — по одному элементу
+на каждый прогноз в том же порядке. Поля элемента: sport=СПОРТ, league=ЛИГА, match=МАТЧ, time=ВРЕМЯ,
+prediction=ПРОГНОЗ, odds=КОЭФФИЦИЕНТ (строка), confidence=УВЕРЕННОСТЬ (целое число), analysis=АНАЛИЗ,
+key_factors=ФАКТОРЫ (массив из 3 строк).
+"""
+
+BATCH_SECTION_RE = re.compile(r'^[ \t#*=]*ПРОГНОЗ\s*№?\s*(\d+)[ \t#*=:]*$', re.MULTILINE | re.IGNORECASE)
+
+# Лимит ответа на один прогноз; пакетный запрос получает его на каждый пункт
+PREDICTION_MAX_TOKENS = 1000
+# Доля дедлайна на пакетный запрос — остаток нужен для повторов неразобранных пунктов
+BATCH_DEADLINE_SHARE = 0.7
+
+class SingleFlight:
+    """Объединяет одновременные одинаковые вызовы в один общий запрос.
+
+    Первый вызов с ключом запускает задачу, остальные ждут ее же результат.
+    Задача отменяется, только если отменены все ожидающие ее вызовы.
+
+    У каждого вызова свой дедлайн (time.monotonic()): присоединиться можно только
+    к задаче, у которой бюджет не меньше своего, иначе запускается новая задача
+    с этим ключом. Дождаться результата вызов пытается лишь до своего дедлайна,
+    после чего получает None, как при неудачном запросе.
+    """
+    
+    def __init__(self):
+        self._calls: Dict[str, list] = {}
+        self.stats = {'calls': 0, 'deduplicated': 0, 'deadline_exceeded': 0}
+    
+    async def do(self, key: str, factory, deadline: Optional[float] = None):
+        """Выполняет factory() или присоединяется к уже идущему вызову с тем же ключом"""
+        self.stats['calls'] += 1
+        entry = self._calls.get(key)
+        if entry is None or not self._covers(entry[2], deadline):
+            task = asyncio.ensure_future(factory())
+            entry = [task, 0, deadline]
+            self._calls[key] = entry
+            task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is entry else None)
+        else:
+            self.stats['deduplicated'] += 1
+            logger.info("🔗 Одинаковый запрос уже выполняется — ждем его результат")
+        
+        task = entry[0]
+        entry[1] += 1
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self.stats['deadline_exceeded'] += 1
+            logger.warning("⏰ Общий запрос не успел к дедлайну этого вызова")
+            self._release(entry)
+            return None
+        except asyncio.CancelledError:
+            self._release(entry)
+            raise
+        finally:
+            entry[1] -= 1
+    
+    @staticmethod
+    def _covers(flight_deadline: Optional[float], deadline: Optional[float]) -> bool:
+        """Успеет ли идущая задача с flight_deadline к дедлайну нового вызова"""
+        if flight_deadline is None:
+            return True
+        return deadline is not None and flight_deadline >= deadline
+    
+    @staticmethod
+    def _release(entry: list):
+        # Последний ожидающий ушел — общий запрос больше никому не нужен
+        if entry[1] == 1 and not entry[0].done():
+            entry[0].cancel()
+    
+    def get_stats(self) -> Dict:
+        """Сколько вызовов было и сколько из них объединено"""
+        return dict(self.stats, in_flight=len(self._calls))
+
+@dataclass
+class RetryPolicy:
+    """Политика повторов: экспоненциальная задержка с полным джиттером"""
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    retry_statuses: Tuple[int, ...] = (429, 500, 502, 503, 504)
+    
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """Создает политику из PERPLEXITY_MAX_ATTEMPTS / PERPLEXITY_RETRY_BASE / PERPLEXITY_RETRY_MAX"""
+        return cls(
+            max_attempts=max(1, int(os.getenv('PERPLEXITY_MAX_ATTEMPTS', '3'))),
+            base_delay=float(os.getenv('PERPLEXITY_RETRY_BASE', '0.5')),
+            max_delay=float(os.getenv('PERPLEXITY_RETRY_MAX', '8'))
+        )
+    
+    def backoff(self, attempt: int) -> float:
+        """Задержка перед следующей попыткой (full jitter)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
 class PerplexityAPI:
     """Класс для работы с Perplexity API для получения реальных спортивных данных"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, rate_limiter: Optional[RateLimiter] = None,
+                 cache: Optional[ResponseCache] = None, retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 usage_tracker: Optional[UsageTracker] = None):
         self.api_key = api_key
         self.base_url = "https://api.perplexity.ai/chat/completions"
         self.session = None
+        # Общий лимитер RPM/TPM: параллельные генерации не выходят за лимиты аккаунта
+        self.rate_limiter = rate_limiter or RateLimiter.from_env()
+        # Повторы при таймаутах, обрывах соединения и ответах 5xx/429
+        self.retry_policy = retry_policy or RetryPolicy.from_env()
+        # Когда Perplexity лежит, не ждем таймаутов — сразу уходим на фолбэк
+        self.circuit_breaker = circuit_breaker or CircuitBreaker.from_env()
+        # Настройки пула соединений: keep-alive должен пережить паузу между прогревом и запуском
+        self.pool_size = int(os.getenv('PERPLEXITY_POOL_SIZE', '10'))
+        self.pool_per_host = int(os.getenv('PERPLEXITY_POOL_PER_HOST', '10'))
+        self.keepalive_timeout = float(os.getenv('PERPLEXITY_KEEPALIVE', '120'))
+        self.dns_cache_ttl = int(os.getenv('PERPLEXITY_DNS_TTL', '600'))
+        self.warmup_connections = int(os.getenv('PERPLEXITY_WARMUP_CONNECTIONS', '3'))
+        # Кэш ответов на день (None — кэш отключен через PERPLEXITY_CACHE=0)
+        self.cache = cache if cache is not None else ResponseCache.from_env()
+        # Одинаковые одновременные запросы (/test поверх крона) идут одним HTTP-вызовом
+        self.single_flight = SingleFlight()
+        # Бюджет токенов промпта при заданной целевой задержке (None — без обрезки)
+        self.prompt_budget = prompt_budget_from_env()
+        # Токены, задержки и повторы по моделям, типам запросов, запускам и дням
+        self.usage = usage_tracker or UsageTracker.from_env()
+        # Выбор модели по p95 задержки, SLO и остатку дедлайна; модели с разомкнутой цепью пропускаются
+        self.router = ModelRouter.from_env(is_available=lambda name: not self.circuit_breaker.is_open(name))
+        # Хеджирование: если ответа нет дольше p90 модели, параллельно отправляем второй такой же запрос
+        self.hedging = str(os.getenv('PERPLEXITY_HEDGE', '0')).lower() in ['1', 'true', 'yes']
+        self.hedge_max_per_run = int(os.getenv('PERPLEXITY_HEDGE_MAX_PER_RUN', '2'))
+        self._hedges_per_run: Dict[str, int] = {}
+        self.hedge_stats = {'launched': 0, 'helped': 0, 'capped': 0}
+        # Оценка уверенности по ключевым словам анализа за один проход
+        self.confidence_scorer = ConfidenceScorer()
     
     async def get_session(self):
         """Получает aiohttp сессию"""
         if not self.session:
             timeout = aiohttp.ClientTimeout(total=30)  # 30 секунд таймаут
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_ttl
+            )
             self.session = aiohttp.ClientSession(
                 headers={
                     "Authorization": f"Bearer {self.api_key}",
                     "Content-Type": "application/json",
                     "Accept": "application/json"
                 },
-                timeout=timeout
+                timeout=timeout,
+                connector=connector
             )
         return self.session
     
+    async def warm_up(self, connections: Optional[int] = None) -> int:
+        """Заранее открывает соединения пула (DNS + TLS), чтобы плановый запуск их переиспользовал"""
+        session = await self.get_session()
+        count = connections or self.warmup_connections
+        parts = urlsplit(self.base_url)
+        origin = f"{parts.scheme}://{parts.netloc}/"
+        
+        async def _open_connection() -> bool:
+            try:
+                async with session.get(origin, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                    await response.read()  # Дочитываем ответ, чтобы соединение вернулось в пул
+                    return True
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось прогреть соединение с Perplexity: {e}")
+                return False
+        
+        results = await asyncio.gather(*(_open_connection() for _ in range(count)))
+        opened = sum(results)
+        logger.info(f"🔥 Прогрев Perplexity: открыто {opened}/{count} соединений")
+        return opened
+    
     async def close_session(self):
         """Закрывает aiohttp сессию"""
         if self.session:
             await self.session.close()
             self.session = None
     
-    async def search_sports_data(self, query: str, model: str = "sonar-pro") -> Optional[Dict]:
-        """Выполняет поиск спортивных данных через Perplexity"""
+    def get_stats(self) -> Dict:
+        """Статистика клиента для мониторинга (/status)"""
+        return {
+            'rate_limiter': self.rate_limiter.get_stats(),
+            'cache': self.cache.get_stats() if self.cache else None,
+            'single_flight': self.single_flight.get_stats(),
+            'circuit_breaker': self.circuit_breaker.get_stats(),
+            'router': self.router.get_stats(),
+            'hedging': dict(self.hedge_stats, enabled=self.hedging, max_per_run=self.hedge_max_per_run)
+        }
+    
+    async def search_sports_data(self, query: str, model: str = "sonar-pro",
+                                 cache_kind: Optional[str] = None,
+                                 deadline: Optional[float] = None,
+                                 stream: bool = False,
+                                 stop_fields: Optional[List[str]] = None,
+                                 response_format: Optional[Dict] = None,
+                                 system: Optional[str] = None,
+                                 max_tokens: int = PREDICTION_MAX_TOKENS) -> Optional[Dict]:
+        """Выполняет поиск спортивных данных через Perplexity
+
+        cache_kind — тип запроса для кэша ответов ('matches', 'prediction', ...);
+        без него ответ не кэшируется. deadline — абсолютный момент по
+        time.monotonic(), после которого новые попытки не делаются.
+        stream — получать ответ потоком (SSE); если заданы stop_fields, генерация
+        обрывается, как только все эти поля пришли целиком.
+        response_format — структурированный вывод (например, JSON-схема).
+        system — статичные инструкции отдельным системным сообщением.
+        max_tokens — лимит длины ответа (для пакета — на все пункты сразу).
+        model — предпочтительная модель; роутер может заменить ее более быстрой,
+        если ее p95 не укладывается в SLO или остаток дедлайна. Кэш ведется по
+        предпочтительной модели, так что пониженный запрос берет уже готовый ответ,
+        а его ответ отдается следующим запросам к той же модели.
+        В ответе под ключом '_meta' лежат число попыток и задержка каждой из них.
+        """
+        cache_prompt = self._cache_prompt(query, system, stop_fields if stream else None)
+        if cache_kind and self.cache:
+            cached = self.cache.get(model, cache_prompt)
+            if cached is not None:
+                cached = dict(cached)
+                # Ответ мог дать пониженный роутером запрос — в _meta пишем модель, которая ответила
+                served = cached.pop('_model', model)
+                logger.info(f"💾 Ответ Perplexity взят из кэша ({cache_kind})")
+                self.usage.record(served, cache_kind, latency=0.0, attempts=0, cache_hit=True, ok=True)
+                return dict(cached, _meta={'attempts': 0, 'attempt_latencies': [], 'latency': 0.0,
+                                           'model': served, 'cache_hit': True})
+        
+        requested = model
+        model = self.router.choose(model, deadline)
+        
+        payload = {
+            "model": model,
+            "messages": ([{"role": "system", "content": system}] if system else []) + [
+                {
+                    "role": "user",
+                    "content": query
+                }
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.3,
+            "top_p": 0.9
+        }
+        if stream:
+            payload["stream"] = True
+        if response_format:
+            payload["response_format"] = response_format
+        
+        flight_key = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return await self.single_flight.do(
+            flight_key,
+            lambda: self._execute_request(payload, cache_prompt, model, cache_kind, deadline, stop_fields,
+                                          cache_model=requested),
+            deadline=deadline
+        )
+    
+    @staticmethod
+    def _cache_prompt(query: str, system: Optional[str] = None,
+                      stop_fields: Optional[List[str]] = None) -> str:
+        """Полный текст запроса для ключа кэша и оценки токенов.
+
+        Ответ, оборванный после stop_fields, короче полного, поэтому кэшируется
+        под отдельным ключом и не отдается запросам без раннего обрыва.
+        """
+        prompt = f"{system}\n\n{query}" if system else query
+        return f"{prompt}\n\n[stop: {', '.join(stop_fields)}]" if stop_fields else prompt
+    
+    def invalidate_cached(self, query: str, model: str = "sonar-pro", system: Optional[str] = None,
+                          stop_fields: Optional[List[str]] = None):
+        """Убирает ответ из кэша (например, если его не удалось разобрать)
+
+        model — модель, запрошенная в search_sports_data, а не выбранная роутером.
+        """
+        if self.cache:
+            self.cache.invalidate(model, self._cache_prompt(query, system, stop_fields))
+    
+    def render_prompt(self, name: str, **values) -> RenderedPrompt:
+        """Собирает промпт из реестра с учетом бюджета токенов"""
+        prompt = PROMPTS.render(name, max_tokens=self.prompt_budget, **values)
+        if prompt.trimmed:
+            logger.info(f"✂️ Промпт {prompt.key} сокращен до ~{prompt.tokens} токенов: без {', '.join(prompt.trimmed)}")
+        return prompt
+    
+    async def _execute_request(self, payload: Dict, query: str, model: str,
+                               cache_kind: Optional[str], deadline: Optional[float],
+                               stop_fields: Optional[List[str]] = None,
+                               cache_model: Optional[str] = None) -> Optional[Dict]:
+        """Выполняет запрос и записывает его токены, задержку и повторы в учет"""
+        attempt_latencies = []
+        started = time.monotonic()
+        result = None
         try:
-            session = await self.get_session()
-            
-            payload = {
-                "model": model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": query
-                    }
-                ],
-                "max_tokens": 1000,
-                "temperature": 0.3,
-                "top_p": 0.9
-            }
-            
-            logger.info(f"🔍 Запрос к Perplexity API: {query[:100]}...")
-            
-            async with session.post(self.base_url, json=payload) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    logger.info("✅ Perplexity API ответил успешно")
-                    return data
-                else:
-                    logger.error(f"❌ Perplexity API error: {response.status}")
-                    error_text = await response.text()
-                    logger.error(f"📝 Error details: {error_text}")
-                    return None
-                    
-        except asyncio.TimeoutError:
-            logger.error("⏰ Perplexity API timeout")
-            return None
-        except Exception as e:
-            logger.error(f"💥 Error calling Perplexity API: {e}")
-            return None
+            result = await self._execute_attempts(payload, query, model, cache_kind, deadline,
+                                                  stop_fields, attempt_latencies, started, cache_model)
+            return result
+        finally:
+            content = result['choices'][0]['message']['content'] if result else ""
+            self.usage.record(
+                model, cache_kind,
+                latency=round(time.monotonic() - started, 3),
+                attempts=len(attempt_latencies),
+                cache_hit=False,
+                ok=result is not None,
+                usage=result.get('usage') if result else None,
+                estimated_prompt_tokens=estimate_tokens(query) if attempt_latencies else 0,
+                estimated_completion_tokens=estimate_tokens(content) if content else 0
+            )
     
-    async def get_todays_matches(self, sport: str = "football") -> List[Dict]:
-        """Получает матчи на сегодня для определенного вида спорта"""
-        moscow_tz = pytz.timezone('Europe/Moscow')
-        today = datetime.now(moscow_tz).strftime("%Y-%m-%d")
+    async def _execute_attempts(self, payload: Dict, query: str, model: str,
+                                cache_kind: Optional[str], deadline: Optional[float],
+                                stop_fields: Optional[List[str]], attempt_latencies: List[float],
+                                started: float, cache_model: Optional[str] = None) -> Optional[Dict]:
+        """Отправляет запрос в Perplexity с повторами, учетом лимитов и бюджета времени
+
+        cache_model — модель, под которой ответ ложится в кэш (по умолчанию model).
+        """
+        policy = self.retry_policy
+        estimated_tokens = estimate_tokens(query) + payload["max_tokens"]
         
-        sport_queries = {
-            "football": f"""
-            Найди ТОП-3 самых интересных футбольных матча на сегодня {today} из ведущих европейских лиг (Премьер-лига, Ла Лига, Серия А, Бундеслига, Лига Чемпионов).
-            
-            Для каждого матча дай МАКСИМАЛЬНО ДЕТАЛЬНЫЙ ПРОФЕССИОНАЛЬНЫЙ АНАЛИЗ на русском языке (минимум 200-300 слов):
-            
-            1. ПОЛНАЯ ИНФОРМАЦИЯ О МАТЧЕ:
-               - Точные названия команд и турнир
-               - Время начала по МСК
-               - Стадион и его особенности
-               - Судья матча (если известно)
-            
-            2. ГЛУБОКИЙ АНАЛИЗ ТЕКУЩЕЙ ФОРМЫ (последние 7-10 матчей):
-               - Детальные результаты каждой команды
-               - Статистика голов за/против в каждом матче
-               - Качество игры против сильных/слабых соперников
-               - Динамика улучшения/ухудшения
-            
-            3. ИСЧЕРПЫВАЮЩАЯ СТАТИСТИКА ЛИЧНЫХ ВСТРЕЧ:
-               - Последние 10 матчей между командами
-               - Статистика на домашнем поле хозяев
-               - Особенности игры именно в этом противостоянии
-               - Кто доминировал в разные периоды
-            
-            4. ДЕТАЛЬНЫЙ АНАЛИЗ СОСТАВОВ:
-               - Ключевые игроки и их текущая форма
-               - Травмы, дисквалификации, сомнительные
-               - Статистика лучших бомбардиров
-               - Голкиперы и их надежность
-               - Новые трансферы и их влияние
-            
-            5. ТАКТИЧЕСКИЙ РАЗБОР:
-               - Предпочитаемые схемы каждой команды
-               - Как команды играют против подобных соперников
-               - Слабые места в обороне/атаке
-               - Сильные стороны и как их могут использовать
-               - Ожидаемые тактические решения тренеров
-            
-            6. МОТИВАЦИОННЫЕ И КОНТЕКСТУАЛЬНЫЕ ФАКТОРЫ:
-               - Турнирные задачи каждой команды
-               - Влияние предыдущих результатов на моральный дух
-               - Давление болельщиков и медиа
-               - Финансовые стимулы (премии за результат)
-               - Исторические факторы соперничества
-            
-            7. ДЕТАЛЬНЫЙ ПРОГНОЗ С ОБОСНОВАНИЕМ:
-               - Наиболее вероятный основной исход (1X2)
-               - Ожидаемый точный счет с аргументацией
-               - Анализ вероятности различных сценариев
-               - Прогноз по тоталу голов с детальным обоснованием
-               - Прогноз статистики (углы, карточки, владение)
-            
-            8. БУКМЕКЕРСКАЯ АНАЛИТИКА:
-               - Сравнение коэффициентов разных БК
-               - Value-ставки (недооцененные рынки)
-               - Рекомендуемые размеры ставок
-               - Альтернативные рынки для ставок
-            
-            ВАЖНО: Пиши как топ-эксперт с 20-летним опытом, используй конкретные цифры, статистику, ссылайся на конкретные матчи и события. Минимум 250-300 слов на каждый матч.
-            """,
-            
-            "basketball": f"""
-            Найди ТОП-3 самых перспективных баскетбольных матча на сегодня {today} (НБА, Евролига, ВТБ).
-            
-            Дай ЭКСПЕРТНЫЙ АНАЛИЗ на русском языке для каждого матча:
-            
-            1. Полные названия команд и лига
-            2. Время начала по МСК
-            3. Анализ текущей формы команд (последние 7-10 игр)
-            4. Статистика очно встреч в этом сезоне
-            5. Ключевые игроки, их статистика, травмы
-            6. Анализ стиля игры (темп, защита, атака)
-            7. Домашний фактор и мотивация
-            8. Детальный прогноз с обоснованием
-            9. Анализ тотала очков с аргументацией
-            10. Букмекерские коэффициенты
-            
-            Будь экспертом уровня NBA Analytics с глубоким пониманием игры.
-            """,
-            
-            "tennis": f"""
-            Найди ТОП-3 самых интересных теннисных матча на сегодня {today} (ATP, WTA, Masters, Grand Slam).
-            
-            Для каждого матча дай ЭКСПЕРТНЫЙ АНАЛИЗ на русском языке (минимум 200-250 слов):
-            
-            1. ИНФОРМАЦИЯ О МАТЧЕ:
-               - Полные имена теннисистов и турнир
-               - Время матча по МСК и часовой пояс
-               - Тип покрытия корта (хард, грунт, трава)
-               - Погодные условия и их влияние
-               - Круг турнира и его важность
-            
-            2. РЕЙТИНГИ И СТАТИСТИКА:
-               - Текущие рейтинги ATP/WTA
-               - Изменения рейтинга за последний месяц
-               - Статистика побед/поражений в сезоне
-               - Достижения в карьере на данном покрытии
-            
-            3. ДЕТАЛЬНАЯ ФОРМА ИГРОКОВ:
-               - Результаты последних 7-10 матчей
-               - Качество соперников в последних играх
-               - Физическое состояние и усталость
-               - Время восстановления после предыдущего матча
-               - Мотивация и цели в турнире
+        logger.info(f"🔍 Запрос к Perplexity API: {payload['messages'][-1]['content'][:100]}...")
+        
+        for attempt in range(1, policy.max_attempts + 1):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                logger.warning("⏰ Бюджет времени на запрос к Perplexity исчерпан")
+                break
             
-            4. СТАТИСТИКА ЛИЧНЫХ ВСТРЕЧ:
-               - Все предыдущие матчи между игроками
-               - Результаты на разных покрытиях
-               - Эволюция противостояния по годам
-               - Ключевые моменты прошлых встреч
+            if not self.circuit_breaker.allow(model):
+                logger.warning(f"⚡ Цепь {model} разомкнута — запрос не отправляется, используем фолбэк")
+                return None
             
-            5. ТЕХНИЧЕСКИЙ АНАЛИЗ ИГРЫ:
-               - Стиль игры каждого теннисиста
-               - Сильные удары и тактические предпочтения
-               - Статистика подач (эйсы, двойные ошибки)
-               - Эффективность на приеме подачи
-               - Игра с задней линии vs выходы к сетке
-               - Движение по корту и выносливость
+            retry_after = None
+            attempt_started = time.monotonic()
+            try:
+                status, body, retry_after = await asyncio.wait_for(
+                    self._hedged_post(payload, model, estimated_tokens, stop_fields), timeout=remaining
+                )
+            except asyncio.TimeoutError:
+                attempt_latencies.append(round(time.monotonic() - attempt_started, 3))
+                if deadline is not None and time.monotonic() >= deadline:
+                    # Запрос оборвал дедлайн запуска, а не таймаут провайдера — это не ошибка модели
+                    self.circuit_breaker.record_abandoned(model)
+                    logger.warning(f"⏰ Запрос к Perplexity оборван дедлайном запуска (попытка {attempt}/{policy.max_attempts})")
+                    break
+                self.circuit_breaker.record_failure(model)
+                logger.warning(f"⏰ Perplexity API timeout (попытка {attempt}/{policy.max_attempts})")
+            except aiohttp.ClientConnectionError as e:
+                attempt_latencies.append(round(time.monotonic() - attempt_started, 3))
+                self.circuit_breaker.record_failure(model)
+                logger.warning(f"🔌 Ошибка соединения с Perplexity: {e} (попытка {attempt}/{policy.max_attempts})")
+            except Exception as e:
+                logger.error(f"💥 Error calling Perplexity API: {e}")
+                return None
+            else:
+                attempt_latencies.append(round(time.monotonic() - attempt_started, 3))
+                if status in policy.retry_statuses:
+                    self.circuit_breaker.record_failure(model)
+                else:
+                    # Любой другой ответ значит, что API доступен
+                    self.circuit_breaker.record_success(model)
+                
+                if status == 200:
+                    self.router.record(model, attempt_latencies[-1])
+                    data = body
+                    stream_meta = data.pop('_stream', {})
+                    usage = data.get('usage') or {}
+                    if usage.get('total_tokens'):
+                        self.rate_limiter.record_usage(model, estimated_tokens, usage['total_tokens'])
+                    if cache_kind and self.cache:
+                        cache_model = cache_model or model
+                        self.cache.set(cache_kind, cache_model, query,
+                                       data if cache_model == model else dict(data, _model=model))
+                    logger.info(f"✅ Perplexity API ответил успешно (попыток: {attempt})")
+                    return dict(data, _meta={
+                        'attempts': attempt,
+                        'attempt_latencies': attempt_latencies,
+                        'latency': round(time.monotonic() - started, 3),
+                        'model': model,
+                        'cache_hit': False,
+                        **stream_meta
+                    })
+                
+                if status == 429:
+                    # Сервер сам говорит, сколько ждать — предупреждаем и остальных через лимитер
+                    self.rate_limiter.block(model, retry_after)
+                
+                if status not in policy.retry_statuses:
+                    logger.error(f"❌ Perplexity API error: {status}")
+                    logger.error(f"📝 Error details: {body}")
+                    return None
+                
+                logger.warning(f"🔁 Perplexity API error: {status} (попытка {attempt}/{policy.max_attempts})")
             
-            6. ПСИХОЛОГИЧЕСКИЕ ФАКТОРЫ:
-               - Ментальная устойчивость в решающих моментах
-               - Статистика в тай-брейках
-               - Поведение в стрессовых ситуациях
-               - Поддержка болельщиков
-               - Опыт игры в данных условиях
+            if attempt == policy.max_attempts:
+                break
             
-            7. ПОДРОБНЫЙ ПРОГНОЗ:
-               - Основной исход с детальным обоснованием
-               - Прогноз по количеству сетов
-               - Ожидаемая продолжительность матча
-               - Прогноз по тоталу геймов
-               - Вероятность тай-брейков
-               - Статистические ставки (эйсы, двойные)
+            delay = policy.backoff(attempt)
+            if retry_after:
+                delay = max(delay, retry_after)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                logger.warning("⏰ Бюджета времени не хватает на повтор запроса")
+                break
+            await asyncio.sleep(delay)
+        
+        logger.error(f"❌ Perplexity API: запрос не удался, попыток: {len(attempt_latencies)}, "
+                     f"задержки: {attempt_latencies}")
+        return None
+    
+    def _take_hedge(self) -> bool:
+        """Резервирует дополнительный запрос из лимита текущего запуска"""
+        run_id = current_run_id()
+        if run_id is None:
+            # Хеджируем только плановые запуски — у ручных вызовов нет общего лимита
+            return False
+        used = self._hedges_per_run.get(run_id, 0)
+        if used >= self.hedge_max_per_run:
+            self.hedge_stats['capped'] += 1
+            return False
+        self._hedges_per_run[run_id] = used + 1
+        # Счетчики старых запусков больше не нужны
+        while len(self._hedges_per_run) > 20:
+            self._hedges_per_run.pop(next(iter(self._hedges_per_run)))
+        return True
+    
+    async def _hedged_post(self, payload: Dict, model: str, estimated_tokens: int,
+                           stop_fields: Optional[List[str]] = None) -> Tuple[int, object, Optional[float]]:
+        """Попытка запроса с хеджированием хвостовой задержки.
+
+        Если ответ не пришел за p90 модели, отправляется второй такой же запрос;
+        побеждает первый успешный ответ, проигравший отменяется.
+        """
+        if not self.hedging:
+            return await self._post_once(payload, model, estimated_tokens, stop_fields)
+        
+        primary = asyncio.create_task(self._post_once(payload, model, estimated_tokens, stop_fields))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.router.latency(model, 0.9))
+            if done or not self._take_hedge():
+                return await primary
             
-            8. БУКМЕКЕРСКАЯ ОЦЕНКА:
-               - Анализ коэффициентов
-               - Рекомендуемые ставки
-               - Value в разных рынках
+            hedge = asyncio.create_task(self._post_once(payload, model, estimated_tokens, stop_fields))
+            self.hedge_stats['launched'] += 1
+            logger.info(f"🪁 {model}: ответа нет дольше p90, отправлен хеджирующий запрос")
             
-            Анализируй как эксперт уровня Tennis Channel с глубоким пониманием всех нюансов игры и психологии.
-            """,
+            pending = {primary, hedge}
+            first_failed = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result()[0] == 200:
+                        if task is hedge:
+                            self.hedge_stats['helped'] += 1
+                        return task.result()
+                    first_failed = first_failed or task
+            # Оба запроса неудачны — отдаем первую ошибку обычной логике повторов
+            return first_failed.result()
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+    
+    async def _post_once(self, payload: Dict, model: str, estimated_tokens: int,
+                         stop_fields: Optional[List[str]] = None) -> Tuple[int, object, Optional[float]]:
+        """Одна попытка запроса: возвращает статус, тело ответа и Retry-After"""
+        session = await self.get_session()
+        await self.rate_limiter.acquire(model, estimated_tokens)
+        
+        async with session.post(self.base_url, json=payload) as response:
+            if response.status == 200:
+                if payload.get("stream"):
+                    return response.status, await self._read_stream(response, stop_fields), None
+                return response.status, await response.json(), None
             
-            "hockey": f"""
-            Найди ТОП-3 самых интересных хоккейных матча на сегодня {today} (НХЛ, КХЛ).
+            retry_after = parse_retry_after(response.headers.get('Retry-After')) if response.status == 429 else None
+            return response.status, await response.text(), retry_after
+    
+    async def _read_stream(self, response, stop_fields: Optional[List[str]] = None) -> Dict:
+        """Читает SSE-поток и собирает ответ в том же формате, что и обычный запрос"""
+        parser = PredictionStreamParser(stop_fields) if stop_fields else None
+        parts = []
+        usage = None
+        started = time.monotonic()
+        first_token_latency = None
+        stopped_early = False
+        # Когда какое поле стало известно (секунды от начала запроса)
+        fields_latency = {}
+        
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8', errors='ignore').strip()
+            if not line.startswith('data:'):
+                continue
+            chunk = line[5:].strip()
+            if chunk == '[DONE]':
+                break
             
-            Глубокий экспертный анализ на русском языке:
+            event = json.loads(chunk)
+            if event.get('usage'):
+                usage = event['usage']
+            choices = event.get('choices') or []
+            delta = (choices[0].get('delta') or {}).get('content') if choices else None
+            if not delta:
+                continue
             
-            1. Полные названия команд и лига
-            2. Время начала по МСК
-            3. Турнирное положение и мотивация команд
-            4. Текущая форма (последние 10 матчей)
-            5. Статистика личных встреч в сезоне
-            6. Ключевые игроки, голкиперы, травмы
-            7. Статистика в большинстве/меньшинстве
-            8. Домашний лед и особенности арены
-            9. Детальный прогноз с аргументацией
-            10. Анализ тотала шайб
+            if first_token_latency is None:
+                first_token_latency = round(time.monotonic() - started, 3)
+            parts.append(delta)
             
-            Анализируй как эксперт NHL Network с профессиональным пониманием хоккея.
-            """
+            if parser:
+                for key, _ in parser.feed(delta):
+                    fields_latency[key] = round(time.monotonic() - started, 3)
+                if parser.is_complete():
+                    # Все нужные поля получены — обрываем генерацию, чтобы не платить за хвост
+                    stopped_early = True
+                    response.close()
+                    break
+        
+        data = {
+            'choices': [{'message': {'role': 'assistant', 'content': "".join(parts)}}],
+            '_stream': {
+                'streamed': True,
+                'stopped_early': stopped_early,
+                'first_token_latency': first_token_latency,
+                'fields_latency': fields_latency
+            }
         }
+        if usage:
+            data['usage'] = usage
+        return data
+    
+    async def get_todays_matches(self, sport: str = "football") -> List[Dict]:
+        """Получает матчи на сегодня для определенного вида спорта"""
+        moscow_tz = pytz.timezone('Europe/Moscow')
+        today = datetime.now(moscow_tz).strftime("%Y-%m-%d")
         
-        query = sport_queries.get(sport, sport_queries["football"])
-        result = await self.search_sports_data(query)
+        name = f"matches.{sport}" if f"matches.{sport}" in PROMPTS else "matches.football"
+        prompt = self.render_prompt(name, today=today)
+        result = await self.search_sports_data(prompt.user, cache_kind="matches", system=prompt.system)
         
         if result and 'choices' in result:
             content = result['choices'][0]['message']['content']
@@ -253,84 +607,13 @@ class PerplexityAPI:
     
     def _parse_matches_from_text(self, text: str, sport: str) -> List[Dict]:
         """Парсит текст ответа для извлечения матчей"""
-        matches = []
-        lines = text.split('\n')
-        
-        current_match = {}
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Поиск названий команд (простой парсинг)
-            if ' - ' in line or ' vs ' in line or ' против ' in line:
-                if ' - ' in line:
-                    teams = line.split(' - ')
-                elif ' vs ' in line:
-                    teams = line.split(' vs ')
-                else:
-                    teams = line.split(' против ')
-                
-                if len(teams) == 2:
-                    current_match = {
-                        'home_team': teams[0].strip(),
-                        'away_team': teams[1].strip(),
-                        'sport': sport,
-                        'time': 'TBD',
-                        'league': 'TBD'
-                    }
-                    matches.append(current_match)
-            
-            # Поиск времени матча
-            if any(time_word in line.lower() for time_word in ['время', 'матч', ':']) and current_match:
-                current_match['time'] = line
-        
-        return matches[:5]  # Ограничиваем до 5 матчей
+        return parse_matches(text, sport, limit=5)  # Ограничиваем до 5 матчей
     
     async def get_team_analysis(self, team1: str, team2: str) -> Dict:
         """Получает детальный анализ противостояния команд"""
-        query = f"""
-        ЭКСПЕРТНЫЙ АНАЛИЗ матча {team1} против {team2} - отвечай на русском языке как топ-аналитик:
-
-        🔍 ОБЯЗАТЕЛЬНО ВКЛЮЧИ:
-        
-        1. **ТЕКУЩАЯ ФОРМА** (последние 7 матчей каждой команды):
-           - Результаты, голы, пропущенные
-           - Динамика игры и тренд
-        
-        2. **СТАТИСТИКА ОЧНЫХ ВСТРЕЧ**:
-           - Последние 5-7 личных матчей
-           - Кто доминирует и почему
-        
-        3. **КЛЮЧЕВЫЕ ИГРОКИ**:
-           - Топ-бомбардиры, ассистенты
-           - Травмы и дисквалификации
-           - Игроки в форме
-        
-        4. **ТАКТИЧЕСКИЙ АНАЛИЗ**:
-           - Стиль игры каждой команды
-           - Сильные и слабые стороны
-           - Как команды играют друг против друга
-        
-        5. **МОТИВАЦИОННЫЕ ФАКТОРЫ**:
-           - Турнирные задачи команд
-           - Домашний фактор
-           - Психологическое состояние
-        
-        6. **ДЕТАЛЬНЫЙ ПРОГНОЗ**:
-           - Наиболее вероятный исход с обоснованием
-           - Ожидаемый счет
-           - Альтернативные сценарии
-        
-        7. **РЕКОМЕНДАЦИИ ДЛЯ СТАВОК**:
-           - Основной исход (1X2)
-           - Тотал голов/очков
-           - Дополнительные рынки
-        
-        Будь максимально конкретным, профессиональным и убедительным. Твой анализ должен быть на уровне топ-экспертов ESPN/Sky Sports.
-        """
-        
-        result = await self.search_sports_data(query, model="sonar-reasoning-pro")
+        prompt = self.render_prompt("team_analysis", team1=team1, team2=team2)
+        result = await self.search_sports_data(prompt.user, model="sonar-reasoning-pro", cache_kind="team_analysis",
+                                               system=prompt.system)
         
         if result and 'choices' in result:
             content = result['choices'][0]['message']['content']
@@ -348,82 +631,11 @@ class PerplexityAPI:
     
     def _calculate_confidence(self, analysis: str) -> int:
         """Вычисляет уровень уверенности на основе детального анализа"""
-        confidence_keywords = {
-            # Высокая уверенность (85-95%)
-            'очевидный фаворит': 95,
-            'явное преимущество': 90,
-            'безусловный лидер': 90,
-            'доминирует': 88,
-            'превосходит': 87,
-            'однозначно': 85,
-            
-            # Средне-высокая уверенность (75-84%)
-            'высокая вероятность': 84,
-            'скорее всего': 82,
-            'наиболее вероятно': 80,
-            'фаворит': 78,
-            'преимущество': 76,
-            'хорошие шансы': 75,
-            
-            # Средняя уверенность (60-74%)
-            'возможно': 70,
-            'может': 68,
-            'шансы есть': 65,
-            'неплохие перспективы': 62,
-            'стоит рассмотреть': 60,
-            
-            # Низкая уверенность (45-59%)
-            'сомнительно': 55,
-            'рискованно': 50,
-            'непредсказуемо': 48,
-            'сложно прогнозировать': 45
-        }
-        
-        analysis_lower = analysis.lower()
-        max_confidence = 75  # базовая уверенность
-        
-        # Ищем ключевые слова
-        for keyword, confidence in confidence_keywords.items():
-            if keyword in analysis_lower:
-                max_confidence = max(max_confidence, confidence)
-        
-        # Бонусы за детальность анализа
-        detail_bonus = 0
-        detail_indicators = [
-            'статистика', 'последние матчи', 'форма команды', 
-            'личные встречи', 'травмы', 'мотивация', 'тактика',
-            'коэффициент', 'букмекер', 'эксперт', 'анализ'
-        ]
-        
-        for indicator in detail_indicators:
-            if indicator in analysis_lower:
-                detail_bonus += 2
-        
-        # Штрафы за неопределенность
-        uncertainty_penalty = 0
-        uncertainty_words = ['но', 'однако', 'возможно', 'может быть', 'неясно']
-        for word in uncertainty_words:
-            if word in analysis_lower:
-                uncertainty_penalty += 3
-        
-        final_confidence = min(95, max(45, max_confidence + detail_bonus - uncertainty_penalty))
-        return final_confidence
+        return self.confidence_scorer.score(analysis)
 
     def _extract_key_factors(self, analysis: str) -> List[str]:
         """Извлекает ключевые факторы из анализа"""
-        factors = []
-        lines = analysis.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if any(marker in line for marker in ['1.', '2.', '3.', '•', '-', '*']):
-                # Очищаем от маркеров
-                clean_line = line
-                for marker in ['1.', '2.', '3.', '4.', '5.', '•', '-', '*']:
-                    clean_line = clean_line.replace(marker, '').strip()
-                
-                if clean_line and len(clean_line) < 100:  # Короткие факторы
-                    factors.append(clean_line)
+        factors = extract_analysis(analysis, max_factors=4).factor_texts(4)  # Максимум 4 фактора
         
         # Если не найдены, добавляем общие
         if not factors:
@@ -434,52 +646,13 @@ class PerplexityAPI:
                 "Тактические особенности игры"
             ]
         
-        return factors[:4]  # Максимум 4 фактора
+        return factors
     
     async def get_betting_insights(self, match: str) -> Dict:
         """Получает профессиональные инсайты для ставок"""
-        query = f"""
-        ЭКСПЕРТНЫЙ АНАЛИЗ СТАВОК на матч {match} - отвечай на русском как топ-аналитик букмекерской конторы:
-
-        🎯 ОБЯЗАТЕЛЬНО ПРОАНАЛИЗИРУЙ:
-
-        1. **ОСНОВНЫЕ ИСХОДЫ (1X2)**:
-           - Вероятности каждого исхода в %
-           - Текущие коэффициенты топ-букмекеров
-           - Value-ставки (переоцененные коэффициенты)
-
-        2. **ТОТАЛ ГОЛОВ/ОЧКОВ**:
-           - Статистика команд по тоталу
-           - Рекомендуемая линия (больше/меньше)
-           - Обоснование через статистику атаки/защиты
-
-        3. **ФОРЫ И ГАНДИКАПЫ**:
-           - Азиатские форы с максимальной вероятностью
-           - Европейские форы для фаворита/аутсайдера
-
-        4. **СТАТИСТИЧЕСКИЕ СТАВКИ**:
-           - Угловые удары (если футбол)
-           - Карточки и нарушения
-           - Точный счет (наиболее вероятные варианты)
-
-        5. **LIVE-СТАВКИ ВОЗМОЖНОСТИ**:
-           - Сценарии развития матча
-           - Когда ожидать лучшие коэффициенты
-
-        6. **РИСК-МЕНЕДЖМЕНТ**:
-           - Рекомендуемые размеры ставок
-           - Уровень риска каждой ставки
-           - Bankroll management
-
-        7. **ТОП-3 РЕКОМЕНДАЦИИ**:
-           - Самые надежные ставки
-           - Ставки с лучшим value
-           - Комбинированные экспрессы
-
-        Анализируй как эксперт Pinnacle Sports с многолетним опытом и математическим подходом.
-        """
-        
-        result = await self.search_sports_data(query, model="sonar-reasoning")
+        prompt = self.render_prompt("betting_insights", match=match)
+        result = await self.search_sports_data(prompt.user, model="sonar-reasoning", cache_kind="betting_insights",
+                                               system=prompt.system)
         
         if result and 'choices' in result:
             content = result['choices'][0]['message']['content']
@@ -494,26 +667,58 @@ class PerplexityAPI:
         }
     
     def _extract_recommended_bets(self, insights: str) -> List[str]:
-        """Извлекает рекомендуемые ставки"""
-        bet_keywords = [
-            'победа', 'ничья', 'тотал', 'фора', 'голы', 'очки',
-            'угловые', 'карточки', 'пенальти', 'автоголы'
-        ]
-        
-        insights_lower = insights.lower()
-        found_bets = []
-        
-        for keyword in bet_keywords:
-            if keyword in insights_lower:
-                found_bets.append(keyword.capitalize())
-        
-        return found_bets[:3] if found_bets else ["Основной исход", "Тотал"]
+        """Извлекает рекомендуемые ставки (в порядке упоминания)"""
+        found_bets = extract_analysis(insights, max_bets=3).bet_names(3)
+        return found_bets if found_bets else ["Основной исход", "Тотал"]
 
 class EnhancedSportsAnalyzer:
     """Улучшенный анализатор с интеграцией Perplexity API"""
     
+    SPORT_NAMES = {
+        "football": "футбол",
+        "basketball": "баскетбол", 
+        "tennis": "теннис",
+        "hockey": "хоккей"
+    }
+    
+    # Специфичные для каждого спорта ставки
+    SPORT_BETS = {
+        "football": "Победа хозяев/Ничья/Победа гостей, Тотал больше/меньше 2.5, Обе забьют, Фора",
+        "basketball": "Победа хозяев/Победа гостей, Тотал больше/меньше очков, Фора",
+        "tennis": "Победа игрока 1/Победа игрока 2, Тотал геймов больше/меньше",
+        "hockey": "Победа в основное время, Тотал больше/меньше 5.5, Обе забьют"
+    }
+    
+    # Русские названия спортов
+    SPORT_DISPLAY_NAMES = {
+        "football": "Футбол",
+        "basketball": "Баскетбол",
+        "tennis": "Теннис", 
+        "hockey": "Хоккей"
+    }
+    
     def __init__(self, perplexity_api_key: str):
         self.perplexity = PerplexityAPI(perplexity_api_key)
+        # Потоковый режим: прогноз разбирается по мере генерации и обрывается после ФАКТОРЫ
+        self.streaming = str(os.getenv('PERPLEXITY_STREAM', '0')).lower() in ['1', 'true', 'yes']
+        # Формат ответа: 'text' — строки "КЛЮЧ: значение", 'json' — JSON по схеме
+        self.output_mode = str(os.getenv('PERPLEXITY_OUTPUT_MODE', 'text')).lower()
+        # Успешность и время разбора ответов: 'json' и 'legacy' — основной парсер своего режима,
+        # 'legacy_fallback' — старый парсер для JSON-режима, когда модель проигнорировала схему
+        self.parse_stats = {
+            mode: {'attempts': 0, 'successes': 0, 'total_seconds': 0.0}
+            for mode in ('json', 'legacy', 'legacy_fallback')
+        }
+        # Пакетный режим: один запрос на все виды спорта вместо запроса на каждый
+        self.batch_mode = str(os.getenv('PERPLEXITY_BATCH', '0')).lower() in ['1', 'true', 'yes']
+        # Экономия пакетного режима относительно запросов по одному виду спорта
+        self.batch_stats = {
+            'runs': 0, 'items': 0, 'parsed': 0, 'fallbacks': 0,
+            'prompt_tokens_batch': 0, 'prompt_tokens_single': 0,
+            'batch_seconds': 0.0
+        }
+        # Фактическая задержка одиночных запросов (без попаданий в кэш) для сравнения
+        self.single_latency = {'count': 0, 'total_seconds': 0.0}
         self.fallback_data = {
             "football": [
                 {"home_team": "Манчестер Сити", "away_team": "Ливерпуль", "league": "Премьер-лига"},
@@ -527,81 +732,161 @@ class EnhancedSportsAnalyzer:
             ]
         }
     
-    async def generate_real_prediction(self, sport: str = "football") -> Optional[Dict]:
-        """Генерирует реальный прогноз ОДНИМ простым запросом"""
+    def _build_prediction_prompt(self, sport: str) -> RenderedPrompt:
+        """Промпт одиночного прогноза для вида спорта"""
+        sport_ru = self.SPORT_NAMES.get(sport, "футбол")
+        return self.perplexity.render_prompt(
+            "prediction",
+            sport_upper=sport_ru.upper(),
+            date=format_ru_date(),
+            bets=self.SPORT_BETS.get(sport, self.SPORT_BETS["football"]),
+            sport_display=self.SPORT_DISPLAY_NAMES.get(sport, "Футбол")
+        )
+    
+    def _build_batch_prompt(self, sports: List[str]) -> RenderedPrompt:
+        """Промпт на несколько прогнозов: общие требования в системном сообщении, список — в запросе"""
+        items = []
+        for index, sport in enumerate(sports, 1):
+            available_bets = self.SPORT_BETS.get(sport, self.SPORT_BETS["football"])
+            sport_display = self.SPORT_DISPLAY_NAMES.get(sport, "Футбол")
+            items.append(f"{index}. {sport_display} — допустимые ставки: {available_bets}")
+        
+        return self.perplexity.render_prompt(
+            "prediction_batch",
+            count=len(sports),
+            date=format_ru_date(),
+            items="\n".join(items)
+        )
+    
+    async def generate_batch_predictions(self, sports: List[str],
+                                         deadline: Optional[float] = None,
+                                         results: Optional[List[Optional[Dict]]] = None) -> List[Optional[Dict]]:
+        """Генерирует прогнозы для нескольких видов спорта ОДНИМ запросом.
+
+        Ответ делится на отдельные прогнозы; по одиночному запросу повторяются только
+        пункты, которые не удалось разобрать. Результаты — в порядке ``sports``.
+        results — список, который заполняется по мере готовности пунктов: если
+        вызов отменят по дедлайну, разобранные прогнозы в нем останутся.
+        """
+        if not sports:
+            return []
+        
+        json_mode = self.output_mode == 'json'
+        prompt = self._build_batch_prompt(sports)
+        batch_prompt = prompt.user + BATCH_JSON_OUTPUT_INSTRUCTION if json_mode else prompt.user
+        
+        started = time.monotonic()
+        parsed_items: List[Optional[Dict]] = results if results is not None else [None] * len(sports)
+        # Пакету — только часть бюджета, чтобы неразобранные пункты успели повторить по одному
+        batch_deadline = None if deadline is None else started + (deadline - started) * BATCH_DEADLINE_SHARE
         try:
-            # Прямой промпт без сложностей
-            sport_names = {
-                "football": "футбол",
-                "basketball": "баскетбол", 
-                "tennis": "теннис",
-                "hockey": "хоккей"
-            }
-            
-            sport_ru = sport_names.get(sport, "футбол")
-            
-            # Специфичные для каждого спорта ставки
-            sport_bets = {
-                "football": "Победа хозяев/Ничья/Победа гостей, Тотал больше/меньше 2.5, Обе забьют, Фора",
-                "basketball": "Победа хозяев/Победа гостей, Тотал больше/меньше очков, Фора",
-                "tennis": "Победа игрока 1/Победа игрока 2, Тотал геймов больше/меньше",
-                "hockey": "Победа в основное время, Тотал больше/меньше 5.5, Обе забьют"
-            }
-            
-            available_bets = sport_bets.get(sport, sport_bets["football"])
+            result = await self.perplexity.search_sports_data(
+                batch_prompt, model="sonar-pro", cache_kind="prediction", deadline=batch_deadline,
+                response_format={"type": "json_schema", "json_schema": {"schema": BATCH_PREDICTION_JSON_SCHEMA}} if json_mode else None,
+                system=prompt.system,
+                max_tokens=PREDICTION_MAX_TOKENS * len(sports)
+            )
+            if result and 'choices' in result:
+                content = result['choices'][0]['message']['content']
+                model = result.get('_meta', {}).get('model', "sonar-pro")
+                parsed_items[:] = self._split_batch_response(content, len(sports), json_mode)
+                for item in parsed_items:
+                    if item:
+                        item['model'] = model
+                if not any(parsed_items):
+                    self.perplexity.invalidate_cached(batch_prompt, model="sonar-pro", system=prompt.system)
+        except Exception as e:
+            logger.error(f"Error in batch prediction: {e}")
+        
+        batch_seconds = time.monotonic() - started
+        failed = [index for index, item in enumerate(parsed_items) if not item]
+        
+        stats = self.batch_stats
+        stats['runs'] += 1
+        stats['items'] += len(sports)
+        stats['parsed'] += len(sports) - len(failed)
+        stats['fallbacks'] += len(failed)
+        stats['prompt_tokens_batch'] += prompt.tokens
+        stats['prompt_tokens_single'] += sum(self._build_prediction_prompt(sport).tokens for sport in sports)
+        stats['batch_seconds'] += batch_seconds
+        logger.info(f"📦 Пакетный прогноз: {len(sports) - len(failed)}/{len(sports)} разобрано за {batch_seconds:.1f} с")
+        
+        if failed:
+            logger.info(f"🔁 Повторяем по одному: {', '.join(sports[index] for index in failed)}")
             
-            # Русские названия спортов
-            sport_display_names = {
-                "football": "Футбол",
-                "basketball": "Баскетбол",
-                "tennis": "Теннис", 
-                "hockey": "Хоккей"
-            }
-            sport_display = sport_display_names.get(sport, "Футбол")
+            async def _retry(index: int):
+                # Каждый повтор записывается сразу: отмена по дедлайну не сотрет готовые
+                try:
+                    parsed_items[index] = await self.generate_real_prediction(sports[index], deadline=deadline)
+                except Exception as e:
+                    logger.warning(f"⚠️ Повтор прогноза для {sports[index]} не удался: {e}")
             
-            simple_prompt = f"""
-🎯 ПРОФЕССИОНАЛЬНЫЙ СПОРТИВНЫЙ АНАЛИЗ НА {sport_ru.upper()} - 27 АВГУСТА 2025
-
-⚠️ КРИТИЧЕСКИ ВАЖНЫЕ ТРЕБОВАНИЯ:
-- Премьер-лига: только английские клубы (Манчестер Сити, Ливерпуль, Арсенал, Челси, Тоттенхэм, и т.д.)
-- Ла Лига: только испанские клубы (Реал Мадрид, Барселона, Атлетико Мадрид, Севилья и т.д.)
-- Серия А: только итальянские клубы (Ювентус, Милан, Интер, Наполи, Рома и т.д.)
-- Бундеслига: только немецкие клубы (Бавария, Боруссия Дортмунд, РБ Лейпциг и т.д.)
-
-🎯 ДОПУСТИМЫЕ СТАВКИ ДЛЯ {sport_ru.upper()}: {available_bets}
-
-📋 ФОРМАТ ОТВЕТА (СТРОГО СОБЛЮДАЙ):
-СПОРТ: {sport_display}
-ЛИГА: [Название лиги БЕЗ смешивания команд из разных стран]
-МАТЧ: [Команда 1 - Команда 2] (ТОЛЬКО команды из одной страны/лиги!)
-ВРЕМЯ: [ЧЧ:ММ МСК] (реалистичное время 15:00-22:30)
-ПРОГНОЗ: [ТОЛЬКО из списка выше - соответствует виду спорта]
-КОЭФФИЦИЕНТ: [1.XX-4.XX] (реалистичный)
-УВЕРЕННОСТЬ: [75-95%] (на основе анализа)
-АНАЛИЗ: [Минимум 150 слов ДЕТАЛЬНОГО профессионального анализа с конкретной статистикой, формой команд, мотивацией, травмами, тактикой. Пиши как топ-эксперт с 15-летним опытом. Включи конкретные цифры и факты.]
-ФАКТОРЫ: [3 конкретных фактора через запятую - домашняя форма, травмы, мотивация, тактика]
-
-🔥 ТРЕБОВАНИЯ К КАЧЕСТВУ:
-1. Анализ должен содержать КОНКРЕТНУЮ статистику (проценты, голы, очки)
-2. Упоминай последние 5-7 матчей команд
-3. Анализируй личные встречи
-4. Учитывай травмы ключевых игроков
-5. Мотивационные факторы (место в турнире, цели)
-6. Домашний/выездной фактор
+            await asyncio.gather(*(_retry(index) for index in failed))
+        
+        return parsed_items
+    
+    def _split_batch_response(self, content: str, count: int, json_mode: bool) -> List[Optional[Dict]]:
+        """Делит пакетный ответ на отдельные прогнозы по номерам пунктов"""
+        items: List[Optional[Dict]] = [None] * count
+        
+        if json_mode:
+            raw = self._decode_json_object(content)
+            predictions = raw.get('predictions') if isinstance(raw, dict) else None
+            if isinstance(predictions, list):
+                for index, entry in enumerate(predictions[:count]):
+                    items[index] = self._timed_parse('json', self._validate_json_prediction, entry)
+                return items
+            # Модель проигнорировала схему — пробуем текстовый формат
+        
+        parts = BATCH_SECTION_RE.split(content)
+        # parts: [преамбула, номер, текст, номер, текст, ...]
+        for number, section in zip(parts[1::2], parts[2::2]):
+            index = int(number) - 1
+            if 0 <= index < count and items[index] is None:
+                items[index] = self._timed_parse('legacy_fallback' if json_mode else 'legacy',
+                                                 self._parse_simple_response, section)
+        return items
+    
+    async def generate_real_prediction(self, sport: str = "football",
+                                       deadline: Optional[float] = None) -> Optional[Dict]:
+        """Генерирует реальный прогноз ОДНИМ простым запросом
 
-📊 СДЕЛАЙ ЭТО КАК НАСТОЯЩИЙ ЭКСПЕРТ ESPN/Sky Sports уровня!
-Найди АКТУАЛЬНЫЙ матч на сегодня или создай максимально реалистичный!
-"""
+        deadline — абсолютный дедлайн по time.monotonic(), передается в API-клиент.
+        """
+        try:
+            prompt = self._build_prediction_prompt(sport)
+            simple_prompt = prompt.user
+            
+            json_mode = self.output_mode == 'json'
+            if json_mode:
+                simple_prompt += JSON_OUTPUT_INSTRUCTION
+            stop_fields = list(STREAM_STOP_FIELDS) if self.streaming and not json_mode else None
             
-            result = await self.perplexity.search_sports_data(simple_prompt, model="sonar-pro")
+            result = await self.perplexity.search_sports_data(
+                simple_prompt, model="sonar-pro", cache_kind="prediction", deadline=deadline,
+                stream=self.streaming,
+                stop_fields=stop_fields,
+                response_format={"type": "json_schema", "json_schema": {"schema": PREDICTION_JSON_SCHEMA}} if json_mode else None,
+                system=prompt.system
+            )
             
             if result and 'choices' in result:
                 content = result['choices'][0]['message']['content']
+                meta = result.get('_meta', {})
+                if meta.get('latency') and not meta.get('cache_hit'):
+                    self.single_latency['count'] += 1
+                    self.single_latency['total_seconds'] += meta['latency']
                 
                 # Парсим ответ
-                parsed = self._parse_simple_response(content)
+                parsed = self._parse_prediction_content(content, json_mode)
                 if parsed:
+                    # Роутер мог заменить модель — запоминаем, какая дала прогноз
+                    parsed['model'] = meta.get('model', "sonar-pro")
                     return parsed
+                
+                # Неразборчивый ответ не должен жить в кэше до конца дня
+                self.perplexity.invalidate_cached(simple_prompt, model="sonar-pro",
+                                                  system=prompt.system, stop_fields=stop_fields)
                     
         except Exception as e:
             logger.error(f"Error in simple prediction: {e}")
@@ -609,44 +894,161 @@ class EnhancedSportsAnalyzer:
         # Если ничего не получилось - возвращаем качественный fallback
         return self._generate_quality_fallback(sport)
     
+    async def generate_real_predictions(self, sports: List[str], max_concurrency: int = 3,
+                                        timeout: Optional[float] = None) -> List[Optional[Dict]]:
+        """Генерирует прогнозы для нескольких видов спорта параллельно.
+
+        Результаты возвращаются в порядке ``sports``. Если запрос упал или не успел
+        к общему дедлайну ``timeout``, на его месте будет None — оставшиеся запросы
+        отменяются, а не дожидаются. При PERPLEXITY_BATCH=1 все виды спорта
+        запрашиваются одним пакетным запросом.
+        """
+        if not sports:
+            return []
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        if self.batch_mode and len(sports) > 1:
+            results: List[Optional[Dict]] = [None] * len(sports)
+            try:
+                return await asyncio.wait_for(
+                    self.generate_batch_predictions(sports, deadline=deadline, results=results), timeout
+                )
+            except asyncio.TimeoutError:
+                missing = [sport for sport, result in zip(sports, results) if not result]
+                logger.warning(f"⏰ Пакетный прогноз не успел к дедлайну {timeout:.1f} с: "
+                               f"нет прогноза для {', '.join(missing)}")
+                return list(results)
+
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def _generate(sport: str) -> Optional[Dict]:
+            async with semaphore:
+                return await self.generate_real_prediction(sport, deadline=deadline)
+
+        tasks = [asyncio.create_task(_generate(sport)) for sport in sports]
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+
+        for task in pending:
+            task.cancel()
+
+        results = []
+        for sport, task in zip(sports, tasks):
+            if task not in done:
+                logger.warning(f"⏰ Прогноз для {sport} не успел к дедлайну {timeout:.1f} с")
+                results.append(None)
+            elif task.exception() is not None:
+                logger.warning(f"⚠️ Ошибка генерации прогноза для {sport}: {task.exception()}")
+                results.append(None)
+            else:
+                results.append(task.result())
+
+        return results
+    
+    def _parse_prediction_content(self, content: str, json_mode: bool) -> Optional[Dict]:
+        """Разбирает ответ выбранным парсером с замером успешности и времени"""
+        if json_mode:
+            parsed = self._timed_parse('json', self._parse_json_response, content)
+            if parsed:
+                return parsed
+            # Модель могла проигнорировать схему — пробуем старый формат (отдельная статистика:
+            # это только ответы, не прошедшие JSON-разбор, а не сравнение парсеров на одном потоке)
+            return self._timed_parse('legacy_fallback', self._parse_simple_response, content)
+        return self._timed_parse('legacy', self._parse_simple_response, content)
+    
+    def _timed_parse(self, mode: str, parser, content: str) -> Optional[Dict]:
+        started = time.perf_counter()
+        parsed = parser(content)
+        stats = self.parse_stats[mode]
+        stats['attempts'] += 1
+        stats['total_seconds'] += time.perf_counter() - started
+        if parsed:
+            stats['successes'] += 1
+        return parsed
+    
+    def get_parse_stats(self) -> Dict:
+        """Доля успешных разборов и среднее время декодирования по парсерам"""
+        report = {}
+        for mode, stats in self.parse_stats.items():
+            attempts = stats['attempts']
+            report[mode] = {
+                'attempts': attempts,
+                'successes': stats['successes'],
+                'success_rate': round(stats['successes'] / attempts, 3) if attempts else 0.0,
+                'avg_decode_ms': round(stats['total_seconds'] / attempts * 1000, 3) if attempts else 0.0
+            }
+        return report
+    
+    def get_batch_stats(self) -> Dict:
+        """Экономия токенов и времени пакетного режима относительно запросов по одному"""
+        stats = self.batch_stats
+        avg_single = (self.single_latency['total_seconds'] / self.single_latency['count']
+                      if self.single_latency['count'] else None)
+        report = dict(
+            stats,
+            batch_seconds=round(stats['batch_seconds'], 3),
+            prompt_tokens_saved=stats['prompt_tokens_single'] - stats['prompt_tokens_batch'],
+            prompt_tokens_saved_pct=round(
+                100 * (1 - stats['prompt_tokens_batch'] / stats['prompt_tokens_single']), 1
+            ) if stats['prompt_tokens_single'] else 0.0,
+            avg_single_latency=round(avg_single, 3) if avg_single is not None else None
+        )
+        # Сколько секунд работы API заняли бы те же прогнозы по одному
+        if avg_single is not None and stats['runs']:
+            single_seconds = avg_single * stats['items']
+            report['request_seconds_single_est'] = round(single_seconds, 3)
+            report['request_seconds_saved'] = round(single_seconds - stats['batch_seconds'], 3)
+        return report
+    
+    def _parse_json_response(self, content: str) -> Optional[Dict]:
+        """Разбирает структурированный JSON-ответ одним декодированием и проверяет поля"""
+        return self._validate_json_prediction(self._decode_json_object(content))
+    
+    def _decode_json_object(self, content: str) -> Optional[Dict]:
+        """Достает из ответа JSON-объект"""
+        text = content.strip()
+        # Модели рассуждений добавляют <think>...</think>, некоторые оборачивают JSON в ```
+        if '</think>' in text:
+            text = text.rsplit('</think>', 1)[1].strip()
+        start, end = text.find('{'), text.rfind('}')
+        if start == -1 or end <= start:
+            return None
+        
+        try:
+            return json.loads(text[start:end + 1])
+        except ValueError as e:
+            logger.error(f"JSON parse error: {e}")
+            return None
+    
+    def _validate_json_prediction(self, raw) -> Optional[Dict]:
+        """Проверяет поля прогноза из JSON и приводит их к формату анализатора"""
+        if not isinstance(raw, dict):
+            return None
+        
+        data = {}
+        for field in ('sport', 'league', 'match', 'prediction', 'analysis'):
+            value = raw.get(field)
+            if not isinstance(value, str) or not value.strip():
+                return None
+            data[field] = value.strip()
+        
+        data['time'] = str(raw.get('time') or '').strip() or None
+        data['odds'] = str(raw.get('odds') or '').strip()
+        try:
+            data['confidence'] = int(str(raw.get('confidence', 75)).replace('%', '').strip())
+        except ValueError:
+            data['confidence'] = 75
+        
+        factors = raw.get('key_factors') or []
+        if isinstance(factors, str):
+            factors = factors.split(',')
+        data['key_factors'] = [str(f).strip() for f in factors if str(f).strip()]
+        data['source'] = 'perplexity'
+        return data
+    
     def _parse_simple_response(self, content: str) -> Optional[Dict]:
-        """Парсит простой ответ от Perplexity"""
+        """Парсит простой ответ от Perplexity (блоки <think> и многострочный АНАЛИЗ учитываются)"""
         try:
-            lines = content.split('\n')
-            data = {}
-            
-            for line in lines:
-                line = line.strip()
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    key = key.strip().upper()
-                    value = value.strip()
-                    
-                    if key == 'СПОРТ':
-                        data['sport'] = value
-                    elif key == 'ЛИГА':
-                        data['league'] = value
-                    elif key == 'МАТЧ':
-                        data['match'] = value
-                    elif key == 'ВРЕМЯ':
-                        data['time'] = value
-                    elif key == 'ПРОГНОЗ':
-                        data['prediction'] = value
-                    elif key == 'КОЭФФИЦИЕНТ':
-                        data['odds'] = value
-                    elif key == 'УВЕРЕННОСТЬ':
-                        data['confidence'] = int(value.replace('%', ''))
-                    elif key == 'АНАЛИЗ':
-                        data['analysis'] = value
-                    elif key == 'ФАКТОРЫ':
-                        data['key_factors'] = [f.strip() for f in value.split(',')]
-            
-            # Проверяем что все поля есть
-            required = ['sport', 'league', 'match', 'prediction', 'analysis']
-            if all(field in data for field in required):
-                data['source'] = 'perplexity'
-                return data
-                
+            return parse_prediction(content)
         except Exception as e:
             logger.error(f"Parse error: {e}")
             
@@ -793,6 +1195,10 @@ class EnhancedSportsAnalyzer:
         ]
         return random.choice(match_times)
     
+    async def warm_up(self) -> int:
+        """Прогревает соединения с Perplexity перед плановым запуском"""
+        return await self.perplexity.warm_up()
+    
     async def close(self):
         """Закрытие соединений"""
         await self.perplexity.close_session()
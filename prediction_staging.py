@@ -0,0 +1,112 @@
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+MATCH_TIME_RE = re.compile(r'(\d{1,2})[:.](\d{2})')
+
+
+def shift_time(hour: int, minute: int, minutes: int) -> Tuple[int, int]:
+    """Сдвигает время суток на minutes минут (для расписания предзагрузки)"""
+    total = (hour * 60 + minute + minutes) % (24 * 60)
+    return total // 60, total % 60
+
+
+@dataclass
+class StagedPrediction:
+    """Готовый к отправке прогноз: сам прогноз и отрендеренное сообщение"""
+    prediction: object
+    sport: Optional[str]
+    message: str
+    fetched_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class StagedRun:
+    """Предзагруженная рассылка для одного слота расписания"""
+    slot: str
+    publish_at: datetime
+    items: List[StagedPrediction]
+    created_at: float = field(default_factory=time.time)
+    report: Optional[Dict] = None
+
+
+class PredictionStaging:
+    """Промежуточное хранилище предзагруженных рассылок.
+
+    Задача предзагрузки кладет сюда сгенерированные и отрендеренные прогнозы,
+    задача публикации забирает их. Прогноз считается устаревшим, если он старше
+    max_age_seconds или его матч начинается раньше времени публикации — только
+    такие прогнозы перегенерируются перед отправкой.
+    """
+
+    def __init__(self, max_age_seconds: float = 1800):
+        self.max_age_seconds = max_age_seconds
+        self.moscow_tz = pytz.timezone('Europe/Moscow')
+        self._runs: Dict[str, StagedRun] = {}
+        self.stats = {'staged': 0, 'published': 0, 'missed': 0, 'refreshed': 0}
+
+    @classmethod
+    def from_env(cls) -> "PredictionStaging":
+        """Допустимый возраст прогноза из PREFETCH_MAX_AGE (секунды)"""
+        return cls(max_age_seconds=float(os.getenv('PREFETCH_MAX_AGE', '1800')))
+
+    def publish_time(self, hour: int, minute: int) -> datetime:
+        """Ближайшее время публикации слота по Москве"""
+        now = datetime.now(self.moscow_tz)
+        publish_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if publish_at < now - timedelta(hours=1):
+            publish_at += timedelta(days=1)
+        return publish_at
+
+    def put(self, staged: StagedRun):
+        """Сохраняет рассылку слота (предыдущая непубликованная заменяется)"""
+        self._runs[staged.slot] = staged
+        self.stats['staged'] += 1
+        logger.info(f"📦 Рассылка {staged.slot} подготовлена: {len(staged.items)} прогнозов "
+                    f"к {staged.publish_at.strftime('%H:%M')} МСК")
+
+    def take(self, slot: str) -> Optional[StagedRun]:
+        """Забирает рассылку слота для публикации"""
+        staged = self._runs.pop(slot, None)
+        self.stats['published' if staged else 'missed'] += 1
+        return staged
+
+    def stale_indexes(self, staged: StagedRun) -> List[int]:
+        """Номера прогнозов, которые нужно перегенерировать перед отправкой"""
+        now = time.time()
+        stale = []
+        for index, item in enumerate(staged.items):
+            if now - item.fetched_at > self.max_age_seconds or self._match_started(item, staged.publish_at):
+                stale.append(index)
+        return stale
+
+    def replace(self, staged: StagedRun, index: int, prediction, message: str):
+        """Подменяет устаревший прогноз свежим"""
+        item = staged.items[index]
+        item.prediction = prediction
+        item.message = message
+        item.fetched_at = time.time()
+        self.stats['refreshed'] += 1
+
+    def _match_started(self, item: StagedPrediction, publish_at: datetime) -> bool:
+        match = MATCH_TIME_RE.search(getattr(item.prediction, 'time', None) or "")
+        if not match:
+            return False
+        hour, minute = int(match.group(1)), int(match.group(2))
+        return (hour, minute) <= (publish_at.hour, publish_at.minute)
+
+    def get_stats(self) -> Dict:
+        """Счетчики и подготовленные слоты для /status"""
+        return dict(
+            self.stats,
+            max_age_seconds=self.max_age_seconds,
+            pending={slot: staged.publish_at.isoformat() for slot, staged in self._runs.items()}
+        )
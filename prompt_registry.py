@@ -0,0 +1,421 @@
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+
+from rate_limiter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+RU_MONTHS_GENITIVE = [
+    "ЯНВАРЯ", "ФЕВРАЛЯ", "МАРТА", "АПРЕЛЯ", "МАЯ", "ИЮНЯ",
+    "ИЮЛЯ", "АВГУСТА", "СЕНТЯБРЯ", "ОКТЯБРЯ", "НОЯБРЯ", "ДЕКАБРЯ"
+]
+
+
+def format_ru_date(moment: Optional[datetime] = None) -> str:
+    """Дата по Москве в виде "27 АВГУСТА 2025" для заголовков промптов"""
+    moment = moment or datetime.now(pytz.timezone('Europe/Moscow'))
+    return f"{moment.day} {RU_MONTHS_GENITIVE[moment.month - 1]} {moment.year}"
+
+
+@dataclass(frozen=True)
+class PromptSection:
+    """Часть системного сообщения; optional-секции можно выкинуть ради бюджета"""
+    name: str
+    text: str
+    optional: bool = False
+
+
+@dataclass
+class RenderedPrompt:
+    """Готовый промпт: статичное системное сообщение и короткое пользовательское"""
+    name: str
+    version: int
+    system: str
+    user: str
+    tokens: int
+    trimmed: List[str] = field(default_factory=list)
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+
+class PromptTemplate:
+    """Версионированный шаблон промпта, собранный один раз при импорте.
+
+    Статичные инструкции лежат в системном сообщении (одинаковом для всех вызовов),
+    переменные — в маленьком пользовательском шаблоне. Оценки токенов секций
+    считаются заранее, поэтому проверка бюджета не пересобирает текст.
+    """
+
+    def __init__(self, name: str, version: int, sections: List[PromptSection], user_template: str):
+        self.name = name
+        self.version = version
+        self.sections = sections
+        self.user_template = user_template.strip()
+        # Имена подстановок проверяются при рендере, а не ловятся KeyError в середине запуска
+        self.fields = {f for _, f, _, _ in Formatter().parse(self.user_template) if f}
+        self.section_tokens = {section.name: estimate_tokens(section.text) for section in sections}
+        self._system_cache: Dict[Tuple[str, ...], str] = {}
+        self.system = self._system_without(())
+        self.system_tokens = estimate_tokens(self.system)
+
+    def _system_without(self, skipped: Tuple[str, ...]) -> str:
+        if skipped not in self._system_cache:
+            self._system_cache[skipped] = "\n\n".join(
+                section.text for section in self.sections if section.name not in skipped
+            )
+        return self._system_cache[skipped]
+
+    def render(self, max_tokens: Optional[int] = None, **values) -> RenderedPrompt:
+        """Подставляет переменные; при max_tokens выкидывает optional-секции с конца"""
+        missing = self.fields - set(values)
+        if missing:
+            raise KeyError(f"Промпт {self.name}: не переданы {', '.join(sorted(missing))}")
+
+        user = self.user_template.format(**values)
+        tokens = self.system_tokens + estimate_tokens(user)
+        skipped: List[str] = []
+
+        if max_tokens and tokens > max_tokens:
+            for section in reversed(self.sections):
+                if tokens <= max_tokens:
+                    break
+                if section.optional:
+                    skipped.append(section.name)
+                    tokens -= self.section_tokens[section.name]
+            if tokens > max_tokens:
+                logger.warning(f"✂️ Промпт {self.name}: {tokens} токенов не влезает в бюджет {max_tokens}")
+
+        system = self._system_without(tuple(sorted(skipped))) if skipped else self.system
+        return RenderedPrompt(self.name, self.version, system, user, tokens, skipped)
+
+
+class PromptRegistry:
+    """Реестр шаблонов промптов по имени"""
+
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+
+    def register(self, template: PromptTemplate) -> PromptTemplate:
+        self._templates[template.name] = template
+        return template
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._templates
+
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def render(self, name: str, max_tokens: Optional[int] = None, **values) -> RenderedPrompt:
+        return self.get(name).render(max_tokens=max_tokens, **values)
+
+    def describe(self) -> Dict:
+        """Версии и оценки токенов шаблонов для /status"""
+        return {
+            name: {
+                'version': template.version,
+                'system_tokens': template.system_tokens,
+                'optional_tokens': sum(
+                    template.section_tokens[s.name] for s in template.sections if s.optional
+                )
+            }
+            for name, template in self._templates.items()
+        }
+
+
+def prompt_budget_from_env() -> Optional[int]:
+    """Бюджет токенов промпта из PERPLEXITY_LATENCY_TARGET (секунды).
+
+    Без целевой задержки бюджета нет. Иначе он равен цели, умноженной на
+    PERPLEXITY_PROMPT_TOKENS_PER_SECOND — сколько токенов промпта API
+    обрабатывает за секунду ожидания.
+    """
+    target = float(os.getenv('PERPLEXITY_LATENCY_TARGET', '0') or 0)
+    if target <= 0:
+        return None
+    return int(target * float(os.getenv('PERPLEXITY_PROMPT_TOKENS_PER_SECOND', '100')))
+
+
+PROMPTS = PromptRegistry()
+
+# --- Прогноз на один матч -------------------------------------------------
+
+LEAGUE_RULES = PromptSection("league_rules", """⚠️ КРИТИЧЕСКИ ВАЖНЫЕ ТРЕБОВАНИЯ:
+- Премьер-лига: только английские клубы (Манчестер Сити, Ливерпуль, Арсенал, Челси, Тоттенхэм, и т.д.)
+- Ла Лига: только испанские клубы (Реал Мадрид, Барселона, Атлетико Мадрид, Севилья и т.д.)
+- Серия А: только итальянские клубы (Ювентус, Милан, Интер, Наполи, Рома и т.д.)
+- Бундеслига: только немецкие клубы (Бавария, Боруссия Дортмунд, РБ Лейпциг и т.д.)""")
+
+PREDICTION_FORMAT = PromptSection("format", """📋 ФОРМАТ ОТВЕТА (СТРОГО СОБЛЮДАЙ):
+СПОРТ: [Вид спорта из запроса]
+ЛИГА: [Название лиги БЕЗ смешивания команд из разных стран]
+МАТЧ: [Команда 1 - Команда 2] (ТОЛЬКО команды из одной страны/лиги!)
+ВРЕМЯ: [ЧЧ:ММ МСК] (реалистичное время 15:00-22:30)
+ПРОГНОЗ: [ТОЛЬКО из допустимых ставок - соответствует виду спорта]
+КОЭФФИЦИЕНТ: [1.XX-4.XX] (реалистичный)
+УВЕРЕННОСТЬ: [75-95%] (на основе анализа)
+АНАЛИЗ: [Минимум 150 слов ДЕТАЛЬНОГО профессионального анализа с конкретной статистикой, формой команд, мотивацией, травмами, тактикой. Пиши как топ-эксперт с 15-летним опытом. Включи конкретные цифры и факты.]
+ФАКТОРЫ: [3 конкретных фактора через запятую - домашняя форма, травмы, мотивация, тактика]""")
+
+QUALITY_RULES = PromptSection("quality_rules", """🔥 ТРЕБОВАНИЯ К КАЧЕСТВУ:
+1. Анализ должен содержать КОНКРЕТНУЮ статистику (проценты, голы, очки)
+2. Упоминай последние 5-7 матчей команд
+3. Анализируй личные встречи
+4. Учитывай травмы ключевых игроков
+5. Мотивационные факторы (место в турнире, цели)
+6. Домашний/выездной фактор""", optional=True)
+
+EXPERT_STYLE = PromptSection("expert_style", """📊 СДЕЛАЙ ЭТО КАК НАСТОЯЩИЙ ЭКСПЕРТ ESPN/Sky Sports уровня!
+Найди АКТУАЛЬНЫЙ матч на сегодня или создай максимально реалистичный!""")
+
+PROMPTS.register(PromptTemplate(
+    "prediction", 2,
+    [LEAGUE_RULES, PREDICTION_FORMAT, QUALITY_RULES, EXPERT_STYLE],
+    """
+🎯 ПРОФЕССИОНАЛЬНЫЙ СПОРТИВНЫЙ АНАЛИЗ НА {sport_upper} - {date}
+🎯 ДОПУСТИМЫЕ СТАВКИ ДЛЯ {sport_upper}: {bets}
+СПОРТ: {sport_display}
+"""
+))
+
+PROMPTS.register(PromptTemplate(
+    "prediction_batch", 2,
+    [LEAGUE_RULES, PREDICTION_FORMAT, QUALITY_RULES, EXPERT_STYLE],
+    """
+🎯 ПРОФЕССИОНАЛЬНЫЙ СПОРТИВНЫЙ АНАЛИЗ: {count} ПРОГНОЗА(ОВ) - {date}
+🎯 НУЖНЫ ПРОГНОЗЫ (ПО ОДНОМУ МАТЧУ НА КАЖДЫЙ ПУНКТ):
+{items}
+Каждый прогноз начинай отдельной строкой "=== ПРОГНОЗ N ===", где N — номер пункта из списка.
+"""
+))
+
+# --- Матчи дня ------------------------------------------------------------
+
+PROMPTS.register(PromptTemplate(
+    "matches.football", 2,
+    [
+        PromptSection("task", "Для каждого матча дай МАКСИМАЛЬНО ДЕТАЛЬНЫЙ ПРОФЕССИОНАЛЬНЫЙ АНАЛИЗ на русском языке (минимум 200-300 слов):"),
+        PromptSection("match_info", """1. ПОЛНАЯ ИНФОРМАЦИЯ О МАТЧЕ:
+   - Точные названия команд и турнир
+   - Время начала по МСК
+   - Стадион и его особенности
+   - Судья матча (если известно)"""),
+        PromptSection("form", """2. ГЛУБОКИЙ АНАЛИЗ ТЕКУЩЕЙ ФОРМЫ (последние 7-10 матчей):
+   - Детальные результаты каждой команды
+   - Статистика голов за/против в каждом матче
+   - Качество игры против сильных/слабых соперников
+   - Динамика улучшения/ухудшения"""),
+        PromptSection("head_to_head", """3. ИСЧЕРПЫВАЮЩАЯ СТАТИСТИКА ЛИЧНЫХ ВСТРЕЧ:
+   - Последние 10 матчей между командами
+   - Статистика на домашнем поле хозяев
+   - Особенности игры именно в этом противостоянии
+   - Кто доминировал в разные периоды""", optional=True),
+        PromptSection("squads", """4. ДЕТАЛЬНЫЙ АНАЛИЗ СОСТАВОВ:
+   - Ключевые игроки и их текущая форма
+   - Травмы, дисквалификации, сомнительные
+   - Статистика лучших бомбардиров
+   - Голкиперы и их надежность
+   - Новые трансферы и их влияние""", optional=True),
+        PromptSection("tactics", """5. ТАКТИЧЕСКИЙ РАЗБОР:
+   - Предпочитаемые схемы каждой команды
+   - Как команды играют против подобных соперников
+   - Слабые места в обороне/атаке
+   - Сильные стороны и как их могут использовать
+   - Ожидаемые тактические решения тренеров""", optional=True),
+        PromptSection("motivation", """6. МОТИВАЦИОННЫЕ И КОНТЕКСТУАЛЬНЫЕ ФАКТОРЫ:
+   - Турнирные задачи каждой команды
+   - Влияние предыдущих результатов на моральный дух
+   - Давление болельщиков и медиа
+   - Финансовые стимулы (премии за результат)
+   - Исторические факторы соперничества""", optional=True),
+        PromptSection("forecast", """7. ДЕТАЛЬНЫЙ ПРОГНОЗ С ОБОСНОВАНИЕМ:
+   - Наиболее вероятный основной исход (1X2)
+   - Ожидаемый точный счет с аргументацией
+   - Анализ вероятности различных сценариев
+   - Прогноз по тоталу голов с детальным обоснованием
+   - Прогноз статистики (углы, карточки, владение)"""),
+        PromptSection("bookmakers", """8. БУКМЕКЕРСКАЯ АНАЛИТИКА:
+   - Сравнение коэффициентов разных БК
+   - Value-ставки (недооцененные рынки)
+   - Рекомендуемые размеры ставок
+   - Альтернативные рынки для ставок""", optional=True),
+        PromptSection("style", "ВАЖНО: Пиши как топ-эксперт с 20-летним опытом, используй конкретные цифры, статистику, ссылайся на конкретные матчи и события. Минимум 250-300 слов на каждый матч."),
+    ],
+    "Найди ТОП-3 самых интересных футбольных матча на сегодня {today} из ведущих европейских лиг (Премьер-лига, Ла Лига, Серия А, Бундеслига, Лига Чемпионов)."
+))
+
+PROMPTS.register(PromptTemplate(
+    "matches.basketball", 2,
+    [
+        PromptSection("task", """Дай ЭКСПЕРТНЫЙ АНАЛИЗ на русском языке для каждого матча:
+
+1. Полные названия команд и лига
+2. Время начала по МСК
+3. Анализ текущей формы команд (последние 7-10 игр)
+4. Статистика очно встреч в этом сезоне
+5. Ключевые игроки, их статистика, травмы
+6. Анализ стиля игры (темп, защита, атака)
+7. Домашний фактор и мотивация
+8. Детальный прогноз с обоснованием
+9. Анализ тотала очков с аргументацией
+10. Букмекерские коэффициенты"""),
+        PromptSection("style", "Будь экспертом уровня NBA Analytics с глубоким пониманием игры.", optional=True),
+    ],
+    "Найди ТОП-3 самых перспективных баскетбольных матча на сегодня {today} (НБА, Евролига, ВТБ)."
+))
+
+PROMPTS.register(PromptTemplate(
+    "matches.tennis", 2,
+    [
+        PromptSection("task", "Для каждого матча дай ЭКСПЕРТНЫЙ АНАЛИЗ на русском языке (минимум 200-250 слов):"),
+        PromptSection("match_info", """1. ИНФОРМАЦИЯ О МАТЧЕ:
+   - Полные имена теннисистов и турнир
+   - Время матча по МСК и часовой пояс
+   - Тип покрытия корта (хард, грунт, трава)
+   - Погодные условия и их влияние
+   - Круг турнира и его важность"""),
+        PromptSection("rankings", """2. РЕЙТИНГИ И СТАТИСТИКА:
+   - Текущие рейтинги ATP/WTA
+   - Изменения рейтинга за последний месяц
+   - Статистика побед/поражений в сезоне
+   - Достижения в карьере на данном покрытии""", optional=True),
+        PromptSection("form", """3. ДЕТАЛЬНАЯ ФОРМА ИГРОКОВ:
+   - Результаты последних 7-10 матчей
+   - Качество соперников в последних играх
+   - Физическое состояние и усталость
+   - Время восстановления после предыдущего матча
+   - Мотивация и цели в турнире"""),
+        PromptSection("head_to_head", """4. СТАТИСТИКА ЛИЧНЫХ ВСТРЕЧ:
+   - Все предыдущие матчи между игроками
+   - Результаты на разных покрытиях
+   - Эволюция противостояния по годам
+   - Ключевые моменты прошлых встреч""", optional=True),
+        PromptSection("technique", """5. ТЕХНИЧЕСКИЙ АНАЛИЗ ИГРЫ:
+   - Стиль игры каждого теннисиста
+   - Сильные удары и тактические предпочтения
+   - Статистика подач (эйсы, двойные ошибки)
+   - Эффективность на приеме подачи
+   - Игра с задней линии vs выходы к сетке
+   - Движение по корту и выносливость""", optional=True),
+        PromptSection("psychology", """6. ПСИХОЛОГИЧЕСКИЕ ФАКТОРЫ:
+   - Ментальная устойчивость в решающих моментах
+   - Статистика в тай-брейках
+   - Поведение в стрессовых ситуациях
+   - Поддержка болельщиков
+   - Опыт игры в данных условиях""", optional=True),
+        PromptSection("forecast", """7. ПОДРОБНЫЙ ПРОГНОЗ:
+   - Основной исход с детальным обоснованием
+   - Прогноз по количеству сетов
+   - Ожидаемая продолжительность матча
+   - Прогноз по тоталу геймов
+   - Вероятность тай-брейков
+   - Статистические ставки (эйсы, двойные)"""),
+        PromptSection("bookmakers", """8. БУКМЕКЕРСКАЯ ОЦЕНКА:
+   - Анализ коэффициентов
+   - Рекомендуемые ставки
+   - Value в разных рынках""", optional=True),
+        PromptSection("style", "Анализируй как эксперт уровня Tennis Channel с глубоким пониманием всех нюансов игры и психологии."),
+    ],
+    "Найди ТОП-3 самых интересных теннисных матча на сегодня {today} (ATP, WTA, Masters, Grand Slam)."
+))
+
+PROMPTS.register(PromptTemplate(
+    "matches.hockey", 2,
+    [
+        PromptSection("task", """Глубокий экспертный анализ на русском языке:
+
+1. Полные названия команд и лига
+2. Время начала по МСК
+3. Турнирное положение и мотивация команд
+4. Текущая форма (последние 10 матчей)
+5. Статистика личных встреч в сезоне
+6. Ключевые игроки, голкиперы, травмы
+7. Статистика в большинстве/меньшинстве
+8. Домашний лед и особенности арены
+9. Детальный прогноз с аргументацией
+10. Анализ тотала шайб"""),
+        PromptSection("style", "Анализируй как эксперт NHL Network с профессиональным пониманием хоккея.", optional=True),
+    ],
+    "Найди ТОП-3 самых интересных хоккейных матча на сегодня {today} (НХЛ, КХЛ)."
+))
+
+# --- Анализ матча и ставок --------------------------------------------------
+
+PROMPTS.register(PromptTemplate(
+    "team_analysis", 2,
+    [
+        PromptSection("form", """🔍 ОБЯЗАТЕЛЬНО ВКЛЮЧИ:
+
+1. **ТЕКУЩАЯ ФОРМА** (последние 7 матчей каждой команды):
+   - Результаты, голы, пропущенные
+   - Динамика игры и тренд"""),
+        PromptSection("head_to_head", """2. **СТАТИСТИКА ОЧНЫХ ВСТРЕЧ**:
+   - Последние 5-7 личных матчей
+   - Кто доминирует и почему"""),
+        PromptSection("players", """3. **КЛЮЧЕВЫЕ ИГРОКИ**:
+   - Топ-бомбардиры, ассистенты
+   - Травмы и дисквалификации
+   - Игроки в форме""", optional=True),
+        PromptSection("tactics", """4. **ТАКТИЧЕСКИЙ АНАЛИЗ**:
+   - Стиль игры каждой команды
+   - Сильные и слабые стороны
+   - Как команды играют друг против друга""", optional=True),
+        PromptSection("motivation", """5. **МОТИВАЦИОННЫЕ ФАКТОРЫ**:
+   - Турнирные задачи команд
+   - Домашний фактор
+   - Психологическое состояние""", optional=True),
+        PromptSection("forecast", """6. **ДЕТАЛЬНЫЙ ПРОГНОЗ**:
+   - Наиболее вероятный исход с обоснованием
+   - Ожидаемый счет
+   - Альтернативные сценарии"""),
+        PromptSection("bets", """7. **РЕКОМЕНДАЦИИ ДЛЯ СТАВОК**:
+   - Основной исход (1X2)
+   - Тотал голов/очков
+   - Дополнительные рынки"""),
+        PromptSection("style", "Будь максимально конкретным, профессиональным и убедительным. Твой анализ должен быть на уровне топ-экспертов ESPN/Sky Sports.", optional=True),
+    ],
+    "ЭКСПЕРТНЫЙ АНАЛИЗ матча {team1} против {team2} - отвечай на русском языке как топ-аналитик."
+))
+
+PROMPTS.register(PromptTemplate(
+    "betting_insights", 2,
+    [
+        PromptSection("outcomes", """🎯 ОБЯЗАТЕЛЬНО ПРОАНАЛИЗИРУЙ:
+
+1. **ОСНОВНЫЕ ИСХОДЫ (1X2)**:
+   - Вероятности каждого исхода в %
+   - Текущие коэффициенты топ-букмекеров
+   - Value-ставки (переоцененные коэффициенты)"""),
+        PromptSection("totals", """2. **ТОТАЛ ГОЛОВ/ОЧКОВ**:
+   - Статистика команд по тоталу
+   - Рекомендуемая линия (больше/меньше)
+   - Обоснование через статистику атаки/защиты"""),
+        PromptSection("handicaps", """3. **ФОРЫ И ГАНДИКАПЫ**:
+   - Азиатские форы с максимальной вероятностью
+   - Европейские форы для фаворита/аутсайдера""", optional=True),
+        PromptSection("stats_bets", """4. **СТАТИСТИЧЕСКИЕ СТАВКИ**:
+   - Угловые удары (если футбол)
+   - Карточки и нарушения
+   - Точный счет (наиболее вероятные варианты)""", optional=True),
+        PromptSection("live", """5. **LIVE-СТАВКИ ВОЗМОЖНОСТИ**:
+   - Сценарии развития матча
+   - Когда ожидать лучшие коэффициенты""", optional=True),
+        PromptSection("risk", """6. **РИСК-МЕНЕДЖМЕНТ**:
+   - Рекомендуемые размеры ставок
+   - Уровень риска каждой ставки
+   - Bankroll management""", optional=True),
+        PromptSection("top3", """7. **ТОП-3 РЕКОМЕНДАЦИИ**:
+   - Самые надежные ставки
+   - Ставки с лучшим value
+   - Комбинированные экспрессы"""),
+        PromptSection("style", "Анализируй как эксперт Pinnacle Sports с многолетним опытом и математическим подходом.", optional=True),
+    ],
+    "ЭКСПЕРТНЫЙ АНАЛИЗ СТАВОК на матч {match} - отвечай на русском как топ-аналитик букмекерской конторы."
+))
@@ -6,6 +6,7 @@ from datetime import datetime
 import pytz
 import config
 from main_bot import HybridSportsBot
+from prompt_registry import PROMPTS
 
 # Настройка логирования для Railway
 logging.basicConfig(
@@ -30,6 +31,7 @@ class WebServer:
         self.app.router.add_get('/', self.health_check)
         self.app.router.add_get('/health', self.health_check)
         self.app.router.add_get('/status', self.bot_status)
+        self.app.router.add_get('/usage', self.usage_stats)
         self.app.router.add_post('/test', self.test_predictions)
     
     async def health_check(self, request):
@@ -52,7 +54,15 @@ class WebServer:
                 'bot_name': me.first_name,
                 'scheduler_running': self.bot.scheduler.running if hasattr(self.bot.scheduler, 'running') else True,
                 'jobs_count': len(self.bot.scheduler.get_jobs()) if hasattr(self.bot.scheduler, 'get_jobs') else 0,
-                'perplexity_enabled': self.bot.use_perplexity if hasattr(self.bot, 'use_perplexity') else False
+                'perplexity_enabled': self.bot.use_perplexity if hasattr(self.bot, 'use_perplexity') else False,
+                'perplexity_stats': self.bot.perplexity_analyzer.perplexity.get_stats() if getattr(self.bot, 'perplexity_analyzer', None) else None,
+                'parse_stats': self.bot.perplexity_analyzer.get_parse_stats() if getattr(self.bot, 'perplexity_analyzer', None) else None,
+                'batch_stats': self.bot.perplexity_analyzer.get_batch_stats() if getattr(self.bot, 'perplexity_analyzer', None) else None,
+                'prompts': PROMPTS.describe(),
+                'last_run': getattr(self.bot, 'last_run_report', None),
+                'staging': self.bot.staging.get_stats() if getattr(self.bot, 'staging', None) else None,
+                'telegram_stats': self.bot.outbox.get_stats() if getattr(self.bot, 'outbox', None) else None,
+                'packing_stats': self.bot.packer.get_stats() if getattr(self.bot, 'packer', None) else None
             })
         except Exception as e:
             logger.error(f"Bot status error: {e}")
@@ -61,6 +71,15 @@ class WebServer:
                 'error': str(e)
             }, status=500)
     
+    async def usage_stats(self, request):
+        """Токены и задержки Perplexity по моделям, типам запросов, запускам и дням"""
+        analyzer = getattr(self.bot, 'perplexity_analyzer', None)
+        if not analyzer:
+            return web.json_response({'status': 'disabled', 'message': 'Perplexity API не подключен'})
+        days = int(request.query.get('days', 7))
+        runs = int(request.query.get('runs', 10))
+        return web.json_response(analyzer.perplexity.usage.get_stats(days=days, runs=runs))
+    
     async def test_predictions(self, request):
         """Ручной запуск тестовых прогнозов"""
         try:
@@ -123,9 +142,9 @@ async def main():
         logger.info("✅ Все сервисы запущены успешно!")
         logger.info("📊 Бот будет отправлять прогнозы в 9:50 и 15:00 МСК")
         
-        # Отправляем стартовое сообщение
+        # Досылаем прерванную рассылку и отправляем стартовое сообщение (один раз за день)
         try:
-            await bot.test_send()
+            await bot.startup()
             logger.info("📤 Стартовое сообщение отправлено")
         except Exception as e:
             logger.warning(f"⚠️ Не удалось отправить стартовое сообщение: {e}")
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Классический token bucket: емкость и скорость пополнения в единицах в секунду"""
+
+    def __init__(self, capacity: float, per_minute: float):
+        self.capacity = float(capacity)
+        self.rate = float(per_minute) / 60.0
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Сколько секунд нужно подождать, чтобы в корзине появилось amount единиц"""
+        if self.rate <= 0:
+            return 0.0  # Лимит 0 — ограничение отключено
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        """Списывает единицы (может уйти в минус при корректировке по факту)"""
+        self.tokens -= amount
+
+    def refund(self, amount: float):
+        """Возвращает неиспользованные единицы"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Общий асинхронный лимитер запросов к Perplexity API.
+
+    Для каждой модели держит две корзины — запросы в минуту (RPM) и токены в минуту
+    (TPM). Ожидающие вызовы обслуживаются строго в порядке очереди: asyncio.Lock
+    будит ожидающих по FIFO, поэтому поздний вызов не обгонит ранний. Ответ 429
+    с заголовком Retry-After блокирует модель на указанное время.
+    """
+
+    def __init__(self, requests_per_minute: int = 50, tokens_per_minute: int = 200000,
+                 model_limits: Optional[Dict[str, Tuple[int, int]]] = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # Индивидуальные лимиты моделей: {"sonar-pro": (rpm, tpm)}
+        self.model_limits = model_limits or {}
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._blocked_until: Dict[str, float] = {}
+        self.stats = {'acquired': 0, 'throttled': 0, 'wait_seconds': 0.0, 'retry_after': 0}
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """Создает лимитер из переменных окружения PERPLEXITY_RPM / PERPLEXITY_TPM"""
+        return cls(
+            requests_per_minute=int(os.getenv('PERPLEXITY_RPM', '50')),
+            tokens_per_minute=int(os.getenv('PERPLEXITY_TPM', '200000'))
+        )
+
+    def _get_buckets(self, model: str) -> Tuple[TokenBucket, TokenBucket]:
+        if model not in self._buckets:
+            rpm, tpm = self.model_limits.get(model, (self.requests_per_minute, self.tokens_per_minute))
+            self._buckets[model] = (TokenBucket(rpm, rpm), TokenBucket(tpm, tpm))
+        return self._buckets[model]
+
+    def _get_lock(self, model: str) -> asyncio.Lock:
+        # Создаем лениво, чтобы Lock привязался к работающему event loop
+        if model not in self._locks:
+            self._locks[model] = asyncio.Lock()
+        return self._locks[model]
+
+    async def acquire(self, model: str, tokens: int = 0):
+        """Ждет, пока модель сможет принять запрос с оценкой tokens токенов"""
+        requests_bucket, tokens_bucket = self._get_buckets(model)
+        started = time.monotonic()
+        throttled = False
+
+        async with self._get_lock(model):
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    requests_bucket.wait_time(1, now),
+                    tokens_bucket.wait_time(tokens, now),
+                    self._blocked_until.get(model, 0.0) - now
+                )
+                if wait <= 0:
+                    requests_bucket.consume(1)
+                    tokens_bucket.consume(tokens)
+                    break
+                throttled = True
+                await asyncio.sleep(wait)
+
+        waited = time.monotonic() - started
+        self.stats['acquired'] += 1
+        self.stats['wait_seconds'] += waited
+        if throttled:
+            self.stats['throttled'] += 1
+            logger.info(f"🚦 Лимит {model}: ожидание {waited:.2f} с")
+
+    def record_usage(self, model: str, estimated_tokens: int, actual_tokens: int):
+        """Корректирует TPM-корзину по фактическому расходу из блока usage"""
+        _, tokens_bucket = self._get_buckets(model)
+        delta = actual_tokens - estimated_tokens
+        if delta > 0:
+            tokens_bucket.consume(delta)
+        elif delta < 0:
+            tokens_bucket.refund(-delta)
+
+    def block(self, model: str, retry_after: float):
+        """Блокирует модель на retry_after секунд (ответ 429)"""
+        until = time.monotonic() + max(0.0, retry_after)
+        self._blocked_until[model] = max(self._blocked_until.get(model, 0.0), until)
+        self.stats['retry_after'] += 1
+        logger.warning(f"🚦 {model} ограничен сервером на {retry_after:.1f} с (Retry-After)")
+
+    def get_stats(self) -> Dict:
+        """Статистика лимитера для мониторинга"""
+        return dict(self.stats, wait_seconds=round(self.stats['wait_seconds'], 3))
+
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """Разбирает заголовок Retry-After: число секунд или HTTP-дата"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов: ~3 символа на токен для русского текста"""
+    return len(text) // 3 + 1
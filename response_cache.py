@@ -0,0 +1,128 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# Время жизни ответа по типу запроса (секунды)
+DEFAULT_TTLS = {
+    'matches': 6 * 3600,
+    'team_analysis': 12 * 3600,
+    'betting_insights': 3 * 3600,
+    'prediction': 6 * 3600,
+}
+
+
+class ResponseCache:
+    """Кэш ответов Perplexity с TTL, LRU-вытеснением и сжатым хранилищем на диске.
+
+    Ключ — модель, нормализованный промпт и календарная дата по Москве, поэтому
+    плановый запуск, стартовый test_send() и ручной /test в один день получают
+    один и тот же ответ, а на следующий день кэш естественно устаревает.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 256,
+                 ttls: Optional[Dict[str, int]] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.moscow_tz = pytz.timezone('Europe/Moscow')
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+        self._load()
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """Создает кэш из переменных окружения (PERPLEXITY_CACHE=0 отключает его)"""
+        if str(os.getenv('PERPLEXITY_CACHE', '1')).lower() not in ['1', 'true', 'yes']:
+            return None
+        return cls(
+            path=os.getenv('PERPLEXITY_CACHE_PATH', '.cache/perplexity_cache.json.gz'),
+            max_entries=int(os.getenv('PERPLEXITY_CACHE_SIZE', '256'))
+        )
+
+    def make_key(self, model: str, prompt: str) -> str:
+        """Ключ кэша: модель + нормализованный промпт + дата по Москве"""
+        normalized = " ".join(prompt.split()).lower()
+        today = datetime.now(self.moscow_tz).strftime("%Y-%m-%d")
+        return hashlib.sha256(f"{model}|{today}|{normalized}".encode('utf-8')).hexdigest()
+
+    def get(self, model: str, prompt: str) -> Optional[Dict]:
+        """Возвращает сохраненный ответ или None"""
+        key = self.make_key(model, prompt)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        if entry['expires'] <= time.time():
+            del self._entries[key]
+            self.stats['expired'] += 1
+            self.stats['misses'] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return entry['data']
+
+    def set(self, kind: str, model: str, prompt: str, data: Dict):
+        """Сохраняет ответ с TTL для типа запроса kind"""
+        key = self.make_key(model, prompt)
+        self._entries[key] = {
+            'kind': kind,
+            'expires': time.time() + self.ttls.get(kind, 3600),
+            'data': data
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+        self._save()
+
+    def invalidate(self, model: str, prompt: str):
+        """Удаляет ответ (например, если его не удалось разобрать)"""
+        if self._entries.pop(self.make_key(model, prompt), None) is not None:
+            self._save()
+
+    def get_stats(self) -> Dict:
+        """Счетчики попаданий/промахов для /status"""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return dict(
+            self.stats,
+            entries=len(self._entries),
+            hit_rate=round(self.stats['hits'] / lookups, 3) if lookups else 0.0
+        )
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                stored = json.load(f)
+            now = time.time()
+            for key, entry in stored:
+                if entry['expires'] > now:
+                    self._entries[key] = entry
+            logger.info(f"💾 Кэш Perplexity загружен: {len(self._entries)} записей")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось загрузить кэш Perplexity: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                json.dump(list(self._entries.items()), f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить кэш Perplexity: {e}")
@@ -0,0 +1,318 @@
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+THINK_OPEN = '<think>'
+THINK_CLOSE = '</think>'
+
+# Ключи ответа в формате PREDICTION_FORMAT → поля прогноза
+PREDICTION_FIELDS = {
+    'СПОРТ': 'sport',
+    'ЛИГА': 'league',
+    'МАТЧ': 'match',
+    'ВРЕМЯ': 'time',
+    'ПРОГНОЗ': 'prediction',
+    'КОЭФФИЦИЕНТ': 'odds',
+    'УВЕРЕННОСТЬ': 'confidence',
+    'АНАЛИЗ': 'analysis',
+    'ФАКТОРЫ': 'key_factors',
+}
+REQUIRED_PREDICTION_FIELDS = ('sport', 'league', 'match', 'prediction', 'analysis')
+# Необязательные поля: без них прогноз получает те же значения, что и в JSON-режиме
+DEFAULT_CONFIDENCE = 75
+# Поля, после которых потоковую генерацию можно оборвать
+STREAM_STOP_FIELDS = ('СПОРТ', 'ЛИГА', 'МАТЧ', 'ПРОГНОЗ', 'АНАЛИЗ', 'ФАКТОРЫ')
+# Значение может занимать несколько строк: поле завершается следующим ключом или концом ответа
+MULTILINE_FIELDS = ('АНАЛИЗ', 'ФАКТОРЫ')
+
+# Строка с ключом: допускает разметку вокруг ключа (**АНАЛИЗ:**, ### ЛИГА:, - МАТЧ:) и «КЛЮЧЕВЫЕ ФАКТОРЫ»
+FIELD_RE = re.compile(
+    r'[ \t]*(?:[#>*_\-•]+[ \t]*)?(?:КЛЮЧЕВЫЕ[ \t]+)?(?P<key>' + '|'.join(PREDICTION_FIELDS) + r')'
+    r'[ \t*_]*:[ \t*_]*(?P<value>.*?)[ \t*_]*$',
+    re.IGNORECASE
+)
+LIST_ITEM_RE = re.compile(r'[ \t]*(?:\d{1,3}[.)]|[•\-–*])[ \t]+(?P<text>.+?)[ \t]*$')
+NUMBER_RE = re.compile(r'\d+')
+
+# Матч в строке: «Команда 1 - Команда 2», «vs», «против»; номер/маркер списка и разметка вокруг допустимы,
+# строки вида «Ключ: а - б» матчем не считаются
+TEAMS_RE = re.compile(
+    r'^[ \t]*(?:\d{1,3}[.)][ \t]*|[•\-–*][ \t]+)?[*_ \t]*'
+    r'(?P<home>[^\s:][^\n:]*?)[ \t]+(?:[-–—]|vs\.?|против)[ \t]+(?P<away>\S[^\n]*?)[ \t*_]*$',
+    re.IGNORECASE
+)
+# Только настоящее время ЧЧ:ММ, а не любое двоеточие
+TIME_RE = re.compile(r'(?<![\d:])(?P<hours>[01]?\d|2[0-3])[:.](?P<minutes>[0-5]\d)(?![\d:])')
+LEAGUE_RE = re.compile(r'[ \t*_#]*(?:ЛИГА|ТУРНИР|LEAGUE)[ \t*_]*:[ \t*_]*(?P<league>.+?)[ \t*_]*$', re.IGNORECASE)
+# Хвост с лигой в скобках: «Реал - Барселона (Ла Лига)»
+LEAGUE_SUFFIX_RE = re.compile(r'[ \t]*\((?P<league>[^()]+)\)[ \t]*$')
+
+
+class ThinkStripper:
+    """Убирает блоки рассуждений <think>...</think> из потока по мере поступления.
+
+    Тег может прийти разрезанным между фрагментами, поэтому хвост, похожий на
+    начало тега, придерживается до следующего фрагмента. Закрывающий тег без
+    открывающего (часть моделей его не пишет) означает, что все до него было
+    рассуждением: в этом случае выставляется reset, и разбор начинается заново.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._inside = False
+        self.reset = False
+
+    def feed(self, chunk: str) -> str:
+        """Текст без рассуждений, который уже можно разбирать"""
+        text, self._pending = self._pending + chunk, ""
+        output = []
+        while text:
+            if self._inside:
+                end = text.find(THINK_CLOSE)
+                if end == -1:
+                    self._pending = self._tail(text, THINK_CLOSE)
+                    return "".join(output)
+                text, self._inside = text[end + len(THINK_CLOSE):], False
+                continue
+            start, stray = text.find(THINK_OPEN), text.find(THINK_CLOSE)
+            if stray != -1 and (start == -1 or stray < start):
+                # Рассуждение без открывающего тега: все до него отбрасывается
+                output, text, self.reset = [], text[stray + len(THINK_CLOSE):], True
+                continue
+            if start == -1:
+                keep = max(self._tail(text, THINK_OPEN), self._tail(text, THINK_CLOSE), key=len)
+                output.append(text[:len(text) - len(keep)])
+                self._pending = keep
+                return "".join(output)
+            output.append(text[:start])
+            text, self._inside = text[start + len(THINK_OPEN):], True
+        return "".join(output)
+
+    def close(self) -> str:
+        """Конец потока: придержанный хвост оказался обычным текстом (если это не рассуждение)"""
+        tail, self._pending = ("" if self._inside else self._pending), ""
+        return tail
+
+    @staticmethod
+    def _tail(text: str, tag: str) -> str:
+        """Конец text, который может оказаться началом tag"""
+        for size in range(min(len(tag) - 1, len(text)), 0, -1):
+            if tag.startswith(text[-size:]):
+                return text[-size:]
+        return ""
+
+
+class LineStreamParser(ABC):
+    """Основа потоковых разборщиков: режет поток на строки без рассуждений.
+
+    feed() принимает фрагменты любого размера и возвращает результаты, которые
+    стали полными на этом фрагменте; close() дочитывает последнюю строку.
+    """
+
+    def __init__(self):
+        self._think = ThinkStripper()
+        self._buffer = ""
+
+    def feed(self, chunk: str) -> list:
+        text = self._think.feed(chunk)
+        if self._think.reset:
+            self._think.reset = False
+            self._buffer = ""
+            self.restart()
+        self._buffer += text
+        completed = []
+        if '\n' in self._buffer:
+            *lines, self._buffer = self._buffer.split('\n')
+            for line in lines:
+                completed.extend(self._line(line))
+        return completed
+
+    def close(self) -> list:
+        self._buffer += self._think.close()
+        completed = self._line(self._buffer) if self._buffer else []
+        self._buffer = ""
+        return completed + self._finish()
+
+    def restart(self):
+        """Сброс разобранного (после закрывающего </think> без открывающего)"""
+
+    @abstractmethod
+    def _line(self, line: str) -> list:
+        """Результаты, ставшие полными на строке line"""
+
+    def _finish(self) -> list:
+        return []
+
+
+class PredictionStreamParser(LineStreamParser):
+    """Потоковый разбор ответа в формате PREDICTION_FORMAT (СПОРТ: ... ФАКТОРЫ: ...).
+
+    Однострочное поле готово в конце своей строки, АНАЛИЗ — со следующим ключом,
+    ФАКТОРЫ — в конце строки, если перечислены через запятую, или после
+    списка. feed() возвращает пары (поле, значение) по мере готовности, поэтому
+    поток можно обрывать, как только получены нужные поля (is_complete).
+    """
+
+    def __init__(self, required_fields: Optional[List[str]] = None):
+        super().__init__()
+        self.required_fields = set(required_fields or PREDICTION_FIELDS)
+        self.restart()
+
+    def restart(self):
+        self.fields: Dict[str, str] = {}
+        self._open_key: Optional[str] = None
+        self._open_lines: List[str] = []
+
+    def _line(self, line: str) -> list:
+        match = FIELD_RE.match(line)
+        # Повтор уже полученного ключа (например, «Время:» в тексте анализа) — обычная строка
+        if match and match.group('key').upper() not in self.fields:
+            completed = self._complete_open()
+            key, value = match.group('key').upper(), match.group('value').strip()
+            if key in MULTILINE_FIELDS and not (key == 'ФАКТОРЫ' and value):
+                self._open_key, self._open_lines = key, [value] if value else []
+            elif value:
+                completed += self._complete(key, value)
+            return completed
+
+        if self._open_key is None:
+            return []
+        stripped = line.strip()
+        if self._open_key == 'ФАКТОРЫ':
+            item = LIST_ITEM_RE.match(line)
+            if item:
+                self._open_lines.append(item.group('text'))
+                return []
+            # Список закончился (пустая или обычная строка)
+            return self._complete_open() if self._open_lines else []
+        if stripped:
+            self._open_lines.append(stripped)
+        return []
+
+    def _finish(self) -> list:
+        return self._complete_open()
+
+    def _complete_open(self) -> list:
+        key, lines = self._open_key, self._open_lines
+        self._open_key, self._open_lines = None, []
+        if key is None or not lines:
+            return []
+        return self._complete(key, ", ".join(lines) if key == 'ФАКТОРЫ' else " ".join(lines))
+
+    def _complete(self, key: str, value: str) -> list:
+        self.fields[key] = value.strip('*_ ')
+        return [(key, self.fields[key])]
+
+    def is_complete(self) -> bool:
+        """Получены ли все обязательные поля"""
+        return self.required_fields.issubset(self.fields)
+
+    def result(self) -> Optional[Dict]:
+        """Прогноз в формате анализатора или None, если обязательных полей нет.
+
+        Нечисловая УВЕРЕННОСТЬ («высокая») — ошибка разбора, как и раньше; без
+        КОЭФФИЦИЕНТА, УВЕРЕННОСТИ и ФАКТОРОВ прогноз получает значения по умолчанию,
+        поэтому SportsPrediction.from_dict всегда находит все поля.
+        """
+        data = {PREDICTION_FIELDS[key]: value for key, value in self.fields.items()}
+        if not all(data.get(field) for field in REQUIRED_PREDICTION_FIELDS):
+            return None
+        if 'confidence' in data:
+            number = NUMBER_RE.search(data['confidence'])
+            if not number:
+                return None
+            data['confidence'] = int(number.group())
+        else:
+            data['confidence'] = DEFAULT_CONFIDENCE
+        data['odds'] = data.get('odds', '')
+        data['key_factors'] = [factor.strip() for factor in data.get('key_factors', '').split(',') if factor.strip()]
+        data.setdefault('time', None)
+        data['source'] = 'perplexity'
+        return data
+
+
+class MatchStreamParser(LineStreamParser):
+    """Потоковый разбор списка матчей на сегодня.
+
+    Матч — строка с двумя командами через «-», «vs» или «против». Время берется
+    только как ЧЧ:ММ из строки матча или из следующих за ней строк; лига — из
+    строки «ЛИГА:/ТУРНИР:» перед матчами или из скобок в строке матча. Матч
+    отдается, как только известно время (или начался следующий матч).
+    """
+
+    def __init__(self, sport: str, limit: int = 5):
+        super().__init__()
+        self.sport = sport
+        self.limit = limit
+        self.restart()
+
+    def restart(self):
+        self.matches: List[Dict] = []
+        self._league = 'TBD'
+        self._current: Optional[Dict] = None
+
+    def _line(self, line: str) -> list:
+        if not line.strip() or self.is_complete():
+            return []
+        league = LEAGUE_RE.match(line)
+        if league:
+            self._league = league.group('league')
+            return []
+
+        time_match = TIME_RE.search(line)
+        teams = TEAMS_RE.match(TIME_RE.sub('', line)) if not line.rstrip().endswith(':') else None
+        if teams:
+            completed = self._complete_current()
+            home, away = teams.group('home').strip(' *_'), teams.group('away').strip(' *_')
+            suffix = LEAGUE_SUFFIX_RE.search(away)
+            if suffix:
+                away = away[:suffix.start()].strip(' *_')
+            if home and away:
+                self._current = {
+                    'home_team': home,
+                    'away_team': away,
+                    'sport': self.sport,
+                    'time': 'TBD',
+                    'league': suffix.group('league').strip() if suffix else self._league
+                }
+                if time_match:
+                    self._current['time'] = self._time(time_match)
+                    completed += self._complete_current()
+            return completed
+
+        if time_match and self._current is not None:
+            self._current['time'] = self._time(time_match)
+            return self._complete_current()
+        return []
+
+    def _finish(self) -> list:
+        return self._complete_current()
+
+    def _complete_current(self) -> list:
+        current, self._current = self._current, None
+        if current is None or self.is_complete():
+            return []
+        self.matches.append(current)
+        return [current]
+
+    @staticmethod
+    def _time(match) -> str:
+        return f"{int(match.group('hours')):02d}:{match.group('minutes')}"
+
+    def is_complete(self) -> bool:
+        return len(self.matches) >= self.limit
+
+
+def parse_prediction(text: str) -> Optional[Dict]:
+    """Разбор готового ответа целиком (тот же путь, что и для потока)"""
+    parser = PredictionStreamParser()
+    parser.feed(text)
+    parser.close()
+    return parser.result()
+
+
+def parse_matches(text: str, sport: str, limit: int = 5) -> List[Dict]:
+    parser = MatchStreamParser(sport, limit)
+    parser.feed(text)
+    parser.close()
+    return parser.matches
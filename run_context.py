@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Awaitable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RunContext:
+    """Бюджет времени одного запуска рассылки.
+
+    Создается задачей планировщика и несет абсолютный дедлайн (time.monotonic())
+    через генерацию прогнозов до HTTP-запросов к Perplexity. Генерации отводится
+    время до дедлайна за вычетом резерва на публикацию: все, что не успело,
+    отменяется, и запуск публикует то, что есть. Для каждого этапа запоминается,
+    сколько времени он занял и какую долю бюджета израсходовал.
+    """
+
+    def __init__(self, label: str, budget_seconds: float, publish_reserve: float = 0.0, run_id: Optional[str] = None):
+        self.label = label
+        # Идентификатор для журнала отправки: плановые запуски задают его явно (слот и дата),
+        # чтобы повторный запуск того же слота не дублировал сообщения
+        self.run_id = run_id or f"{label}:{uuid.uuid4().hex[:8]}"
+        self.budget_seconds = budget_seconds
+        self.publish_reserve = min(publish_reserve, budget_seconds)
+        self.started = time.monotonic()
+        self.deadline = self.started + budget_seconds
+        self.stages: List[Dict] = []
+        self.deliveries: List[Dict] = []
+        self.counters: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls, label: str, run_id: Optional[str] = None) -> "RunContext":
+        """Бюджет из RUN_BUDGET и резерв на публикацию из RUN_PUBLISH_RESERVE (секунды)"""
+        return cls(
+            label,
+            budget_seconds=float(os.getenv('RUN_BUDGET', '240')),
+            publish_reserve=float(os.getenv('RUN_PUBLISH_RESERVE', '30')),
+            run_id=run_id
+        )
+
+    @property
+    def generation_deadline(self) -> float:
+        """Дедлайн генерации: после него остается время только на публикацию"""
+        return self.deadline - self.publish_reserve
+
+    def remaining(self, until: Optional[float] = None) -> float:
+        """Сколько секунд осталось до дедлайна (или до until)"""
+        return max(0.0, (self.deadline if until is None else until) - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+    def mark(self, name: str):
+        """Начинает этап запуска; предыдущий этап при этом завершается"""
+        now = time.monotonic()
+        self._close_stage(now)
+        self.stages.append({'name': name, 'started': now, 'seconds': None, 'timed_out': False})
+
+    def _close_stage(self, now: float):
+        if self.stages and self.stages[-1]['seconds'] is None:
+            self.stages[-1]['seconds'] = now - self.stages[-1]['started']
+
+    def mark_timed_out(self):
+        """Отмечает, что текущий этап оборван дедлайном"""
+        if self.stages and self.stages[-1]['seconds'] is None:
+            self.stages[-1]['timed_out'] = True
+
+    def add(self, name: str, amount: int = 1):
+        """Увеличивает счетчик запуска (попадает в сводку)"""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_deliveries(self, deliveries: List[Dict]):
+        """Запоминает итоги доставки по чатам (задержка, отправлено, ошибки)"""
+        self.deliveries.extend(deliveries)
+
+    async def bounded(self, awaitable: Awaitable, until: Optional[float] = None, default=None):
+        """Ждет результат не дольше дедлайна; по истечении отменяет работу и возвращает default"""
+        try:
+            return await asyncio.wait_for(awaitable, timeout=self.remaining(until))
+        except asyncio.TimeoutError:
+            self.mark_timed_out()
+            logger.warning(f"⏰ Запуск {self.label}: дедлайн истек, незавершенная работа отменена")
+            return default
+
+    def report(self) -> Dict:
+        """Сводка запуска: сколько бюджета израсходовал каждый этап"""
+        now = time.monotonic()
+        stages = []
+        for stage in self.stages:
+            seconds = stage['seconds'] if stage['seconds'] is not None else now - stage['started']
+            stages.append({
+                'name': stage['name'],
+                'seconds': round(seconds, 3),
+                'budget_share_pct': round(100 * seconds / self.budget_seconds, 1) if self.budget_seconds else 0.0,
+                'timed_out': stage['timed_out']
+            })
+        return {
+            'label': self.label,
+            'run_id': self.run_id,
+            'budget_seconds': self.budget_seconds,
+            'elapsed_seconds': round(now - self.started, 3),
+            'expired': now >= self.deadline,
+            'stages': stages,
+            'deliveries': self.deliveries,
+            'counters': self.counters
+        }
+
+    def finish(self) -> Dict:
+        """Завершает последний этап, пишет сводку в лог и возвращает ее"""
+        self._close_stage(time.monotonic())
+        report = self.report()
+        stages = ", ".join(f"{s['name']} {s['seconds']:.1f} с ({s['budget_share_pct']}%)" for s in report['stages'])
+        logger.info(f"⏱️ Запуск {self.label}: {report['elapsed_seconds']:.1f} из {self.budget_seconds:.0f} с — {stages}")
+        if self.deliveries:
+            chats = ", ".join(f"{d['chat_id']} {d['seconds']:.1f} с" for d in self.deliveries)
+            logger.info(f"📢 Доставка по чатам: {chats}")
+        return report
@@ -13,6 +13,8 @@ import os
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import config  # Загружаем конфигурацию
+from telegram_outbox import TelegramOutbox
+from message_renderer import PredictionRenderer
 
 # Настройка логирования
 logging.basicConfig(
@@ -24,7 +26,7 @@ logger = logging.getLogger(__name__)
 @dataclass
 class SportsPrediction:
     """Структура для хранения спортивного прогноза"""
-    def __init__(self, sport, league, match, prediction, odds, confidence, analysis, key_factors, source="mock", time=None):
+    def __init__(self, sport, league, match, prediction, odds, confidence, analysis, key_factors, source="mock", time=None, model=None):
         self.sport = sport
         self.league = league
         self.match = match
@@ -35,6 +37,7 @@ class SportsPrediction:
         self.key_factors = key_factors
         self.source = source
         self.time = time
+        self.model = model  # Модель Perplexity, которая дала прогноз
         self.odds = odds
         self.confidence = confidence
         self.analysis = analysis
@@ -42,6 +45,23 @@ class SportsPrediction:
         self.source = source  # "mock" или "perplexity"
         self.time = time
 
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SportsPrediction":
+        """Создает прогноз из словаря, который возвращает EnhancedSportsAnalyzer"""
+        return cls(
+            sport=data["sport"],
+            league=data["league"],
+            match=data["match"],
+            prediction=data["prediction"],
+            odds=data["odds"],
+            confidence=data["confidence"],
+            analysis=data["analysis"],
+            key_factors=data["key_factors"],
+            source=data.get("source", "perplexity"),
+            time=data.get("time"),
+            model=data.get("model")
+        )
+
 class SportsAnalyzer:
     """Класс для генерации профессиональных спортивных прогнозов"""
     
@@ -334,6 +354,11 @@ class TelegramSportsBot:
         self.channel_id = channel_id
         self.analyzer = SportsAnalyzer()
         self.bot = Bot(token=token)
+        # Отправка с учетом лимитов Telegram вместо фиксированных пауз; без журнала —
+        # рассылки здесь без run_id, досылать после перезапуска нечего
+        self.outbox = TelegramOutbox.from_env(self.bot, journal=False)
+        # Общий рендер сообщений с прогнозами
+        self.renderer = PredictionRenderer(self.analyzer)
         self.scheduler = AsyncIOScheduler(timezone=pytz.timezone('Europe/Moscow'))
         
     def format_prediction_message(self, predictions: List[SportsPrediction]) -> str:
@@ -394,101 +419,7 @@ class TelegramSportsBot:
 
     def format_single_prediction(self, pred: SportsPrediction, index: int) -> str:
         """Форматирует одиночный прогноз для отдельного сообщения"""
-        moscow_tz = pytz.timezone('Europe/Moscow')
-        current_time = datetime.now(moscow_tz)
-        date_str = current_time.strftime("%d.%m.%Y")
-        time_str = current_time.strftime("%H:%M")
-        
-        # Эмодзи для разных видов спорта
-        sport_emoji = {
-            "Футбол": "⚽",
-            "Баскетбол": "🏀", 
-            "Теннис": "🎾",
-            "Хоккей": "🏒"
-        }
-        
-        emoji = sport_emoji.get(pred.sport, "🏆")
-        
-        # Рейтинг на основе уверенности
-        if pred.confidence >= 85:
-            rating = "🌟🌟🌟 ВЫСОКИЙ"
-            confidence_emoji = "🔥"
-        elif pred.confidence >= 70:
-            rating = "🌟🌟 СРЕДНИЙ" 
-            confidence_emoji = "💪"
-        else:
-            rating = "🌟 ОСТОРОЖНО"
-            confidence_emoji = "⚠️"
-        
-        message = f"🏆 **ЭКСПЕРТНЫЙ ПРОГНОЗ #{index}** {confidence_emoji}\n"
-        message += f"📅 {date_str} | 🕘 {time_str} МСК\n\n"
-        
-        message += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-        
-        # Источник данных
-        source_label = "🔥 LIVE ДАННЫЕ" if getattr(pred, 'source', 'mock') == 'perplexity' else "📊 АНАЛИТИЧЕСКИЕ ДАННЫЕ"
-
-        # Время матча (fallback, если None/пусто)
-        def _fallback_time():
-            import random
-            return random.choice([
-                "15:00 МСК", "16:30 МСК", "17:30 МСК", "19:00 МСК",
-                "20:00 МСК", "21:45 МСК", "22:30 МСК"
-            ])
-
-        display_time = getattr(pred, 'time', None) or _fallback_time()
-
-        message += f"🏟️ **{emoji} {pred.sport}** • {pred.league}\n"
-        message += f"⚔️ **{pred.match}**\n"
-        message += f"🕐 **Время:** {display_time}\n"
-        message += f"\n"
-        
-        message += f"📈 **ПРОГНОЗ:** `{pred.prediction}`\n"
-        message += f"💰 **Коэффициент:** `{pred.odds}`\n"
-        message += f"🎯 **Уверенность:** `{pred.confidence}%`\n"
-        message += f"⭐️ **Рейтинг:** {rating}\n\n"
-
-        message += f"{source_label}\n\n"
-        
-        message += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-        
-        message += f"📋 **ПРОФЕССИОНАЛЬНЫЙ АНАЛИЗ:**\n\n"
-        analysis_text = (pred.analysis or "").strip()
-        if not analysis_text or "временно недоступен" in analysis_text.lower():
-            # Надежный локальный фолбэк анализа
-            try:
-                analysis_text = self.analyzer.generate_analysis(pred.sport, pred.prediction)
-            except Exception:
-                analysis_text = (
-                    "Аналитическая сводка: домашняя/выездная форма, личные встречи, кадровая ситуация и мотивация "
-                    "дают умеренное преимущество выбранному исходу. Коэффициент соответствует оценке риска."
-                )
-        message += f"_{analysis_text}_\n\n"
-        
-        message += f"🔑 **КЛЮЧЕВЫЕ ФАКТОРЫ:**\n"
-        # Гарантируем минимум 3 фактора
-        factors = list(getattr(pred, 'key_factors', []) or [])
-        try:
-            while len(factors) < 3:
-                import random
-                extra = random.choice(self.analyzer.key_factors_pool)
-                if extra not in factors:
-                    factors.append(extra)
-        except Exception:
-            # Минимальный резерв, если analyzer не доступен по какой-то причине
-            while len(factors) < 3:
-                factors.append("Статистика формы")
-
-        for j, factor in enumerate(factors[:5], 1):
-            message += f"`{j}.` {factor}\n"
-        
-        message += f"\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-        message += f"📊 *Статистика точности: 78% за месяц*\n"
-        message += f"⚠️ *Помните: ставки связаны с рисками*\n"
-        message += f"🍀 *Удачных ставок!*\n\n"
-        message += f"🤖 *Сгенерировано: {time_str} МСК*"
-        
-        return message
+        return self.renderer.render(pred, index)
 
     async def send_daily_predictions(self):
         """Отправляет ежедневные прогнозы в канал отдельными сообщениями"""
@@ -510,7 +441,7 @@ class TelegramSportsBot:
             header_message += f"💡 *Каждый прогноз будет отправлен отдельным сообщением*\n"
             header_message += f"⏰ *Следите за обновлениями в течение нескольких минут*"
             
-            await self.bot.send_message(
+            await self.outbox.send_message(
                 chat_id=self.channel_id,
                 text=header_message,
                 parse_mode='Markdown'
@@ -518,15 +449,12 @@ class TelegramSportsBot:
             
             logger.info("📤 Заголовочное сообщение отправлено")
             
-            # Небольшая пауза перед отправкой прогнозов
-            await asyncio.sleep(3)
-            
             # Отправляем каждый прогноз отдельным сообщением
             for i, prediction in enumerate(predictions, 1):
                 try:
                     message = self.format_single_prediction(prediction, i)
                     
-                    await self.bot.send_message(
+                    await self.outbox.send_message(
                         chat_id=self.channel_id,
                         text=message,
                         parse_mode='Markdown'
@@ -534,10 +462,6 @@ class TelegramSportsBot:
                     
                     logger.info(f"✅ Прогноз #{i} отправлен: {prediction.match}")
                     
-                    # Пауза между сообщениями для избежания спама
-                    if i < len(predictions):
-                        await asyncio.sleep(2)
-                        
                 except Exception as e:
                     logger.error(f"❌ Ошибка отправки прогноза #{i}: {e}")
             
@@ -551,8 +475,7 @@ class TelegramSportsBot:
             footer_message += f"🍀 **Удачных ставок!**\n\n"
             footer_message += f"📈 *Следующие прогнозы: завтра в 8:30 МСК*"
             
-            await asyncio.sleep(3)
-            await self.bot.send_message(
+            await self.outbox.send_message(
                 chat_id=self.channel_id,
                 text=footer_message,
                 parse_mode='Markdown'
@@ -570,7 +493,7 @@ class TelegramSportsBot:
                 error_message += f"Мы работаем над устранением проблемы.\n\n"
                 error_message += f"⏰ Попробуйте снова через несколько минут."
                 
-                await self.bot.send_message(
+                await self.outbox.send_message(
                     chat_id=self.channel_id,
                     text=error_message,
                     parse_mode='Markdown'
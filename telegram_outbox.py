@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Dict, FrozenSet, List, Optional, Union
+
+from telegram.error import RetryAfter
+
+from outbox_store import OutboxEntry, OutboxStore
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+
+@dataclass(frozen=True)
+class ChatTarget:
+    """Чат рассылки и необязательный фильтр видов спорта (названия в нижнем регистре)"""
+    chat_id: ChatId
+    sports: Optional[FrozenSet[str]] = None
+
+    def accepts(self, sport: Optional[str]) -> bool:
+        return self.sports is None or (sport or "").lower() in self.sports
+
+
+def parse_chat_targets(value: str, aliases: Optional[Dict[str, str]] = None) -> List[ChatTarget]:
+    """Разбирает список чатов вида "@main,@hoops:basketball,-100123:football+tennis".
+
+    После двоеточия — виды спорта, которые получает чат; aliases переводит ключи
+    (football) в названия прогнозов (Футбол). Без фильтра чат получает все прогнозы.
+    """
+    aliases = {key.lower(): name.lower() for key, name in (aliases or {}).items()}
+    targets = []
+    for chunk in value.split(','):
+        chat_id, _, sports = chunk.strip().partition(':')
+        if not chat_id:
+            continue
+        sport_names = frozenset(aliases.get(s.strip().lower(), s.strip().lower()) for s in sports.split('+') if s.strip())
+        targets.append(ChatTarget(chat_id=chat_id.strip(), sports=sport_names or None))
+    return targets
+
+
+def is_group_chat(chat_id: ChatId) -> bool:
+    """Группы и каналы: отрицательный id или @username канала"""
+    if isinstance(chat_id, str):
+        return chat_id.startswith('@') or chat_id.lstrip().startswith('-')
+    return chat_id < 0
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Пауза из RetryAfter: в разных версиях библиотеки — секунды или timedelta"""
+    value = error.retry_after
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class TelegramOutbox:
+    """Отправка сообщений Telegram с учетом лимитов платформы.
+
+    Вместо фиксированных пауз сообщение уходит, как только это позволяют три
+    корзины: чат (не чаще раза в chat_interval секунд с небольшим запасом burst),
+    группа или канал (group_per_minute в минуту) и бот в целом (global_per_second
+    в секунду). Сообщения одного чата отправляются строго по очереди: asyncio.Lock
+    будит ожидающих по FIFO. Ответ RetryAfter блокирует чат на указанное время,
+    после чего сообщение отправляется повторно. С журналом (OutboxStore) серии
+    запуска переживают падение процесса: см. broadcast(run_id=...) и resume().
+    """
+
+    def __init__(self, bot, chat_interval: float = 1.0, chat_burst: int = 3,
+                 group_per_minute: int = 20, global_per_second: int = 30, max_retries: int = 3,
+                 store: Optional[OutboxStore] = None):
+        self.bot = bot
+        self.store = store
+        self.chat_interval = chat_interval
+        self.chat_burst = chat_burst
+        self.group_per_minute = group_per_minute
+        self.global_per_second = global_per_second
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(global_per_second, global_per_second * 60)
+        self._chat_buckets: Dict[ChatId, TokenBucket] = {}
+        self._group_buckets: Dict[ChatId, TokenBucket] = {}
+        self._locks: Dict[ChatId, asyncio.Lock] = {}
+        self._blocked_until: Dict[ChatId, float] = {}
+        self.stats = {'sent': 0, 'failed': 0, 'throttled': 0, 'wait_seconds': 0.0, 'retry_after': 0}
+
+    @classmethod
+    def from_env(cls, bot, journal: bool = True) -> "TelegramOutbox":
+        """Лимиты из TELEGRAM_CHAT_INTERVAL, TELEGRAM_CHAT_BURST, TELEGRAM_GROUP_PER_MINUTE, TELEGRAM_GLOBAL_PER_SECOND;
+        журнал — TELEGRAM_OUTBOX_PATH, если journal не выключен (он нужен только плановым рассылкам)"""
+        return cls(
+            bot,
+            chat_interval=float(os.getenv('TELEGRAM_CHAT_INTERVAL', '1')),
+            chat_burst=int(os.getenv('TELEGRAM_CHAT_BURST', '3')),
+            group_per_minute=int(os.getenv('TELEGRAM_GROUP_PER_MINUTE', '20')),
+            global_per_second=int(os.getenv('TELEGRAM_GLOBAL_PER_SECOND', '30')),
+            store=OutboxStore.from_env() if journal else None
+        )
+
+    def _get_lock(self, chat_id: ChatId) -> asyncio.Lock:
+        # Создаем лениво, чтобы Lock привязался к работающему event loop
+        if chat_id not in self._locks:
+            self._locks[chat_id] = asyncio.Lock()
+        return self._locks[chat_id]
+
+    def _buckets(self, chat_id: ChatId):
+        if chat_id not in self._chat_buckets:
+            per_minute = 60.0 / self.chat_interval if self.chat_interval > 0 else 0
+            self._chat_buckets[chat_id] = TokenBucket(max(1, self.chat_burst), per_minute)
+        buckets = [self._global_bucket, self._chat_buckets[chat_id]]
+        if is_group_chat(chat_id):
+            if chat_id not in self._group_buckets:
+                self._group_buckets[chat_id] = TokenBucket(self.group_per_minute, self.group_per_minute)
+            buckets.append(self._group_buckets[chat_id])
+        return buckets
+
+    async def _acquire(self, chat_id: ChatId):
+        buckets = self._buckets(chat_id)
+        started = time.monotonic()
+        throttled = False
+        while True:
+            now = time.monotonic()
+            wait = max([bucket.wait_time(1, now) for bucket in buckets] +
+                       [self._blocked_until.get(chat_id, 0.0) - now])
+            if wait <= 0:
+                # Между проверкой и списанием нет await — другие чаты не вклинятся
+                for bucket in buckets:
+                    bucket.consume(1)
+                break
+            throttled = True
+            await asyncio.sleep(wait)
+
+        waited = time.monotonic() - started
+        self.stats['wait_seconds'] += waited
+        if throttled:
+            self.stats['throttled'] += 1
+            logger.info(f"🚦 Telegram {chat_id}: ожидание лимита {waited:.2f} с")
+
+    def block(self, chat_id: ChatId, retry_after: float):
+        """Блокирует чат на retry_after секунд (flood control)"""
+        until = time.monotonic() + max(0.0, retry_after)
+        self._blocked_until[chat_id] = max(self._blocked_until.get(chat_id, 0.0), until)
+        self.stats['retry_after'] += 1
+        logger.warning(f"🚦 Telegram {chat_id} ограничен на {retry_after:.1f} с (RetryAfter)")
+
+    async def send_message(self, chat_id: ChatId, text: str, **kwargs):
+        """Отправляет сообщение, соблюдая лимиты и порядок внутри чата; принимает те же аргументы, что Bot.send_message"""
+        async with self._get_lock(chat_id):
+            for attempt in range(self.max_retries + 1):
+                await self._acquire(chat_id)
+                try:
+                    message = await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                    self.stats['sent'] += 1
+                    return message
+                except RetryAfter as e:
+                    if attempt >= self.max_retries:
+                        self.stats['failed'] += 1
+                        raise
+                    self.block(chat_id, retry_after_seconds(e))
+                except Exception:
+                    self.stats['failed'] += 1
+                    raise
+
+    async def deliver(self, chat_id: ChatId, messages: List[str], **kwargs) -> Dict:
+        """Отправляет серию сообщений в чат по порядку; ошибка одного сообщения не прерывает серию"""
+        return await self._deliver_entries(chat_id, [(None, text, kwargs) for text in messages])
+
+    async def _deliver_entries(self, chat_id: ChatId, entries: List[OutboxEntry]) -> Dict:
+        started = time.monotonic()
+        first_message = None
+        sent = failed = 0
+        for position, (key, text, options) in enumerate(entries, 1):
+            try:
+                message = await self.send_message(chat_id, text, **options)
+                sent += 1
+                if first_message is None:
+                    first_message = time.monotonic() - started
+                if key and self.store:
+                    # Фиксируем сразу: после падения процесса сообщение не уйдет повторно
+                    self.store.mark_sent(key, getattr(message, 'message_id', None))
+            except Exception as e:
+                failed += 1
+                logger.error(f"❌ Ошибка отправки сообщения {position}/{len(entries)} в {chat_id}: {e}")
+                if key and self.store:
+                    self.store.mark_failed(key, str(e))
+        seconds = time.monotonic() - started
+        logger.info(f"📢 {chat_id}: отправлено {sent} из {len(entries)} за {seconds:.1f} с")
+        return {
+            'chat_id': chat_id,
+            'sent': sent,
+            'failed': failed,
+            'first_message_seconds': round(first_message, 3) if first_message is not None else None,
+            'seconds': round(seconds, 3)
+        }
+
+    async def broadcast(self, batches: Dict[ChatId, List[str]], run_id: Optional[str] = None, **kwargs) -> List[Dict]:
+        """Доставляет серии сообщений во все чаты одновременно; порядок внутри чата сохраняется.
+
+        С run_id и журналом серии сначала записываются на диск, а отправляются только
+        сообщения, которых этот запуск еще не отправил.
+        """
+        if run_id and self.store:
+            pending = self.store.enqueue(run_id, {str(chat_id): messages for chat_id, messages in batches.items()}, kwargs)
+            return await self._deliver_pending(pending)
+        return list(await asyncio.gather(*(
+            self.deliver(chat_id, messages, **kwargs) for chat_id, messages in batches.items()
+        )))
+
+    async def resume(self, run_id: Optional[str] = None) -> List[Dict]:
+        """Досылает сообщения, оставшиеся в журнале после прерванного запуска.
+
+        Устаревшие (старше pending_ttl журнала) не досылаются, а помечаются expired.
+        """
+        if not self.store:
+            return []
+        self.store.expire()
+        pending = self.store.pending(run_id)
+        if pending:
+            total = sum(len(entries) for entries in pending.values())
+            logger.info(f"📮 Досылаем {total} сообщений прерванной рассылки в {len(pending)} чат(ов)")
+        return await self._deliver_pending(pending)
+
+    async def _deliver_pending(self, pending: Dict[str, List[OutboxEntry]]) -> List[Dict]:
+        return list(await asyncio.gather(*(
+            self._deliver_entries(chat_id, entries) for chat_id, entries in pending.items()
+        )))
+
+    def get_stats(self) -> Dict:
+        """Статистика отправки для мониторинга"""
+        stats = dict(self.stats, wait_seconds=round(self.stats['wait_seconds'], 3))
+        if self.store:
+            stats['journal'] = self.store.get_stats()
+        return stats
@@ -0,0 +1,41 @@
+from analysis_extractor import extract_analysis, extract_bets, extract_factors
+
+TEXT = ("Анализ матча:\n"
+        "1. **Форма**: хозяева выиграли пять матчей\n"
+        "12) Травмы у гостей\n"
+        "• Личные встречи\n"
+        "- " + "очень длинный абзац " * 10 + "\n"
+        "Итог: победа хозяев, тотал больше 2.5, угловые.")
+
+
+def test_factors_from_any_list_marker():
+    factors = extract_factors(TEXT)
+
+    assert [factor.text for factor in factors] == [
+        'Форма: хозяева выиграли пять матчей', 'Травмы у гостей', 'Личные встречи'
+    ]
+    assert TEXT[factors[1].position:].startswith('Травмы')
+
+
+def test_factor_limit_stops_early():
+    assert len(extract_factors(TEXT, limit=2)) == 2
+
+
+def test_bets_by_first_mention_and_word_forms():
+    bets = extract_bets("Ставка: ПОБЕДЫ хозяев, фору и голов много, снова победа")
+
+    assert [bet.text for bet in bets] == ['Победа', 'Фора', 'Голы']
+    assert bets[0].position == len("Ставка: ")
+
+
+def test_bets_need_word_boundaries():
+    # «гол» внутри «заголовок», «фор» внутри «информация» — не ставки
+    assert extract_bets("Заголовок и информация") == []
+    assert [bet.text for bet in extract_bets("автоголы")] == ['Автоголы']
+
+
+def test_extract_analysis_limits():
+    result = extract_analysis(TEXT, max_factors=4, max_bets=2)
+
+    assert result.factor_texts(2) == ['Форма: хозяева выиграли пять матчей', 'Травмы у гостей']
+    assert result.bet_names() == ['Победа', 'Тотал']
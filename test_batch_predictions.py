@@ -0,0 +1,66 @@
+import asyncio
+
+from perplexity_analyzer import PREDICTION_MAX_TOKENS, EnhancedSportsAnalyzer
+
+SECTION = """ПРОГНОЗ №{number}
+СПОРТ: {sport}
+ЛИГА: Лига
+МАТЧ: Хозяева - Гости
+ПРОГНОЗ: П1
+КОЭФФИЦИЕНТ: 1.90
+УВЕРЕННОСТЬ: 80%
+АНАЛИЗ: Хозяева в форме.
+ФАКТОРЫ: Форма, Состав
+"""
+
+
+def _analyzer(monkeypatch, content, single_delay=0.0):
+    analyzer = EnhancedSportsAnalyzer('test-key')
+    analyzer.output_mode = 'text'
+    calls = []
+
+    async def search_sports_data(query, **kwargs):
+        calls.append(kwargs)
+        return {'choices': [{'message': {'content': content}}], '_meta': {'model': 'sonar-pro'}}
+
+    async def generate_real_prediction(sport, deadline=None):
+        calls.append({'single': sport})
+        await asyncio.sleep(single_delay)
+        return {'sport': sport, 'source': 'perplexity'}
+
+    monkeypatch.setattr(analyzer.perplexity, 'search_sports_data', search_sports_data)
+    monkeypatch.setattr(analyzer, 'generate_real_prediction', generate_real_prediction)
+    return analyzer, calls
+
+
+def test_batch_scales_max_tokens_and_retries_only_missing(monkeypatch):
+    content = SECTION.format(number=1, sport='Футбол') + SECTION.format(number=3, sport='Теннис')
+    analyzer, calls = _analyzer(monkeypatch, content)
+
+    results = asyncio.run(analyzer.generate_batch_predictions(['football', 'basketball', 'tennis']))
+
+    assert calls[0]['max_tokens'] == PREDICTION_MAX_TOKENS * 3
+    assert [call['single'] for call in calls[1:]] == ['basketball']
+    assert [result['sport'] for result in results] == ['Футбол', 'basketball', 'Теннис']
+
+
+def test_batch_timeout_keeps_parsed_sections(monkeypatch):
+    content = SECTION.format(number=1, sport='Футбол')
+    analyzer, _ = _analyzer(monkeypatch, content, single_delay=5.0)
+    analyzer.batch_mode = True
+
+    results = asyncio.run(analyzer.generate_real_predictions(['football', 'basketball'], timeout=0.2))
+
+    # Повтор второго пункта не успел, но первый прогноз из пакета не потерян
+    assert results[0]['sport'] == 'Футбол'
+    assert results[1] is None
+
+
+def test_json_mode_fallback_has_its_own_parse_stat(monkeypatch):
+    analyzer, _ = _analyzer(monkeypatch, SECTION.format(number=1, sport='Футбол'))
+
+    assert analyzer._parse_prediction_content('{"sport": "Футбол"}', json_mode=True) is None
+    assert analyzer._parse_prediction_content(SECTION.format(number=1, sport='Футбол'), json_mode=False)
+
+    stats = analyzer.get_parse_stats()
+    assert (stats['json']['attempts'], stats['legacy_fallback']['attempts'], stats['legacy']['successes']) == (1, 1, 1)
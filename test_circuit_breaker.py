@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import aiohttp
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from perplexity_analyzer import PerplexityAPI
+
+
+def test_opens_after_failure_threshold():
+    breaker = CircuitBreaker(min_requests=3, failure_threshold=0.5)
+    breaker.record_success('sonar')
+    breaker.record_failure('sonar')
+    assert breaker.get_state('sonar') == CLOSED
+
+    breaker.record_failure('sonar')
+
+    assert breaker.get_state('sonar') == OPEN
+    assert not breaker.allow('sonar')
+    assert breaker.get_stats()['sonar']['short_circuited'] == 1
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = CircuitBreaker(min_requests=1, open_seconds=0)
+    breaker.record_failure('sonar')
+
+    assert breaker.allow('sonar')
+    assert breaker.get_state('sonar') == HALF_OPEN
+    assert not breaker.allow('sonar')  # Пробный запрос уже в пути
+    breaker.record_success('sonar')
+    assert breaker.get_state('sonar') == CLOSED
+
+    breaker.record_failure('sonar')
+    breaker.allow('sonar')
+    breaker.record_failure('sonar')
+    assert breaker.get_state('sonar') == OPEN
+
+
+def test_abandoned_probe_frees_slot_without_verdict():
+    breaker = CircuitBreaker(min_requests=1, open_seconds=0)
+    breaker.record_failure('sonar')
+    breaker.allow('sonar')
+
+    breaker.record_abandoned('sonar')
+
+    assert breaker.get_state('sonar') == HALF_OPEN
+    assert breaker.allow('sonar')
+
+
+def _api(monkeypatch, error=None, delay=0.0):
+    api = PerplexityAPI('test-key')
+    api.circuit_breaker = CircuitBreaker(min_requests=1)
+    api.retry_policy.max_attempts = 1
+
+    async def hedged_post(payload, model, estimated_tokens, stop_fields=None):
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return 200, {'choices': []}, None
+
+    monkeypatch.setattr(api, '_hedged_post', hedged_post)
+    return api
+
+
+def _attempt(api, deadline=None):
+    payload = {'model': 'sonar-pro', 'messages': [{'role': 'user', 'content': 'q'}], 'max_tokens': 10}
+    return asyncio.run(api._execute_attempts(payload, 'q', 'sonar-pro', None, deadline, None, [], time.monotonic()))
+
+
+def test_run_deadline_does_not_trip_breaker(monkeypatch):
+    api = _api(monkeypatch, delay=5.0)
+
+    assert _attempt(api, deadline=time.monotonic() + 0.05) is None
+    assert api.circuit_breaker.get_state('sonar-pro') == CLOSED
+
+
+def test_provider_timeout_trips_breaker(monkeypatch):
+    api = _api(monkeypatch, error=aiohttp.ServerTimeoutError())
+
+    assert _attempt(api, deadline=time.monotonic() + 30) is None
+    assert api.circuit_breaker.get_state('sonar-pro') == OPEN
@@ -0,0 +1,31 @@
+from confidence_scorer import ConfidenceScorer
+
+scorer = ConfidenceScorer()
+
+
+def test_strongest_phrase_wins():
+    assert scorer.matches("Реал — очевидный фаворит") == {'очевидный фаворит', 'фаворит'}
+    assert scorer.score("Реал — очевидный фаворит") == 95
+
+
+def test_words_match_on_word_boundaries():
+    # «но» внутри «основной» и «может» внутри «возможно» не считаются
+    assert scorer.matches("Основной состав") == set()
+    assert scorer.matches("Возможно, ничья") == {'возможно'}
+    assert scorer.score("Возможно, ничья") == 75 - 3
+
+
+def test_word_endings_for_detail_indicators():
+    assert scorer.matches("Статистики и травмы") == {'статистик*', 'травм*'}
+    assert scorer.score("Статистики и травмы") == 75 + 2 * 2
+
+
+def test_overlapping_phrases_counted_like_separate_checks():
+    assert {'может быть', 'может'} <= scorer.matches("Может быть, ничья")
+
+
+def test_bounds_and_custom_tables():
+    # Уверенность не ниже базы, поэтому нижняя граница видна только при низкой базе
+    custom = ConfidenceScorer({'разгром': 99}, detail_indicators=(), uncertainty_words=('но',), base=40)
+    assert custom.score("ничего, но") == 45
+    assert custom.score_many(["разгром", "ничего"]) == [95, 45]
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+import perplexity_analyzer
+from perplexity_analyzer import PerplexityAPI
+
+OK = (200, {'choices': []}, None)
+
+
+def _api(monkeypatch, script, hedge_after=0.05):
+    """API с хеджированием; script — (задержка, результат или исключение) для каждого запроса по порядку"""
+    api = PerplexityAPI('test-key')
+    api.hedging = True
+    calls = {'started': 0, 'cancelled': []}
+
+    async def post_once(payload, model, estimated_tokens, stop_fields=None):
+        number = calls['started']
+        calls['started'] += 1
+        delay, outcome = script[number]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            calls['cancelled'].append(number)
+            raise
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(api, '_post_once', post_once)
+    monkeypatch.setattr(api.router, 'latency', lambda model, fraction: hedge_after)
+    monkeypatch.setattr(perplexity_analyzer, 'current_run_id', lambda: 'run-1')
+    return api, calls
+
+
+def _post(api):
+    return asyncio.run(api._hedged_post({'model': 'sonar-pro'}, 'sonar-pro', 10))
+
+
+def test_hedge_wins_and_primary_is_cancelled(monkeypatch):
+    api, calls = _api(monkeypatch, [(5, OK), (0.01, (200, {'hedge': True}, None))])
+
+    assert _post(api) == (200, {'hedge': True}, None)
+    assert calls['cancelled'] == [0]
+    assert api.hedge_stats == {'launched': 1, 'helped': 1, 'capped': 0}
+
+
+def test_fast_primary_sends_no_second_request(monkeypatch):
+    api, calls = _api(monkeypatch, [(0.01, OK)])
+
+    assert _post(api) == OK
+    assert calls['started'] == 1
+    assert api.hedge_stats == {'launched': 0, 'helped': 0, 'capped': 0}
+
+
+def test_primary_success_after_hedge_launch_does_not_count_as_helped(monkeypatch):
+    api, calls = _api(monkeypatch, [(0.1, OK), (5, OK)])
+
+    assert _post(api) == OK
+    assert calls['cancelled'] == [1]
+    assert api.hedge_stats == {'launched': 1, 'helped': 0, 'capped': 0}
+
+
+def test_both_failing_propagates_first_error(monkeypatch):
+    api, _ = _api(monkeypatch, [(0.1, ConnectionError('primary')), (0.2, ConnectionError('hedge'))])
+
+    with pytest.raises(ConnectionError, match='primary'):
+        _post(api)
+    assert api.hedge_stats['launched'] == 1
+
+
+def test_hedges_capped_per_run(monkeypatch):
+    api, calls = _api(monkeypatch, [(0.1, OK)] * 3)
+    api.hedge_max_per_run = 0
+
+    assert _post(api) == OK
+    assert calls['started'] == 1
+    assert api.hedge_stats == {'launched': 0, 'helped': 0, 'capped': 1}
@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+import pytz
+
+import bot_railway
+import main_bot
+from sports_bot import SportsPrediction
+
+REAL_PREDICTION = {
+    'sport': 'Футбол', 'league': 'Ла Лига', 'match': 'Реал Мадрид - Барселона',
+    'prediction': 'П1', 'odds': '2.10', 'confidence': 82,
+    'analysis': 'Реал в форме', 'key_factors': ['Форма'], 'source': 'perplexity'
+}
+
+
+class StubAnalyzer:
+    """Ответы Perplexity по слотам без сети"""
+
+    def __init__(self, results):
+        self.results = results
+
+    async def generate_real_predictions(self, sports, max_concurrency=3, timeout=None):
+        return list(self.results)
+
+
+@pytest.mark.parametrize('module', [main_bot, bot_railway])
+def test_concurrent_generation_fills_slot_with_missing_fields(module):
+    bot = module.HybridSportsBot('1:test', '@test', None)
+    broken = {key: value for key, value in REAL_PREDICTION.items() if key != 'odds'}
+    bot.perplexity_analyzer = StubAnalyzer([REAL_PREDICTION, broken, None])
+
+    predictions = asyncio.run(bot._generate_concurrent_predictions(['football', 'basketball', 'tennis']))
+
+    assert len(predictions) == 3
+    assert all(isinstance(prediction, SportsPrediction) for prediction in predictions)
+    assert predictions[0].source == 'perplexity'
+    # Слот с неполным ответом и пустой слот заполнены базовыми прогнозами
+    assert predictions[1].source != 'perplexity'
+    assert predictions[2].source != 'perplexity'
+
+
+@pytest.mark.parametrize('module', [main_bot, bot_railway])
+def test_failed_error_notice_does_not_escape_run(module):
+    bot = module.HybridSportsBot('1:test', '@test', None)
+    bot.telegram_checked_at = datetime.now(pytz.timezone('Europe/Moscow'))
+
+    async def generate_hybrid_predictions(*args, **kwargs):
+        raise RuntimeError('генерация упала')
+
+    async def broadcast(*args, **kwargs):
+        raise RuntimeError('Telegram недоступен')
+
+    bot.generate_hybrid_predictions = generate_hybrid_predictions
+    bot.outbox.broadcast = broadcast
+
+    asyncio.run(bot.send_daily_predictions())
+
+    assert bot.last_run_report is not None
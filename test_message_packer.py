@@ -0,0 +1,53 @@
+from message_packer import CONTINUATION_MARKER, CONTINUED_MARKER, MessagePacker, split_message, telegram_length
+
+
+def test_short_message_is_untouched():
+    assert split_message("Прогноз", limit=100) == ["Прогноз"]
+
+
+def test_emoji_count_as_two_units():
+    assert telegram_length("🏆") == 2
+    assert telegram_length("⚽") == 1
+
+
+def test_split_on_paragraphs_with_markers():
+    paragraphs = [f"Абзац {number} " + "слово " * 20 for number in range(6)]
+    parts = split_message("\n\n".join(paragraphs), limit=300)
+
+    assert len(parts) > 1
+    assert all(telegram_length(part) <= 300 for part in parts)
+    assert parts[0].endswith(CONTINUED_MARKER) and not parts[0].startswith(CONTINUATION_MARKER)
+    assert parts[-1].startswith(CONTINUATION_MARKER) and not parts[-1].endswith(CONTINUED_MARKER)
+    # Ни один абзац не потерян и не разрезан
+    body = "\n\n".join(part.replace(CONTINUATION_MARKER, "").replace(CONTINUED_MARKER, "") for part in parts)
+    assert body == "\n\n".join(paragraphs)
+
+
+def test_long_wrapped_paragraph_keeps_markup_in_each_piece():
+    parts = split_message("_" + "анализ " * 100 + "_", limit=200)
+
+    for part in parts:
+        text = part.replace(CONTINUATION_MARKER, "").replace(CONTINUED_MARKER, "")
+        assert text.startswith("_") and text.endswith("_")
+        assert telegram_length(part) <= 200
+
+
+def test_markers_follow_parse_mode():
+    parts = split_message("a\n\n" + "b" * 150, limit=100, parse_mode='HTML')
+    assert "<i>продолжение следует</i>" in parts[0]
+
+
+def test_compact_mode_merges_series():
+    packer = MessagePacker(limit=100, compact=True)
+    packed = packer.pack(["Заголовок", "Прогноз 1", "Прогноз 2", "x" * 90])
+
+    assert packed == ["Заголовок\n\nПрогноз 1\n\nПрогноз 2", "x" * 90]
+    assert packer.get_stats()['api_calls_saved'] == 2
+
+
+def test_regular_mode_only_splits():
+    packer = MessagePacker(limit=100)
+    packed = packer.pack(["Заголовок", "слово " * 40])
+
+    assert packed[0] == "Заголовок" and len(packed) > 2
+    assert packer.get_stats()['split'] == 1
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from message_renderer import PredictionRenderer
+from sports_bot import SportsPrediction
+
+ANALYSIS = "Игрок *звезда* и снейк_кейс [ссылка]"
+MOMENT = datetime(2026, 10, 17, 9, 0)
+
+
+def _prediction():
+    return SportsPrediction(
+        sport="Футбол", league="Серия_A", match="Интер - Милан", prediction="П1", odds="2.10",
+        confidence=82, analysis=ANALYSIS, key_factors=["Форма_дома", "Травмы", "Мотивация"],
+        source="perplexity", time="21:45"
+    )
+
+
+def _analysis_block(message: str) -> str:
+    return message.split("ПРОФЕССИОНАЛЬНЫЙ АНАЛИЗ:", 1)[1].split("\n\n")[1]
+
+
+def test_markdown_analysis_is_one_italic_span_without_backslashes():
+    message = PredictionRenderer().render(_prediction(), 1, MOMENT)
+    block = _analysis_block(message)
+
+    # Устаревший Markdown: курсив закрывается первым «_», экранирование внутри видно как есть
+    assert block == "_Игрок *звезда* и снейк кейс [ссылка]_"
+    assert "Серия\\_A" in message and "Форма\\_дома" in message
+
+
+def test_markdown_v2_escapes_inside_italic():
+    block = _analysis_block(PredictionRenderer(parse_mode='MarkdownV2').render(_prediction(), 1, MOMENT))
+
+    assert block == "_Игрок \\*звезда\\* и снейк\\_кейс \\[ссылка\\]_"
+
+
+def test_html_keeps_analysis_text():
+    message = PredictionRenderer(parse_mode='HTML').render(_prediction(), 1, MOMENT)
+
+    assert "<i>Игрок *звезда* и снейк_кейс [ссылка]</i>" in message
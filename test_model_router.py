@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from model_router import ModelRouter
+from perplexity_analyzer import PerplexityAPI
+from response_cache import ResponseCache
+
+
+def _router(**kwargs):
+    return ModelRouter(slo_seconds=10, window=5, min_samples=5, **kwargs)
+
+
+def _record(router, model, latency, count=5):
+    for _ in range(count):
+        router.record(model, latency)
+
+
+def test_slow_p95_downgrades_and_recovers():
+    router = _router()
+    _record(router, 'sonar-pro', 8.0)
+    assert router.choose('sonar-pro') == 'sonar-pro'
+
+    _record(router, 'sonar-pro', 15.0)
+    assert router.choose('sonar-pro') == 'sonar'
+    assert router.stats == {'routed': 2, 'downgraded': 1}
+
+    # Окно скользящее: быстрые ответы вытесняют медленные, и модель возвращается
+    _record(router, 'sonar-pro', 4.0)
+    assert router.choose('sonar-pro') == 'sonar-pro'
+
+
+def test_deadline_tightens_budget():
+    router = ModelRouter()
+
+    assert router.choose('sonar-pro') == 'sonar-pro'
+    assert router.choose('sonar-pro', deadline=time.monotonic() + 8) == 'sonar'
+    # Не укладывается ни одна модель — берем самую быструю
+    assert router.choose('sonar-pro', deadline=time.monotonic() + 1) == 'sonar'
+
+
+def test_open_circuit_is_skipped():
+    router = ModelRouter(is_available=lambda model: model != 'sonar-pro')
+
+    assert router.choose('sonar-pro') == 'sonar'
+
+
+def test_downgraded_request_shares_cache_with_preferred_model(monkeypatch):
+    api = PerplexityAPI('test-key')
+    api.cache = ResponseCache()
+    posts = []
+
+    async def hedged_post(payload, model, estimated_tokens, stop_fields=None):
+        posts.append(model)
+        return 200, {'choices': [{'message': {'content': f'ответ {model}'}}]}, None
+
+    monkeypatch.setattr(api, '_hedged_post', hedged_post)
+
+    async def run():
+        first = await api.search_sports_data('прогноз', cache_kind='prediction')
+        _record(api.router, 'sonar-pro', 60.0)
+        downgraded = await api.search_sports_data('прогноз', cache_kind='prediction',
+                                                  deadline=time.monotonic() + 10)
+        api.cache = ResponseCache()
+        fresh = await api.search_sports_data('прогноз', cache_kind='prediction',
+                                             deadline=time.monotonic() + 10)
+        _record(api.router, 'sonar-pro', 1.0)
+        again = await api.search_sports_data('прогноз', cache_kind='prediction')
+        return first, downgraded, fresh, again
+
+    first, downgraded, fresh, again = asyncio.run(run())
+
+    assert posts == ['sonar-pro', 'sonar']
+    assert downgraded['_meta']['cache_hit']
+    assert downgraded['choices'] == first['choices']
+    assert fresh['_meta']['model'] == 'sonar'
+    # Ответ пониженного запроса лежит под предпочтительной моделью, но помнит, кто ответил
+    assert again['_meta']['cache_hit']
+    assert again['_meta']['model'] == 'sonar'
+    assert again['choices'][0]['message']['content'] == 'ответ sonar'
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+from outbox_store import OutboxStore, outbox_key
+from telegram_outbox import TelegramOutbox
+
+
+class StubBot:
+    """Запоминает отправленное вместо Telegram"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+        return type('Message', (), {'message_id': len(self.sent)})()
+
+
+def _age(store, run_id, seconds):
+    store._db.execute("UPDATE outbox SET created_at = created_at - ?, updated_at = updated_at - ? WHERE run_id = ?",
+                      (seconds, seconds, run_id))
+
+
+def test_enqueue_is_idempotent_per_run():
+    store = OutboxStore()
+    store.enqueue('run-1', {'@chat': ['a', 'b']}, {})
+    store.mark_sent(outbox_key('run-1', '@chat', 1), 10)
+
+    pending = store.enqueue('run-1', {'@chat': ['a', 'b']}, {})
+
+    assert store.has_run('run-1')
+    assert [text for _, text, _ in pending['@chat']] == ['b']
+    assert store.get_stats() == {'pending': 1, 'sent': 1, 'failed': 0, 'expired': 0}
+
+
+def test_pending_keeps_series_order_per_chat():
+    store = OutboxStore()
+    store.enqueue('run-1', {'@a': ['1', '2'], '@b': ['x']}, {'parse_mode': 'HTML'})
+
+    pending = store.pending()
+
+    assert [text for _, text, _ in pending['@a']] == ['1', '2']
+    assert pending['@b'][0][2] == {'parse_mode': 'HTML'}
+
+
+def test_stale_pending_is_expired_not_resumed():
+    store = OutboxStore(pending_ttl=3600)
+    store.enqueue('yesterday', {'@chat': ['старый прогноз']}, {})
+    store.enqueue('today', {'@chat': ['свежий прогноз']}, {})
+    _age(store, 'yesterday', 24 * 3600)
+
+    assert [text for _, text, _ in store.pending()['@chat']] == ['свежий прогноз']
+    assert store.expire() == 1
+    assert store.get_stats()['expired'] == 1
+
+
+def test_cleanup_expires_and_drops_old_rows():
+    store = OutboxStore(keep_seconds=3600, pending_ttl=600)
+    store.enqueue('old', {'@chat': ['a', 'b']}, {})
+    store.mark_failed(outbox_key('old', '@chat', 1), 'Forbidden')
+    _age(store, 'old', 2 * 3600)
+
+    store._cleanup()  # Устаревший pending помечается expired, но удаляется только через keep_seconds
+    assert store.get_stats() == {'pending': 0, 'sent': 0, 'failed': 0, 'expired': 1}
+
+    store._db.execute("UPDATE outbox SET updated_at = ?", (time.time() - 2 * 3600,))
+    store._cleanup()
+    assert store.get_stats() == {'pending': 0, 'sent': 0, 'failed': 0, 'expired': 0}
+
+
+def test_resume_skips_stale_runs():
+    store = OutboxStore(pending_ttl=3600)
+    store.enqueue('yesterday', {'@chat': ['старый прогноз']}, {})
+    store.enqueue('today', {'@chat': ['свежий прогноз']}, {})
+    _age(store, 'yesterday', 24 * 3600)
+    bot = StubBot()
+
+    asyncio.run(TelegramOutbox(bot, chat_interval=0, store=store).resume())
+
+    assert bot.sent == [('@chat', 'свежий прогноз')]
+    assert store.get_stats() == {'pending': 0, 'sent': 1, 'failed': 0, 'expired': 1}
+
+
+def test_outbox_without_journal_opens_no_store(tmp_path, monkeypatch):
+    path = tmp_path / 'outbox.sqlite3'
+    monkeypatch.setenv('TELEGRAM_OUTBOX_PATH', str(path))
+
+    assert TelegramOutbox.from_env(StubBot(), journal=False).store is None
+    assert not path.exists()
+    assert TelegramOutbox.from_env(StubBot()).store is not None
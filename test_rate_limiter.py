@@ -0,0 +1,79 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from rate_limiter import RateLimiter, TokenBucket, estimate_tokens, parse_retry_after
+
+
+def test_bucket_refills_at_rate():
+    bucket = TokenBucket(capacity=2, per_minute=60)
+    now = bucket.updated
+    bucket.consume(2)
+
+    assert bucket.wait_time(1, now) == 1.0
+    assert bucket.wait_time(1, now + 1) == 0.0
+    # Больше емкости не копится
+    assert bucket.wait_time(2, now + 100) == 0.0 and bucket.tokens == 2
+
+
+def test_zero_limit_disables_bucket():
+    bucket = TokenBucket(capacity=0, per_minute=0)
+    assert bucket.wait_time(1000, time.monotonic()) == 0.0
+
+
+def test_record_usage_corrects_token_bucket():
+    limiter = RateLimiter(requests_per_minute=10, tokens_per_minute=1000)
+    _, tokens = limiter._get_buckets('sonar')
+
+    limiter.record_usage('sonar', estimated_tokens=100, actual_tokens=400)
+    assert tokens.tokens == 700
+    limiter.record_usage('sonar', estimated_tokens=400, actual_tokens=100)
+    assert tokens.tokens == 1000
+
+
+def test_acquire_throttles_when_bucket_is_empty():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=0)
+
+    async def run():
+        started = time.monotonic()
+        for _ in range(601):
+            await limiter.acquire('sonar')
+        return time.monotonic() - started
+
+    # 600 запросов проходят сразу, 601-й ждет пополнения (~0.1 с)
+    assert asyncio.run(run()) >= 0.09
+    stats = limiter.get_stats()
+    assert (stats['acquired'], stats['throttled']) == (601, 1)
+
+
+def test_model_limits_override_defaults():
+    limiter = RateLimiter(requests_per_minute=50, model_limits={'sonar-pro': (5, 100)})
+    requests, tokens = limiter._get_buckets('sonar-pro')
+    assert (requests.capacity, tokens.capacity) == (5, 100)
+
+
+def test_block_delays_next_acquire():
+    limiter = RateLimiter()
+
+    async def run():
+        limiter.block('sonar', 0.1)
+        started = time.monotonic()
+        await limiter.acquire('sonar')
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.09
+    assert limiter.get_stats()['retry_after'] == 1
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('3') == 3.0
+    assert parse_retry_after(None, default=2.0) == 2.0
+    assert parse_retry_after('не дата', default=5.0) == 5.0
+    future = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 <= parse_retry_after(future) <= 30
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 1
+    assert estimate_tokens('а' * 300) == 101
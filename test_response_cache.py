@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from perplexity_analyzer import PerplexityAPI
+from response_cache import ResponseCache
+
+RESPONSE = {'choices': [{'message': {'content': 'СПОРТ: Футбол'}}]}
+
+
+def test_key_ignores_whitespace_and_case():
+    cache = ResponseCache()
+    cache.set('prediction', 'sonar-pro', 'Прогноз  на\nФУТБОЛ', RESPONSE)
+
+    assert cache.get('sonar-pro', 'прогноз на футбол') == RESPONSE
+    assert cache.get('sonar', 'прогноз на футбол') is None
+    assert cache.get_stats()['hit_rate'] == 0.5
+
+
+def test_ttl_by_kind():
+    cache = ResponseCache(ttls={'matches': -1})
+    cache.set('matches', 'sonar-pro', 'матчи', RESPONSE)
+    cache.set('prediction', 'sonar-pro', 'прогноз', RESPONSE)
+
+    assert cache.get('sonar-pro', 'матчи') is None
+    assert cache.get('sonar-pro', 'прогноз') == RESPONSE
+    assert cache.get_stats()['expired'] == 1
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    cache.set('prediction', 'sonar-pro', 'a', RESPONSE)
+    cache.set('prediction', 'sonar-pro', 'b', RESPONSE)
+    cache.get('sonar-pro', 'a')
+    cache.set('prediction', 'sonar-pro', 'c', RESPONSE)
+
+    assert cache.get('sonar-pro', 'b') is None
+    assert cache.get('sonar-pro', 'a') == RESPONSE
+    assert cache.get_stats()['evictions'] == 1
+
+
+def test_persists_between_instances(tmp_path):
+    path = str(tmp_path / 'cache.json.gz')
+    ResponseCache(path).set('prediction', 'sonar-pro', 'прогноз', RESPONSE)
+
+    cache = ResponseCache(path)
+    assert cache.get('sonar-pro', 'прогноз') == RESPONSE
+    cache.invalidate('sonar-pro', 'прогноз')
+    assert ResponseCache(path).get('sonar-pro', 'прогноз') is None
+
+
+def test_early_stopped_stream_is_not_served_to_full_requests(monkeypatch):
+    api = PerplexityAPI('test-key')
+    api.cache = ResponseCache()
+    posts = []
+
+    async def hedged_post(payload, model, estimated_tokens, stop_fields=None):
+        posts.append(stop_fields)
+        content = 'СПОРТ: Футбол' if stop_fields else 'СПОРТ: Футбол\nАНАЛИЗ: полный ответ'
+        return 200, {'choices': [{'message': {'content': content}}],
+                     '_stream': {'stopped_early': bool(stop_fields)}}, None
+
+    monkeypatch.setattr(api, '_hedged_post', hedged_post)
+
+    async def run():
+        deadline = time.monotonic() + 10
+        truncated = await api.search_sports_data('прогноз', cache_kind='prediction', deadline=deadline,
+                                                 stream=True, stop_fields=['СПОРТ'])
+        full = await api.search_sports_data('прогноз', cache_kind='prediction', deadline=deadline)
+        again = await api.search_sports_data('прогноз', cache_kind='prediction', deadline=deadline,
+                                             stream=True, stop_fields=['СПОРТ'])
+        return truncated, full, again
+
+    truncated, full, again = asyncio.run(run())
+
+    assert posts == [['СПОРТ'], None]
+    assert 'АНАЛИЗ' in full['choices'][0]['message']['content']
+    assert again['_meta']['cache_hit']
+    assert again['choices'] == truncated['choices']
@@ -0,0 +1,111 @@
+import pytest
+
+from response_parser import (LineStreamParser, PredictionStreamParser, ThinkStripper, parse_matches,
+                             parse_prediction)
+from sports_bot import SportsPrediction
+
+RESPONSE = """<think>Нужно посмотреть форму команд. СПОРТ: не то</think>
+СПОРТ: Футбол
+**ЛИГА:** Ла Лига
+МАТЧ: Реал Мадрид - Барселона
+ВРЕМЯ: 21:00
+ПРОГНОЗ: П1
+КОЭФФИЦИЕНТ: 2.10
+УВЕРЕННОСТЬ: 82%
+АНАЛИЗ: Реал выиграл пять матчей подряд.
+Барселона без двух защитников.
+ФАКТОРЫ: Форма, Травмы, Домашнее поле
+"""
+
+
+def _feed_by(text, size):
+    parser = PredictionStreamParser()
+    for start in range(0, len(text), size):
+        parser.feed(text[start:start + size])
+    parser.close()
+    return parser.result()
+
+
+def test_full_response():
+    data = parse_prediction(RESPONSE)
+
+    assert data['league'] == 'Ла Лига'
+    assert data['confidence'] == 82
+    assert data['analysis'] == 'Реал выиграл пять матчей подряд. Барселона без двух защитников.'
+    assert data['key_factors'] == ['Форма', 'Травмы', 'Домашнее поле']
+    assert isinstance(SportsPrediction.from_dict(data), SportsPrediction)
+
+
+@pytest.mark.parametrize('size', [1, 3, 7, 64])
+def test_chunked_stream_matches_whole_text(size):
+    # Теги <think> и ключи режутся между фрагментами
+    assert _feed_by(RESPONSE, size) == parse_prediction(RESPONSE)
+
+
+def test_think_split_across_chunks():
+    stripper = ThinkStripper()
+    text = stripper.feed("до <th") + stripper.feed("ink>скрыто</thi") + stripper.feed("nk> после")
+    assert text + stripper.close() == "до  после"
+
+
+def test_stray_close_tag_restarts_parse():
+    data = parse_prediction("СПОРТ: Теннис\nрассуждение</think>\n" + RESPONSE.split('</think>')[1])
+    assert data['sport'] == 'Футбол'
+
+
+def test_non_numeric_confidence_is_parse_failure():
+    assert parse_prediction(RESPONSE.replace('82%', 'высокая')) is None
+
+
+def test_missing_optional_fields_get_defaults():
+    text = "\n".join(line for line in RESPONSE.splitlines()
+                     if not line.startswith(('КОЭФФИЦИЕНТ', 'УВЕРЕННОСТЬ', 'ФАКТОРЫ')))
+    data = parse_prediction(text)
+
+    assert data['odds'] == ''
+    assert data['confidence'] == 75
+    assert data['key_factors'] == []
+    assert isinstance(SportsPrediction.from_dict(data), SportsPrediction)
+
+
+def test_partial_stream_is_not_a_prediction():
+    # Поток оборвался до АНАЛИЗА
+    cut = RESPONSE[:RESPONSE.index('АНАЛИЗ')]
+    parser = PredictionStreamParser()
+    parser.feed(cut)
+    parser.close()
+
+    assert not parser.is_complete()
+    assert parser.result() is None
+
+
+def test_stream_reports_fields_as_they_complete():
+    parser = PredictionStreamParser(required_fields=['СПОРТ', 'ЛИГА'])
+    completed = parser.feed("СПОРТ: Футбол\nЛИГА: АПЛ\nМАТЧ: ")
+
+    assert [key for key, _ in completed] == ['СПОРТ', 'ЛИГА']
+    assert parser.is_complete()
+
+
+def test_line_stream_parser_is_abstract():
+    with pytest.raises(TypeError):
+        LineStreamParser()
+
+
+def test_parse_matches():
+    text = ("ЛИГА: АПЛ\n"
+            "1. Арсенал - Челси 19:30\n"
+            "2. **Ливерпуль vs Эвертон** (Кубок Англии)\n"
+            "Начало: 21.45\n"
+            "Статистика: 3 - 1 в прошлом матче\n")
+    matches = parse_matches(text, 'football')
+
+    assert [(m['home_team'], m['away_team'], m['time'], m['league']) for m in matches] == [
+        ('Арсенал', 'Челси', '19:30', 'АПЛ'),
+        ('Ливерпуль', 'Эвертон', '21:45', 'Кубок Англии'),
+    ]
+
+
+def test_parse_matches_limit():
+    text = "\n".join(f"Команда {i} - Соперник {i} 1{i}:00" for i in range(8))
+    assert len(parse_matches(text, 'football', limit=3)) == 3
@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import pytest
+
+import perplexity_analyzer
+from circuit_breaker import CircuitBreaker
+from perplexity_analyzer import PerplexityAPI, RetryPolicy
+
+OK_BODY = {'choices': [{'message': {'content': 'ответ'}}]}
+
+
+class FakeResponse:
+    def __init__(self, status, body=None, headers=None, delay=0.0):
+        self.status = status
+        self.body = body if body is not None else {}
+        self.headers = headers or {}
+        self.delay = delay
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def json(self):
+        return dict(self.body)
+
+    async def text(self):
+        return str(self.body)
+
+
+class FakeSession:
+    """Отдает заготовленные ответы по порядку вместо aiohttp.ClientSession"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = 0
+        self.closed = False
+
+    def post(self, url, json=None):
+        self.requests += 1
+        return self.responses.pop(0)
+
+
+def _api(responses, **policy):
+    api = PerplexityAPI('test-key', retry_policy=RetryPolicy(**dict({'base_delay': 0.001}, **policy)),
+                        circuit_breaker=CircuitBreaker(min_requests=10))
+    api.session = FakeSession(responses)
+    return api
+
+
+def _search(api, budget=10.0):
+    return asyncio.run(api.search_sports_data('прогноз', deadline=time.monotonic() + budget))
+
+
+def test_backoff_is_full_jitter_within_cap(monkeypatch):
+    policy = RetryPolicy(base_delay=0.5, max_delay=8.0)
+    for attempt in range(1, 10):
+        assert 0 <= policy.backoff(attempt) <= min(8.0, 0.5 * 2 ** (attempt - 1))
+
+    monkeypatch.setattr(perplexity_analyzer.random, 'uniform', lambda low, high: high)
+    assert [policy.backoff(attempt) for attempt in (1, 2, 3, 10)] == [0.5, 1.0, 2.0, 8.0]
+
+
+def test_retries_server_errors_until_success():
+    api = _api([FakeResponse(503), FakeResponse(502), FakeResponse(200, OK_BODY)])
+
+    result = _search(api)
+
+    assert result['choices'] == OK_BODY['choices']
+    assert result['_meta']['attempts'] == 3
+    assert len(result['_meta']['attempt_latencies']) == 3
+
+
+def test_client_error_is_not_retried():
+    api = _api([FakeResponse(400, {'error': 'bad request'}), FakeResponse(200, OK_BODY)])
+
+    assert _search(api) is None
+    assert api.session.requests == 1
+
+
+def test_retry_after_is_honoured_on_429():
+    api = _api([FakeResponse(429, headers={'Retry-After': '0.2'}), FakeResponse(200, OK_BODY)])
+
+    started = time.monotonic()
+    result = _search(api)
+
+    assert result['_meta']['attempts'] == 2
+    assert time.monotonic() - started >= 0.2
+    assert api.rate_limiter.get_stats()['retry_after'] == 1
+
+
+def test_no_retry_when_delay_exceeds_deadline():
+    api = _api([FakeResponse(429, headers={'Retry-After': '30'}), FakeResponse(200, OK_BODY)])
+
+    started = time.monotonic()
+    assert _search(api, budget=1.0) is None
+    # Повтор не уложился бы в дедлайн — без ожидания и второго запроса
+    assert api.session.requests == 1
+    assert time.monotonic() - started < 0.5
+
+
+def test_run_deadline_stops_attempts_and_abandons(monkeypatch):
+    api = _api([FakeResponse(200, OK_BODY, delay=5), FakeResponse(200, OK_BODY)])
+    abandoned = []
+    monkeypatch.setattr(api.circuit_breaker, 'record_abandoned', abandoned.append)
+
+    payload = {'model': 'sonar-pro', 'messages': [{'role': 'user', 'content': 'q'}], 'max_tokens': 10}
+    deadline = time.monotonic() + 0.1
+
+    assert asyncio.run(api._execute_attempts(payload, 'q', 'sonar-pro', None, deadline, None, [],
+                                             time.monotonic())) is None
+    assert api.session.requests == 1
+    assert len(abandoned) == 1
+    assert all(stats['state'] == 'closed' for stats in api.circuit_breaker.get_stats().values())
+
+
+@pytest.mark.parametrize('attempts', [1, 2])
+def test_gives_up_after_max_attempts(attempts):
+    api = _api([FakeResponse(500) for _ in range(3)], max_attempts=attempts)
+
+    assert _search(api) is None
+    assert api.session.requests == attempts
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from perplexity_analyzer import SingleFlight
+
+
+def _factory(calls, delay, result):
+    async def run():
+        calls.append(result)
+        await asyncio.sleep(delay)
+        return result
+    return run
+
+
+def test_identical_calls_share_one_request():
+    flight = SingleFlight()
+    calls = []
+
+    async def run():
+        return await asyncio.gather(*(flight.do('key', _factory(calls, 0.05, 'ответ')) for _ in range(3)))
+
+    assert asyncio.run(run()) == ['ответ'] * 3
+    assert calls == ['ответ']
+    assert flight.get_stats() == {'calls': 3, 'deduplicated': 2, 'deadline_exceeded': 0, 'in_flight': 0}
+
+
+def test_follower_with_longer_deadline_starts_own_request():
+    flight = SingleFlight()
+    calls = []
+
+    async def run():
+        now = time.monotonic()
+        short = asyncio.ensure_future(flight.do('key', _factory(calls, 0.05, 'короткий'), deadline=now + 0.5))
+        await asyncio.sleep(0)
+        long = asyncio.ensure_future(flight.do('key', _factory(calls, 0.05, 'длинный'), deadline=now + 5))
+        return await short, await long
+
+    # Бюджета ведущего вызова последующему не хватило бы — запрос свой
+    assert asyncio.run(run()) == ('короткий', 'длинный')
+    assert calls == ['короткий', 'длинный']
+
+
+def test_follower_stops_waiting_at_own_deadline():
+    flight = SingleFlight()
+    calls = []
+
+    async def run():
+        now = time.monotonic()
+        leader = asyncio.ensure_future(flight.do('key', _factory(calls, 0.3, 'ответ'), deadline=now + 5))
+        await asyncio.sleep(0)
+        follower = await flight.do('key', _factory(calls, 0.3, 'лишний'), deadline=now + 0.05)
+        return follower, await leader
+
+    # Последующий вызов ушел по своему дедлайну, а общий запрос дошел до ведущего
+    assert asyncio.run(run()) == (None, 'ответ')
+    assert calls == ['ответ']
+    assert flight.get_stats()['deadline_exceeded'] == 1
+
+
+def test_request_cancelled_when_last_waiter_gives_up():
+    flight = SingleFlight()
+    calls = []
+
+    async def run():
+        result = await flight.do('key', _factory(calls, 5, 'ответ'), deadline=time.monotonic() + 0.05)
+        await asyncio.sleep(0.01)
+        return result, flight.get_stats()['in_flight']
+
+    assert asyncio.run(run()) == (None, 0)
@@ -0,0 +1,48 @@
+import pytest
+
+from text_escape import compile_template, escape_cached, format_message, get_markup
+
+
+def test_markdown_keeps_bot_markup_and_escapes_fields():
+    message = format_message("**ПРОГНОЗ:** `{prediction}` — _{analysis!once}_ {league}",
+                             prediction="Тотал `2.5`", analysis="форма_команды *лучше* [ссылка]",
+                             league="Серия_A")
+
+    # Внутри курсива обратная косая черта видна как есть: заменяется только закрывающий «_»
+    assert message == "**ПРОГНОЗ:** `Тотал '2.5'` — _форма команды *лучше* [ссылка]_ Серия\\_A"
+
+
+def test_markdown_v2_escapes_static_text_and_fields():
+    message = format_message("*Коэффициент:* {odds} (П1)!", 'MarkdownV2', odds="2.10")
+
+    assert message == "*Коэффициент:* 2\\.10 \\(П1\\)\\!"
+
+
+def test_html_uses_tags():
+    message = format_message("**{match}** `{code}`", 'HTML', match="Реал <Мадрид> & Ко", code="a<b")
+
+    assert message == "<b>Реал &lt;Мадрид&gt; &amp; Ко</b> <code>a&lt;b</code>"
+
+
+def test_raw_field_is_inserted_as_is():
+    assert format_message("{emoji!raw} {name}", 'MarkdownV2', emoji="⚽*", name="a.b") == "⚽* a\\.b"
+
+
+def test_nested_marker_of_other_style_is_text():
+    assert format_message("_курсив * звездочка_", 'HTML') == "<i>курсив * звездочка</i>"
+
+
+def test_template_compiled_once():
+    assert compile_template("**{a}**", 'HTML') is compile_template("**{a}**", 'HTML')
+
+
+def test_escape_cached():
+    assert escape_cached("1+1=2", 'MarkdownV2') == "1\\+1\\=2"
+    assert escape_cached("plain text", 'MarkdownV2') == "plain text"
+    assert escape_cached("a`b\\", 'MarkdownV2', marker='`') == "a\\`b\\\\"
+    assert escape_cached("a_b*c", 'Markdown', marker='**') == "a_bc"
+
+
+def test_unknown_parse_mode():
+    with pytest.raises(ValueError):
+        get_markup('BBCode')
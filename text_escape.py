@@ -0,0 +1,193 @@
+import re
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Символы, которые MarkdownV2 требует экранировать в обычном тексте
+MARKDOWN_V2_SPECIAL = "_*[]()~`>#+-=|{}.!\\"
+# В устаревшем Markdown экранируются только символы разметки
+MARKDOWN_SPECIAL = "_*`["
+
+PARSE_MODES = ('Markdown', 'MarkdownV2', 'HTML')
+
+
+class Markup:
+    """Правила режима разметки Telegram: таблицы экранирования и теги оформления.
+
+    Таблицы (символ → замена) считаются один раз. По ним же строится регулярное
+    выражение: строка без спецсимволов возвращается как есть после одного
+    быстрого поиска, остальное экранируется за один проход. str.translate с
+    таблицей-словарем на кириллице заметно медленнее re.sub, поэтому таблица
+    применяется через подстановку.
+
+    entity_tables — правила для текста внутри открытой сущности по ее маркеру
+    разметки бота (**, *, _, `); по умолчанию внутри кода действует code_table,
+    внутри остальных сущностей — text_table.
+    """
+
+    def __init__(self, parse_mode: str, text_table: Dict[str, str], code_table: Dict[str, str],
+                 bold: Tuple[str, str], italic: Tuple[str, str], code: Tuple[str, str],
+                 entity_tables: Optional[Dict[str, Dict[str, str]]] = None):
+        self.parse_mode = parse_mode
+        self.text_table = text_table
+        self.code_table = code_table
+        self.bold = bold
+        self.italic = italic
+        self.code = code
+        self.entity_tables = dict({'**': text_table, '*': text_table, '_': text_table, '`': code_table},
+                                  **(entity_tables or {}))
+        self._text_re = self._pattern(text_table)
+        self._code_re = self._pattern(code_table)
+        self._entity_res = {marker: (self._pattern(table), table) for marker, table in self.entity_tables.items()}
+
+    @staticmethod
+    def _pattern(table: Dict[str, str]):
+        return re.compile('[' + ''.join(re.escape(char) for char in table) + ']') if table else None
+
+    @staticmethod
+    def _apply(pattern, table: Dict[str, str], text: str) -> str:
+        if pattern is None or pattern.search(text) is None:
+            return text
+        return pattern.sub(lambda match: table[match.group()], text)
+
+    def escape(self, text: str) -> str:
+        """Обычный текст"""
+        return self._apply(self._text_re, self.text_table, text)
+
+    def escape_code(self, text: str) -> str:
+        """Текст внутри `кода`: там свои правила"""
+        return self._apply(self._code_re, self.code_table, text)
+
+    def escape_in(self, text: str, marker: Optional[str]) -> str:
+        """Текст внутри сущности с маркером marker (None — вне сущностей)"""
+        if marker is None:
+            return self.escape(text)
+        pattern, table = self._entity_res[marker]
+        return self._apply(pattern, table, text)
+
+
+# Устаревший Markdown понимает обратную косую черту только вне сущностей: внутри
+# _курсива_ она видна как есть, а сущность закрывает первый же ее символ. Поэтому
+# внутри сущности заменяется только этот символ, остальное не трогается
+LEGACY_ENTITY_TABLES = {
+    '**': {'*': ''},
+    '*': {'*': ''},
+    '_': {'_': ' '},
+    '`': {'`': "'"},
+}
+
+
+MARKUPS = {
+    'Markdown': Markup(
+        'Markdown',
+        text_table={char: '\\' + char for char in MARKDOWN_SPECIAL},
+        # Внутри кода экранирование не работает — обратную кавычку заменяем
+        code_table={'`': "'"},
+        bold=('*', '*'), italic=('_', '_'), code=('`', '`'),
+        entity_tables=LEGACY_ENTITY_TABLES
+    ),
+    'MarkdownV2': Markup(
+        'MarkdownV2',
+        text_table={char: '\\' + char for char in MARKDOWN_V2_SPECIAL},
+        code_table={'`': '\\`', '\\': '\\\\'},
+        bold=('*', '*'), italic=('_', '_'), code=('`', '`')
+    ),
+    'HTML': Markup(
+        'HTML',
+        text_table={'&': '&amp;', '<': '&lt;', '>': '&gt;'},
+        code_table={'&': '&amp;', '<': '&lt;', '>': '&gt;'},
+        bold=('<b>', '</b>'), italic=('<i>', '</i>'), code=('<code>', '</code>')
+    ),
+}
+
+
+def get_markup(parse_mode: str) -> Markup:
+    if parse_mode not in MARKUPS:
+        raise ValueError(f"Неизвестный режим разметки: {parse_mode} (доступны: {', '.join(PARSE_MODES)})")
+    return MARKUPS[parse_mode]
+
+
+@lru_cache(maxsize=4096)
+def escape_cached(text: str, parse_mode: str, marker: Optional[str] = None) -> str:
+    """Экранирование с кэшем — для повторяющихся строк (пул ключевых факторов, лиги);
+    marker — маркер открытой сущности, внутри которой стоит текст"""
+    return get_markup(parse_mode).escape_in(text, marker)
+
+
+# Шаблоны пишутся в разметке бота: **жирный**, *жирный*, _курсив_, `код`, {поле}
+TEMPLATE_TOKEN_RE = re.compile(r'(\*\*|\*|_|`|\{\w+(?:!raw|!once)?\})')
+
+
+class CompiledTemplate:
+    """Шаблон, переведенный в режим разметки: статические куски и поля между ними.
+
+    statics на один длиннее fields: сообщение — statics[0], поле 1, statics[1], ...
+    У каждого поля заранее выбрана функция экранирования.
+    """
+
+    __slots__ = ('statics', 'fields')
+
+    def __init__(self, statics: Tuple[str, ...], fields: Tuple[Tuple[str, Callable[[str], str]], ...]):
+        self.statics = statics
+        self.fields = fields
+
+    def render(self, values: Dict) -> str:
+        """Подставляет значения одним join"""
+        statics = self.statics
+        parts = [statics[0]]
+        for (name, escape), static in zip(self.fields, statics[1:]):
+            parts.append(escape(str(values[name])))
+            parts.append(static)
+        return "".join(parts)
+
+
+def _field_escaper(markup: Markup, how: str, marker: Optional[str]) -> Callable[[str], str]:
+    if how == 'raw':
+        return str
+    if how == 'once':
+        return markup.escape if marker is None else lambda value: markup.escape_in(value, marker)
+    parse_mode = markup.parse_mode
+    return lambda value: escape_cached(value, parse_mode, marker)
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str, parse_mode: str) -> CompiledTemplate:
+    """Переводит шаблон в выбранный режим разметки один раз.
+
+    Статический текст экранируется при компиляции, маркеры превращаются в теги
+    режима; в устаревшем Markdown маркеры остаются как есть. Текст и поля
+    экранируются по месту: вне сущностей — обратной косой чертой, внутри
+    сущности — по правилам режима для нее (см. LEGACY_ENTITY_TABLES).
+    Поле {name} экранируется при рендере с кэшем (лиги,
+    даты, рейтинги повторяются), {name!once} — без кэша (уникальный длинный
+    текст вроде анализа), {name!raw} — вставляется как есть (эмодзи, уже
+    экранированные фрагменты).
+    """
+    markup = get_markup(parse_mode)
+    styles = {'**': markup.bold, '*': markup.bold, '_': markup.italic, '`': markup.code}
+    statics: List[str] = [""]
+    fields = []
+    open_marker = None
+
+    for token in TEMPLATE_TOKEN_RE.split(template):
+        if not token:
+            continue
+        if token in styles:
+            opening = open_marker is None
+            if not opening and token != open_marker:
+                # Маркер другого стиля внутри открытого — обычный текст
+                statics[-1] += markup.escape_in(token, open_marker)
+                continue
+            statics[-1] += token if parse_mode == 'Markdown' else styles[token][0 if opening else 1]
+            open_marker = token if opening else None
+        elif token.startswith('{') and token.endswith('}'):
+            name, _, how = token[1:-1].partition('!')
+            fields.append((name, _field_escaper(markup, how, open_marker)))
+            statics.append("")
+        else:
+            statics[-1] += markup.escape_in(token, open_marker)
+    return CompiledTemplate(tuple(statics), tuple(fields))
+
+
+def format_message(template: str, parse_mode: str = 'Markdown', **values) -> str:
+    """Шаблон в разметке бота → сообщение в режиме parse_mode с экранированными полями"""
+    return compile_template(template, parse_mode).render(values)
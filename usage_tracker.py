@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# Идентификатор текущего запуска; задачи, созданные внутри запуска, наследуют его
+_current_run: ContextVar[Optional[str]] = ContextVar('perplexity_usage_run', default=None)
+
+
+def _empty_bucket() -> Dict:
+    return {
+        'calls': 0, 'ok': 0, 'failed': 0, 'cache_hits': 0, 'retries': 0,
+        'prompt_tokens': 0, 'completion_tokens': 0, 'estimated_calls': 0,
+        'latency_total': 0.0, 'latency_max': 0.0
+    }
+
+
+def _add(bucket: Dict, call: Dict):
+    bucket['calls'] += 1
+    bucket['ok' if call['ok'] else 'failed'] += 1
+    bucket['cache_hits'] += int(call['cache_hit'])
+    bucket['retries'] += max(0, call['attempts'] - 1)
+    bucket['prompt_tokens'] += call['prompt_tokens']
+    bucket['completion_tokens'] += call['completion_tokens']
+    bucket['estimated_calls'] += int(call['tokens_estimated'])
+    bucket['latency_total'] += call['latency']
+    bucket['latency_max'] = max(bucket['latency_max'], call['latency'])
+
+
+def _summary(bucket: Dict) -> Dict:
+    # Среднюю задержку считаем только по реальным запросам: попадания в кэш ее занижают
+    requests = bucket['calls'] - bucket['cache_hits']
+    return dict(
+        bucket,
+        total_tokens=bucket['prompt_tokens'] + bucket['completion_tokens'],
+        latency_total=round(bucket['latency_total'], 3),
+        latency_max=round(bucket['latency_max'], 3),
+        avg_latency=round(bucket['latency_total'] / requests, 3) if requests > 0 else 0.0
+    )
+
+
+def _grouped() -> Dict:
+    return {'total': _empty_bucket(), 'models': {}, 'kinds': {}}
+
+
+def _add_grouped(group: Dict, call: Dict):
+    _add(group['total'], call)
+    _add(group['models'].setdefault(call['model'], _empty_bucket()), call)
+    _add(group['kinds'].setdefault(call['kind'], _empty_bucket()), call)
+
+
+def _summary_grouped(group: Dict) -> Dict:
+    return {
+        'total': _summary(group['total']),
+        'models': {name: _summary(b) for name, b in group['models'].items()},
+        'kinds': {name: _summary(b) for name, b in group['kinds'].items()}
+    }
+
+
+def current_run_id() -> Optional[str]:
+    """Идентификатор запуска, внутри которого выполняется текущая задача"""
+    return _current_run.get()
+
+
+class UsageTracker:
+    """Учет токенов и задержек запросов к Perplexity.
+
+    Каждый вызов (включая попадания в кэш и неудачи) складывается в агрегаты
+    по моделям и типам запросов — за день по Москве и за запуск. Запуск задается
+    контекстом run(): все запросы внутри него, в том числе из дочерних задач,
+    попадают в его сводку. Дневные агрегаты и последние запуски сохраняются на диск.
+    """
+
+    def __init__(self, path: Optional[str] = None, keep_days: int = 30, keep_runs: int = 50):
+        self.path = path
+        self.keep_days = keep_days
+        self.keep_runs = keep_runs
+        self.moscow_tz = pytz.timezone('Europe/Moscow')
+        self.days: Dict[str, Dict] = {}
+        self.runs: List[Dict] = []
+        self._active_runs: Dict[str, Dict] = {}
+        self._load()
+
+    @classmethod
+    def from_env(cls) -> "UsageTracker":
+        """Создает учет из PERPLEXITY_USAGE_PATH (пустое значение — только в памяти)"""
+        return cls(path=os.getenv('PERPLEXITY_USAGE_PATH', '.cache/perplexity_usage.json') or None)
+
+    @contextmanager
+    def run(self, label: str):
+        """Контекст одного запуска генерации прогнозов"""
+        run_id = uuid.uuid4().hex[:8]
+        self._active_runs[run_id] = dict(
+            _grouped(),
+            id=run_id,
+            label=label,
+            started_at=datetime.now(self.moscow_tz).isoformat(),
+            _started=time.monotonic()
+        )
+        token = _current_run.set(run_id)
+        try:
+            yield run_id
+        finally:
+            _current_run.reset(token)
+            self._finish_run(run_id)
+
+    def _finish_run(self, run_id: str):
+        run = self._active_runs.pop(run_id, None)
+        if run is None:
+            return
+        run['duration'] = round(time.monotonic() - run.pop('_started'), 3)
+        run['finished_at'] = datetime.now(self.moscow_tz).isoformat()
+        self.runs.append(run)
+        del self.runs[:-self.keep_runs]
+        total = run['total']
+        logger.info(f"🧾 Запуск {run['label']} ({run_id}): {total['calls']} запросов, "
+                    f"{total['prompt_tokens'] + total['completion_tokens']} токенов, {run['duration']:.1f} с")
+        self._save()
+
+    def record(self, model: str, kind: Optional[str], latency: float, attempts: int,
+               cache_hit: bool, ok: bool, usage: Optional[Dict] = None,
+               estimated_prompt_tokens: int = 0, estimated_completion_tokens: int = 0):
+        """Учитывает один вызов search_sports_data.
+
+        Если блок usage не пришел (обрыв потока, ошибка), используются оценки токенов.
+        """
+        usage = usage or {}
+        has_usage = bool(usage.get('prompt_tokens') or usage.get('completion_tokens'))
+        call = {
+            'model': model,
+            'kind': kind or 'uncached',
+            'latency': latency,
+            'attempts': attempts,
+            'cache_hit': cache_hit,
+            'ok': ok,
+            'prompt_tokens': int(usage.get('prompt_tokens', 0)) if has_usage else (0 if cache_hit else estimated_prompt_tokens),
+            'completion_tokens': int(usage.get('completion_tokens', 0)) if has_usage else (0 if cache_hit else estimated_completion_tokens),
+            'tokens_estimated': not has_usage and not cache_hit and attempts > 0
+        }
+
+        day = datetime.now(self.moscow_tz).strftime("%Y-%m-%d")
+        _add_grouped(self.days.setdefault(day, _grouped()), call)
+        for day_key in sorted(self.days)[:-self.keep_days]:
+            del self.days[day_key]
+
+        run_id = _current_run.get()
+        if run_id in self._active_runs:
+            _add_grouped(self._active_runs[run_id], call)
+        else:
+            # Вне запуска (ручные вызовы) пишем на диск сразу, иначе — по завершении запуска
+            self._save()
+
+    def get_stats(self, days: int = 7, runs: int = 10) -> Dict:
+        """Сводка для /usage: сегодня, последние дни, последние и текущие запуски"""
+        today = datetime.now(self.moscow_tz).strftime("%Y-%m-%d")
+        return {
+            'today': _summary_grouped(self.days.get(today, _grouped())),
+            'days': {day: _summary_grouped(self.days[day]) for day in sorted(self.days)[-days:]},
+            'runs': [self._run_summary(run) for run in self.runs[-runs:]],
+            'active_runs': [self._run_summary(run) for run in self._active_runs.values()]
+        }
+
+    def _run_summary(self, run: Dict) -> Dict:
+        info = {key: run[key] for key in ('id', 'label', 'started_at')}
+        info.update({key: run[key] for key in ('finished_at', 'duration') if key in run})
+        info.update(_summary_grouped(run))
+        return info
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            self.days = stored.get('days', {})
+            self.runs = stored.get('runs', [])
+            logger.info(f"🧾 Учет Perplexity загружен: {len(self.days)} дней, {len(self.runs)} запусков")
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось загрузить учет Perplexity: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'days': self.days, 'runs': self.runs}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить учет Perplexity: {e}")